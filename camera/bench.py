@@ -0,0 +1,771 @@
+"""Micro-benchmarks for the camera's hot paths. Run on the Pi itself — the
+numbers only mean something on Pi Zero 2 W hardware:
+
+    python3 bench.py                # list benchmarks
+    python3 bench.py transport [requests_per_cycle] [cycles]
+    python3 bench.py capture [backend,backend] [frames] [use_tuning_file 1/0]
+    python3 bench.py overlay [photo.jpg] [runs]
+    python3 bench.py detection photo.jpg[,photo.jpg...] [modes] [scales]
+    python3 bench.py scene_gate "corpus/*.jpg" [seconds_between_frames]
+    python3 bench.py postprocess [photo.jpg] [runs] [mode]
+    python3 bench.py inference ["reference/*.jpg"]
+    python3 bench.py model_load [runs] [photo.jpg]
+    python3 bench.py startup [budget_ms] [runs]      # exits 1 over budget
+    python3 bench.py wittypi [wittypi_path] [runs]   # stand-in wittyPi.sh without a path
+    python3 bench.py upload [photo.jpg] [drops_per_mb] [kbytes_per_second] [runs]
+
+Each benchmark prints its own summary; nothing is written to the state dir.
+"""
+
+import http.server
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__[len("bench_"):]] = fn
+    return fn
+
+
+# ---- Local HTTPS stand-in ----------------------------------------------------
+
+
+class _OkHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like blynk.cloud
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        body = b"1"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def https_standin(handler_cls=_OkHandler):
+    """Start a local HTTPS server with a throwaway self-signed certificate.
+    Returns (base_url, cafile, server); call server.shutdown() when done.
+    Needs the `openssl` CLI (present on Raspberry Pi OS / DietPi)."""
+    tmpdir = tempfile.mkdtemp(prefix="bench_tls_")
+    cert = os.path.join(tmpdir, "cert.pem")
+    key = os.path.join(tmpdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost"],
+        check=True, capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = http.server.ThreadingHTTPServer(("localhost", 0), handler_cls)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"https://localhost:{server.server_address[1]}", cert, server
+
+
+def _summary(label, samples):
+    print(f"{label:<28} mean {statistics.mean(samples) * 1000:8.1f} ms   "
+          f"median {statistics.median(samples) * 1000:8.1f} ms")
+
+
+# ---- Benchmarks --------------------------------------------------------------
+
+
+@benchmark
+def bench_transport(requests_per_cycle="8", cycles="5"):
+    """HTTPS handshake time saved per cycle by transport's shared session.
+
+    Compares one fresh connection per request (the old bare requests.get)
+    against the keep-alive session, on a local HTTPS stand-in server."""
+    import requests
+    import transport
+
+    per_cycle, cycles = int(requests_per_cycle), int(cycles)
+    base_url, cafile, server = https_standin()
+    try:
+        cold, warm = [], []
+        for _ in range(cycles):
+            start = time.perf_counter()
+            for i in range(per_cycle):
+                requests.get(f"{base_url}/get?pin=v{i}", verify=cafile, timeout=10)
+            cold.append(time.perf_counter() - start)
+
+            transport._session = None  # new process == new session
+            start = time.perf_counter()
+            for i in range(per_cycle):
+                transport.get(f"{base_url}/get?pin=v{i}", verify=cafile, timeout=10)
+            warm.append(time.perf_counter() - start)
+    finally:
+        server.shutdown()
+
+    print(f"{per_cycle} HTTPS requests per cycle, {cycles} cycles")
+    _summary("per cycle, new connections", cold)
+    _summary("per cycle, shared session", warm)
+    saved = statistics.mean(cold) - statistics.mean(warm)
+    print(f"handshake time saved per cycle: {saved * 1000:.1f} ms")
+
+
+@benchmark
+def bench_capture(backends="oneshot,rpicam_keypress", frames="5", use_tuning_file="1"):
+    """Time-to-frame of camera backends (first frame and steady state).
+
+    The first frame includes sensor start-up; the steady-state figure is what
+    burst mode pays per frame. Use backends="fake" off the Pi."""
+    from camera import get_capture_backend
+
+    frames = int(frames)
+    for name in backends.split(","):
+        backend = get_capture_backend(name, use_tuning_file == "1")
+        samples = []
+        failed = None
+        try:
+            for i in range(frames):
+                path = f"/tmp/bench_capture_{i}.jpg"
+                start = time.perf_counter()
+                ok, error = backend.capture(path)
+                elapsed = time.perf_counter() - start
+                if not ok:
+                    # A failure's time says nothing about time-to-frame.
+                    failed = (i + 1, error)
+                    break
+                samples.append(elapsed)
+                os.remove(path)
+        finally:
+            backend.close()
+        print(f"{name} ({type(backend).__name__})")
+        if failed is not None:
+            print(f"  capture {failed[0]} of {frames} failed: {failed[1]}")
+        if not samples:
+            continue
+        _summary("  first frame", samples[:1])
+        if len(samples) > 1:
+            _summary("  subsequent frames", samples[1:])
+
+
+@benchmark
+def bench_overlay(photo=os.path.join(os.path.dirname(os.path.abspath(__file__)), "img", "img.jpg"), runs="5"):
+    """Label stamping: JPEG-domain MCU re-encode vs PIL decode/draw/encode.
+
+    Also reports how far each result drifts from the original outside the
+    label. The JPEG-domain path only differs along the label's edge, where
+    the decoder's chroma upsampling blends across it."""
+    import io
+    import numpy as np
+    from PIL import Image
+    import jpeg_overlay
+    from camera import LABEL_PADDING, render_label
+    from frame import JPEG_QUALITY
+
+    with open(photo, "rb") as f:
+        jpeg = f.read()
+    runs = int(runs)
+    position = (LABEL_PADDING, LABEL_PADDING)
+    texts = [f"Kamera 1 | 18.10.2026 12:00:{i:02d} | 12.3 °C" for i in range(runs)]
+
+    pil, stamped = [], []
+    for text in texts:
+        start = time.perf_counter()
+        img = Image.open(io.BytesIO(jpeg))
+        img.paste(render_label(text), position)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=JPEG_QUALITY)
+        pil.append(time.perf_counter() - start)
+        pil_jpeg = out.getvalue()
+
+        start = time.perf_counter()
+        stamped_jpeg, canvas, origin = jpeg_overlay.stamp(jpeg, render_label(text), position)
+        stamped.append(time.perf_counter() - start)
+
+    print(f"{photo}: {len(jpeg) / 1e6:.2f} MB, {runs} runs")
+    _summary("PIL decode/draw/encode", pil)
+    _summary("JPEG-domain stamp", stamped)
+
+    original = np.asarray(Image.open(io.BytesIO(jpeg)).convert("RGB"), dtype=np.int16)
+    outside = np.ones(original.shape[:2], dtype=bool)
+    x, y = origin
+    # One pixel of margin: chroma upsampling reaches across the label edge.
+    outside[max(y - 1, 0):y + canvas.height + 1, max(x - 1, 0):x + canvas.width + 1] = False
+    for label, result in (("PIL", pil_jpeg), ("JPEG-domain", stamped_jpeg)):
+        pixels = np.asarray(Image.open(io.BytesIO(result)).convert("RGB"), dtype=np.int16)
+        diff = np.abs(pixels - original)[outside]
+        print(f"{label:<28} {len(result) / 1e6:.2f} MB, outside the label: "
+              f"max diff {diff.max()}, mean {diff.mean():.3f}")
+
+
+@benchmark
+def bench_detection(photos, modes="single,tiled", scales="1,0.5,0.33"):
+    """Person detection: inference time and small-person recall per mode.
+
+    `photos` are frames known to contain a person (DETECTED_* shots from the
+    gallery). For the recall figure each one is also shrunk by every factor
+    in `scales` and pasted at the bottom of a grey frame of the original
+    size, so people get proportionally smaller and distant. A photo counts
+    as found when a candidate clears the confidence threshold inside the
+    zone of interest. The size/aspect filters are ignored, since the point
+    is what the network can still see."""
+    import glob
+    import cv2
+    import human_detection
+
+    paths = [p for pattern in photos.split(",") for p in sorted(glob.glob(pattern))]
+    modes = modes.split(",")
+    scales = [float(s) for s in scales.split(",")]
+    if not paths:
+        print(f"No photos match {photos!r}")
+        return
+    human_detection._get_detector()  # load outside the timed region
+
+    timings = {mode: [] for mode in modes}
+    found = {(mode, scale): 0 for mode in modes for scale in scales}
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Can't read {path}, skipping")
+            continue
+        image_h, image_w = image.shape[:2]
+        for scale in scales:
+            if scale == 1:
+                frame = image
+            else:
+                small = cv2.resize(image, (int(image_w * scale), int(image_h * scale)), interpolation=cv2.INTER_AREA)
+                frame = image.copy()
+                frame[:] = 114
+                x = (image_w - small.shape[1]) // 2
+                frame[image_h - small.shape[0]:, x:x + small.shape[1]] = small
+            for mode in modes:
+                start = time.perf_counter()
+                accepted, rejected = human_detection.detect_persons_in_image(frame, mode=mode)
+                timings[mode].append(time.perf_counter() - start)
+                if accepted or any(d.rejected_reason in ("too_small", "wrong_aspect") for d in rejected):
+                    found[(mode, scale)] += 1
+
+    print(f"{len(paths)} photo(s), tile {human_detection.TILE_SIZE} px, overlap {human_detection.TILE_OVERLAP} px")
+    for mode in modes:
+        _summary(f"{mode} inference", timings[mode])
+        print("  recall " + "   ".join(
+            f"x{scale:g}: {found[(mode, scale)]}/{len(paths)}" for scale in scales))
+
+
+@benchmark
+def bench_scene_gate(photos, seconds_between_frames="300"):
+    """Scene-change gate replayed over a recorded corpus: skipped YOLO passes
+    and detections the gate would have missed.
+
+    Frames are replayed in file modification order (the capture order of a
+    gallery download) through a fresh background model. The model's save is
+    skipped, so nothing is written to the state dir. Every frame also gets a
+    full-frame YOLO pass as ground truth. A miss is a frame where that pass
+    accepted a person but the gate either skipped YOLO or ran it only on
+    crops that didn't find one."""
+    import glob
+    import cv2
+    import numpy as np
+    import human_detection
+    import scene_change
+
+    paths = sorted((p for pattern in photos.split(",") for p in glob.glob(pattern)), key=os.path.getmtime)
+    if not paths:
+        print(f"No photos match {photos!r}")
+        return
+    human_detection._get_detector()
+    model = scene_change.BackgroundModel()
+    step = float(seconds_between_frames)
+    counts = {"skipped": 0, "regions": 0, "full": 0}
+    missed, with_person = [], 0
+    full_times, gated_times = [], []
+    for n, path in enumerate(paths):
+        with open(path, "rb") as f:
+            jpeg = f.read()
+        image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        start = time.perf_counter()
+        truth, _ = human_detection.detect_persons_in_image(image)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decision = model.check(jpeg, now=n * step)
+        found = []
+        if decision.run:
+            found, _ = human_detection.detect_persons_in_image(image, regions=decision.regions)
+        gated_times.append(time.perf_counter() - start)
+
+        counts["skipped" if not decision.run else ("regions" if decision.regions else "full")] += 1
+        if truth:
+            with_person += 1
+            if not found:
+                missed.append(os.path.basename(path))
+
+    print(f"{len(paths)} frames, {with_person} with a person (full-frame YOLO)")
+    print(f"gate: {counts['skipped']} skipped, {counts['regions']} crops only, {counts['full']} full frame")
+    _summary("per frame, always YOLO", full_times)
+    _summary("per frame, gated", gated_times)
+    print(f"detections missed by the gate: {len(missed)}/{with_person}")
+    for name in missed:
+        print(f"  {name}")
+
+
+def _postprocess_loop(outputs, regions, image_w, image_h):
+    """human_detection's YOLO post-processing as it was before vectorizing:
+    a Python loop per anchor row and per kept box. The baseline for
+    bench_postprocess, which also checks both give the same detections."""
+    import cv2
+    import human_detection as hd
+
+    def evaluate(box, confidence):
+        x, y, w, h = box
+        if (y + h) < image_h * hd.DETECTION_ZONE_TOP_RATIO:
+            return "above_zone"
+        if confidence < hd.PERSON_CONFIDENCE_THRESHOLD:
+            return "low_conf"
+        if h < image_h * hd.MIN_BOX_HEIGHT_RATIO:
+            return "too_small"
+        if h / max(w, 1) < hd.MIN_BOX_ASPECT_RATIO:
+            return "wrong_aspect"
+        return None
+
+    def touches(box, region, margin=2):
+        x, y, w, h = box
+        rx, ry, rw, rh = region
+        return ((rx > 0 and x <= rx + margin) or (ry > 0 and y <= ry + margin)
+                or (rx + rw < image_w and x + w >= rx + rw - margin)
+                or (ry + rh < image_h and y + h >= ry + rh - margin))
+
+    def contained(inner, outer):
+        ix = max(0, min(inner[0] + inner[2], outer[0] + outer[2]) - max(inner[0], outer[0]))
+        iy = max(0, min(inner[1] + inner[3], outer[1] + outer[3]) - max(inner[1], outer[1]))
+        return ix * iy / max(inner[2] * inner[3], 1)
+
+    boxes, confidences, truncated = [], [], []
+    for n, region in enumerate(regions):
+        region_x, region_y, region_w, region_h = region
+        for output in outputs:
+            for detection in hd._batch_item(output, n, len(regions)):
+                person_confidence = float(detection[5])
+                if person_confidence <= 0.05:
+                    continue
+                box_norm = detection[0:4] * [region_w, region_h, region_w, region_h]
+                (cx, cy, w, h) = box_norm.astype("int")
+                box = [region_x + int(cx - w / 2), region_y + int(cy - h / 2), int(w), int(h)]
+                boxes.append(box)
+                confidences.append(person_confidence)
+                truncated.append(touches(box, region))
+
+    accepted, rejected = [], []
+    if boxes:
+        indices = cv2.dnn.NMSBoxes(boxes, confidences, score_threshold=0.05,
+                                   nms_threshold=hd.NMS_IOU_THRESHOLD)
+        if len(indices) > 0:
+            flat = indices.flatten().tolist() if hasattr(indices, "flatten") else list(indices)
+            flat = [i for i in flat if not (truncated[i] and any(
+                j != i and contained(boxes[i], boxes[j]) >= hd.TILE_CONTAINMENT for j in flat))]
+            for i in flat:
+                reason = evaluate(boxes[i], confidences[i])
+                det = hd.Detection(box=tuple(boxes[i]), confidence=confidences[i], rejected_reason=reason)
+                (accepted if reason is None else rejected).append(det)
+    return accepted, rejected
+
+
+@benchmark
+def bench_postprocess(photo=os.path.join(os.path.dirname(os.path.abspath(__file__)), "img", "img.jpg"),
+                      runs="20", mode="single"):
+    """YOLO output decoding + NMS + filters: Python loop vs vectorized NumPy.
+
+    Uses the real output tensors of one forward pass on `photo` (tiled mode
+    gives the batched shapes) and checks both versions return identical
+    Detection lists."""
+    import cv2
+    import human_detection as hd
+
+    detector = hd._get_detector()
+    if detector is None:
+        print("YOLO model not available")
+        return
+    image = cv2.imread(photo)
+    image_h, image_w = image.shape[:2]
+    regions = [(0, 0, image_w, image_h)]
+    if mode == "tiled":
+        regions += hd._tiles(image_w, image_h)
+    outputs = detector.forward(cv2.dnn.blobFromImages(
+        [image[y:y + h, x:x + w] for x, y, w, h in regions],
+        1 / 255.0, hd.INPUT_SIZE, swapRB=True, crop=False))
+
+    runs = int(runs)
+    timings = {}
+    results = {}
+    for label, fn in (("python loop", _postprocess_loop), ("vectorized", hd._postprocess)):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            results[label] = fn(outputs, regions, image_w, image_h)
+            samples.append(time.perf_counter() - start)
+        timings[label] = samples
+
+    print(f"{mode}: outputs {[o.shape for o in outputs]}, "
+          f"{len(results['vectorized'][0])} accepted / {len(results['vectorized'][1])} rejected")
+    for label, samples in timings.items():
+        _summary(label, samples)
+    print(f"speedup: {statistics.mean(timings['python loop']) / statistics.mean(timings['vectorized']):.1f}x, "
+          f"identical detections: {results['python loop'] == results['vectorized']}")
+
+
+@benchmark
+def bench_inference(photos=None):
+    """Inference backends × thread counts: load + forward time and accuracy.
+
+    The calibration `python3 inference.py` runs, but with the ONNX models
+    built in a temp dir and the choice not saved. `photos`
+    defaults to yolo/reference/*.jpg (or the sample image)."""
+    import glob
+
+    import human_detection as hd
+    import inference
+
+    paths = [p for pattern in photos.split(",") for p in sorted(glob.glob(pattern))] if photos else None
+    with tempfile.TemporaryDirectory(prefix="bench_models_") as models_dir:
+        inference.calibrate(hd._CONFIG_PATH, hd._WEIGHTS_PATH, paths, models_dir=models_dir, save=False)
+
+
+def _drop_page_cache():
+    """Make the next read come from the SD card, like after a cold boot.
+    Needs root; returns False when it couldn't."""
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+@benchmark
+def bench_model_load(runs="3", photo=os.path.join(os.path.dirname(os.path.abspath(__file__)), "img", "img.jpg")):
+    """Model load + first forward pass per model format, from a cold page cache.
+
+    Darknet cfg + weights (the original path) against the ONNX exports and
+    the prepared ORT-format models. Run as root so the page cache can be
+    dropped before every load; otherwise the numbers are warm-cache ones."""
+    import cv2
+    import human_detection as hd
+    import inference
+
+    image = cv2.imread(photo)
+    blob = cv2.dnn.blobFromImages([image], 1 / 255.0, hd.INPUT_SIZE, swapRB=True, crop=False)
+    threads = inference._thread_choices()[-1]
+
+    with tempfile.TemporaryDirectory(prefix="bench_models_") as models_dir:
+        inference.build_models(hd._CONFIG_PATH, hd._WEIGHTS_PATH, [blob], models_dir)
+
+        def darknet():
+            return inference.OpenCVBackend(hd._CONFIG_PATH, hd._WEIGHTS_PATH, threads)
+
+        def opencv_onnx():
+            net = cv2.dnn.readNetFromONNX(os.path.join(models_dir, inference.OnnxRuntimeBackend.model_file))
+            return lambda b: (net.setInput(b), net.forward(net.getUnconnectedOutLayersNames()))[1]
+
+        def onnx(backend_cls):
+            def load():
+                import onnxruntime
+                options = inference._session_options(onnxruntime, threads)
+                session = onnxruntime.InferenceSession(
+                    os.path.join(models_dir, backend_cls.model_file), options, providers=["CPUExecutionProvider"])
+                return lambda b: session.run(None, {"input": b})
+            return load
+
+        def prepared(backend_cls):
+            return lambda: backend_cls(hd._CONFIG_PATH, hd._WEIGHTS_PATH, threads, models_dir)
+
+        formats = [
+            ("darknet/opencv", darknet),
+            ("onnx/opencv", opencv_onnx),
+            ("onnx/ort", onnx(inference.OnnxRuntimeBackend)),
+            ("prepared/ort", prepared(inference.OnnxRuntimeBackend)),
+            ("int8 onnx/ort", onnx(inference.OnnxRuntimeInt8Backend)),
+            ("int8 prepared/ort", prepared(inference.OnnxRuntimeInt8Backend)),
+        ]
+        cold = True
+        for label, load in formats:
+            load_samples, first_samples = [], []
+            try:
+                for _ in range(int(runs)):
+                    cold = _drop_page_cache() and cold
+                    start = time.perf_counter()
+                    model = load()
+                    load_samples.append(time.perf_counter() - start)
+                    (model.forward if hasattr(model, "forward") else model)(blob)
+                    first_samples.append(time.perf_counter() - start)
+            except Exception as e:
+                print(f"{label:<28} unavailable ({e})")
+                continue
+            _summary(f"{label} load", load_samples)
+            _summary(f"{label} +1st pass", first_samples)
+        if not cold:
+            print("Page cache could not be dropped (not root?): warm-cache numbers.")
+
+
+def _import_time(statement):
+    """Run `statement` in a fresh interpreter with -X importtime. Returns
+    ({module: cumulative seconds}, stdout)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us) / 1e6
+    return cumulative, result.stdout.strip()
+
+
+@benchmark
+def bench_startup(budget_ms=None, runs="5"):
+    """Import time of the entry point (`import main`), checked against a budget.
+
+    Fresh interpreters, bytecode warm in __pycache__ (the first run compiles
+    it). Prints the slowest top-level imports and exits 1 when the median is
+    over `budget_ms` (default cycle.STARTUP_IMPORT_BUDGET_MS) or one of
+    cycle.HEAVY_MODULES got imported eagerly — run it after touching imports."""
+    import cycle
+
+    budget = float(budget_ms) / 1000 if budget_ms else cycle.STARTUP_IMPORT_BUDGET_MS / 1000
+    statement = "import sys, main, cycle; print(','.join(m for m in cycle.HEAVY_MODULES if m in sys.modules))"
+    _import_time(statement)  # compile into __pycache__
+    samples, heavy = [], ""
+    for _ in range(int(runs)):
+        cumulative, heavy = _import_time(statement)
+        samples.append(cumulative["main"])
+    _summary("import main", samples)
+    top = sorted(((t, name) for name, t in cumulative.items() if not name.startswith((" ", "encodings"))),
+                 reverse=True)[:8]
+    for seconds, name in top:
+        print(f"  {name:<26} {seconds * 1000:8.1f} ms")
+
+    failures = []
+    if statistics.median(samples) > budget:
+        failures.append(f"median {statistics.median(samples) * 1000:.0f} ms over the {budget * 1000:.0f} ms budget")
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {heavy}")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"OK: within the {budget * 1000:.0f} ms budget, no heavy imports.")
+
+
+def _legacy_wittypi(wittypi_path, commands):
+    """One wittyPi.sh process fed (command, sleep) pairs blind — how
+    witty_sheduler drove it before WittyPiSession; the baseline."""
+    process = subprocess.Popen(["bash", "wittyPi.sh"], cwd=wittypi_path, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    for command, delay in commands:
+        process.stdin.write(command + "\n")
+        process.stdin.flush()
+        time.sleep(delay)
+    process.communicate(timeout=30)
+
+
+@benchmark
+def bench_wittypi(wittypi_path=None, runs="3"):
+    """Per-cycle WittyPi latency: native I2C, wittyPi.sh session, old per-command processes.
+
+    A cycle reads the RTC (the "already synced today" check) and schedules +
+    verifies the next startup; a sync cycle also syncs and re-reads. The
+    native path runs on /dev/i2c-1 when it exists, else on wittypi.FakeBus
+    (software overhead only). The wittyPi.sh paths run against `wittypi_path`
+    on a real board, else against a scripted stand-in; on the board the
+    startup alarm is put back afterwards."""
+    from datetime import datetime, timedelta
+    import wittypi
+    import witty_sheduler
+
+    on_hardware = os.path.exists(f"/dev/i2c-{wittypi.I2C_BUS}")
+    driver = wittypi.WittyPi() if on_hardware else wittypi.WittyPi(wittypi.FakeBus())
+    if not on_hardware:
+        driver.write_rtc(datetime.now().astimezone())
+    previous = driver.read_startup()
+    target = previous or (datetime.now() + timedelta(days=1)).strftime("%d %H:%M:%S")
+    label = "native (i2c-1)" if on_hardware else "native (FakeBus)"
+
+    read_samples, schedule_samples = [], []
+    for _ in range(int(runs)):
+        start = time.perf_counter()
+        driver.read_rtc()
+        read_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        driver.set_startup(target)
+        if driver.read_startup() != target:
+            print(f"{label}: startup verification mismatch")
+        schedule_samples.append(time.perf_counter() - start)
+    _summary(f"{label} read times", read_samples)
+    _summary(f"{label} schedule+verify", schedule_samples)
+    _summary(f"{label} per cycle", [r + s for r, s in zip(read_samples, schedule_samples)])
+
+    real_script = bool(on_hardware and wittypi_path)
+    path = wittypi_path if real_script else witty_sheduler.fake_wittypi_dir()
+    print(f"wittyPi.sh paths against {'the board' if real_script else 'the scripted stand-in'}:")
+    script = witty_sheduler.DRIVER_SCRIPT
+    read = [("13", 0.5)]
+    legacy_steps = {
+        "cycle": [read, [("5", 1), (target, 1), ("13", 0.5)], read],
+        "sync cycle": [read, [("3", 5), ("13", 0.5)], read, [("5", 1), (target, 1), ("13", 0.5)], read],
+    }
+    results = {}
+    try:
+        for _ in range(int(runs)):
+            for kind, steps in legacy_steps.items():
+                start = time.perf_counter()
+                for commands in steps:
+                    _legacy_wittypi(path, commands)
+                results.setdefault(("per-command", kind), []).append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                witty_sheduler._read_times(path, script)
+                if kind == "sync cycle":
+                    witty_sheduler.sync_time(path, force=True, max_attempts=1, driver=script)
+                ok, error = witty_sheduler.schedule_deep_sleep(target, path, max_attempts=1, driver=script)
+                witty_sheduler.close_session()
+                results.setdefault(("session", kind), []).append(time.perf_counter() - start)
+                if not ok:
+                    print(f"session {kind}: {error}")
+    finally:
+        witty_sheduler.close_session()
+        if real_script and previous:
+            driver.set_startup(previous)
+    for (mode, kind), samples in results.items():
+        _summary(f"{mode} {kind}", samples)
+    for kind in legacy_steps:
+        saved = statistics.median(results[("per-command", kind)]) - statistics.median(results[("session", kind)])
+        print(f"session saves {saved:.1f} s per {kind}")
+
+
+class _CloudinaryStandin(http.server.BaseHTTPRequestHandler):
+    """Cloudinary's upload endpoint over a lossy link: the body is read at
+    `bytes_per_second` and the connection dropped mid-transfer with
+    `drop_probability` per PIECE_BYTES. Chunks (X-Unique-Upload-Id +
+    Content-Range) are acknowledged one by one; the last one, or a plain
+    upload, gets a secure_url."""
+    protocol_version = "HTTP/1.1"
+    PIECE_BYTES = 16 * 1024
+    bytes_per_second = 250 * 1024
+    drop_probability = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        import json
+        import random
+        import socket
+
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining:
+            piece = self.rfile.read(min(self.PIECE_BYTES, remaining))
+            remaining -= len(piece)
+            with self.lock:
+                type(self).received += len(piece)
+            time.sleep(len(piece) / self.bytes_per_second)
+            if random.random() < self.drop_probability:
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+        content_range = self.headers.get("Content-Range")
+        done = True
+        if content_range:
+            first_last, total = content_range.split()[1].split("/")
+            done = int(first_last.split("-")[1]) + 1 == int(total)
+        body = json.dumps({"secure_url": "https://res.example/image.jpg"} if done else {"done": False}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@benchmark
+def bench_upload(photo=os.path.join(os.path.dirname(os.path.abspath(__file__)), "img", "img.jpg"),
+                 drops_per_mb="0.5", kbytes_per_second="250", runs="3"):
+    """Frame upload over a dropping link: one request vs. resumable chunks.
+
+    `drops_per_mb` is the chance a megabyte doesn't make it. Each attempt
+    stands for a cycle: a failed one-request upload starts over next time,
+    a chunked one resumes from its last acknowledged chunk. Reports
+    attempts, wall time and bytes on the wire until the frame is up. A
+    frame under cloudinary.MIN_CHUNK_BYTES is a single chunk, so only
+    larger ones show a difference."""
+    import transport
+    import cloudinary
+
+    with open(photo, "rb") as f:
+        content = f.read()
+    handler = _CloudinaryStandin
+    handler.bytes_per_second = float(kbytes_per_second) * 1024
+    handler.drop_probability = 1 - (1 - float(drops_per_mb)) ** (handler.PIECE_BYTES / 2 ** 20)
+    base_url, cafile, server = https_standin(handler)
+    post = transport.post
+    transport.post = lambda url, **kwargs: post(url, verify=cafile, **kwargs)
+    state_dir = tempfile.mkdtemp(prefix="bench_upload_")
+    cloudinary.STATE_PATH = os.path.join(state_dir, "cloudinary_uploads.json")
+    cloudinary.RETRY_DELAY_SECONDS = 0
+    data = cloudinary._form("preset", 1, None, None, None)
+
+    def one_request():
+        try:
+            cloudinary._upload_single(content, "photo.jpg", data, f"{base_url}/upload")
+            return True
+        except Exception:
+            return False
+
+    def chunked():
+        return cloudinary.upload_to_cloudinary(content, f"{base_url}/upload", "preset", 1) is not None
+
+    print(f"{len(content) / 2 ** 20:.1f} MB frame, {drops_per_mb} drops/MB, {kbytes_per_second} KB/s")
+    try:
+        for label, attempt in (("one request", one_request), ("chunked", chunked)):
+            attempts, walls, wire = [], [], []
+            for _ in range(int(runs)):
+                handler.received = 0
+                start = time.perf_counter()
+                n = 0
+                while n < 20:
+                    n += 1
+                    if attempt():
+                        break
+                walls.append(time.perf_counter() - start)
+                attempts.append(n)
+                wire.append(handler.received / len(content))
+            print(f"{label:<12} attempts {statistics.mean(attempts):5.1f}   "
+                  f"wall {statistics.mean(walls):6.1f} s   sent {statistics.mean(wire):4.1f}x the frame")
+    finally:
+        transport.post = post
+        server.shutdown()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Available benchmarks:")
+        for name, fn in BENCHMARKS.items():
+            print(f"  {name:<16} {(fn.__doc__ or '').strip().splitlines()[0]}")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
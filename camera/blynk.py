@@ -1,10 +1,17 @@
-import requests
+import os
+import threading
+from dataclasses import dataclass
+
+import transport
+from utils import STATE_DIR, load_state, save_state
+
+BLYNK_GET_URL = "https://blynk.cloud/external/api/get"
 
 
 def get_sys_property(url):
     """Fetch a plain-text value from the beesys public API (drop-in for Blynk /get)."""
     try:
-        response = requests.get(url, timeout=10)
+        response = transport.get(url, timeout=10)
         response.raise_for_status()
         return response.text.strip()
     except Exception as e:
@@ -13,10 +20,9 @@ def get_sys_property(url):
 
 
 def get_blynk_property(blynk_token, blynk_pin):
-    blynk_get_url = "https://blynk.cloud/external/api/get"
-    url = f"{blynk_get_url}?token={blynk_token}&pin={blynk_pin}"
+    url = f"{BLYNK_GET_URL}?token={blynk_token}&pin={blynk_pin}"
     try:
-        response = requests.get(url, timeout=10)
+        response = transport.get(url, timeout=10)
         response.raise_for_status()
         content = response.text.strip()
         return content
@@ -24,37 +30,176 @@ def get_blynk_property(blynk_token, blynk_pin):
         print(f"Error fetching blynk property: {e}")
         return None
 
-def update_blynk_url(secure_url, blynk_auth, blynk_pin):
-    base_url = "https://blynk.cloud/external/api/update/property"
+def get_blynk_properties(blynk_token, blynk_pins):
+    """Read many pins in one request: GET /get?token=..&v1&v2 answers with a
+    JSON object {"v1": .., "v2": ..}.
+
+    Returns {pin: str or None} keyed by the pins as passed in. Pins the batch
+    didn't return (or all of them, if the batch request fails) are retried one
+    by one with get_blynk_property().
+    """
+    pins = list(dict.fromkeys(blynk_pins))
+    values = {}
+    if len(pins) > 1:
+        try:
+            url = f"{BLYNK_GET_URL}?token={blynk_token}&" + "&".join(pins)
+            response = transport.get(url, timeout=10)
+            response.raise_for_status()
+            returned = {str(k).lower(): v for k, v in response.json().items()}
+            for pin in pins:
+                value = returned.get(pin.lower())
+                if value is not None:
+                    values[pin] = str(value).strip()
+        except Exception as e:
+            print(f"Error fetching blynk properties in batch, falling back to single reads: {e}")
+    for pin in pins:
+        if pin not in values:
+            values[pin] = get_blynk_property(blynk_token, pin)
+    return values
+
+
+@dataclass
+class CycleSettings:
+    """Per-cycle settings read from Blynk. A field is None when its pin
+    couldn't be read (or held garbage) — see `complete`."""
+    last_sync_date: str = None
+    force_sync: bool = False
+    working_time: str = None
+    deep_sleep_interval: int = None
+    run_update: bool = None
+
+    @property
+    def complete(self):
+        """True when everything the cycle can't do without was retrieved."""
+        return None not in (self.working_time, self.deep_sleep_interval, self.run_update)
+
+
+def _parse_int(raw, name):
+    if raw is None:
+        return None
     try:
-        url = f"{base_url}?token={blynk_auth}&pin={blynk_pin}&urls={secure_url}"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        print(f"Blynk property updated successfully for pin {blynk_pin}.")
-    except Exception as e:
-        print(f"Error updating Blynk property: {e}")
+        return int(float(raw))
+    except (ValueError, TypeError):
+        print(f"Error: Invalid {name} value from Blynk: {raw!r}")
+        return None
+
+
+def get_cycle_settings(blynk_token, last_sync_pin, force_sync_pin, working_time_pin,
+                       deep_sleep_interval_pin, run_update_pin):
+    """Fetch every setting a wake cycle needs in one batched Blynk read."""
+    raw = get_blynk_properties(blynk_token, [
+        last_sync_pin, force_sync_pin, working_time_pin, deep_sleep_interval_pin, run_update_pin,
+    ])
+    # Missing run_update means the read failed (cycle bails out); a garbage
+    # value just means "don't update".
+    run_update = raw[run_update_pin]
+    if run_update is not None:
+        run_update = bool(_parse_int(run_update, "run_update"))
+    return CycleSettings(
+        last_sync_date=raw[last_sync_pin] or None,
+        force_sync=bool(_parse_int(raw[force_sync_pin] or "0", "force_sync")),
+        working_time=raw[working_time_pin],
+        deep_sleep_interval=_parse_int(raw[deep_sleep_interval_pin], "deep_sleep_interval"),
+        run_update=run_update,
+    )
+
+
+# ---- Write side: the outbox ------------------------------------------------------
+#
+# The update_* functions only queue; a write to a pin (or pin property)
+# replaces whatever was queued for it before, and flush_outbox() sends the lot
+# at the end of the cycle: every pin value of a token in one /batch/update,
+# every pin's properties in one /update/property.
+# Whatever can't be sent is kept in STATE_DIR and goes out with the next
+# connected cycle's flush, older than (so overridden by) that cycle's writes.
+
+BLYNK_BATCH_UPDATE_URL = "https://blynk.cloud/external/api/batch/update"
+BLYNK_PROPERTY_UPDATE_URL = "https://blynk.cloud/external/api/update/property"
+OUTBOX_PATH = os.path.join(STATE_DIR, "blynk_outbox.json")
+
+_outbox_lock = threading.Lock()
+# (token, pin, property or None) → value, in queueing order.
+_outbox = {}
+
+
+def _queue(blynk_auth, blynk_pin, value, prop=None):
+    with _outbox_lock:
+        _outbox.pop((blynk_auth, blynk_pin, prop), None)
+        _outbox[(blynk_auth, blynk_pin, prop)] = value
+
+
+def update_blynk_url(secure_url, blynk_auth, blynk_pin):
+    """Queue the pin's `urls` property (the image widget)."""
+    _queue(blynk_auth, blynk_pin, secure_url, prop="urls")
 
 
 def update_blynk_pin_value(value, blynk_auth, blynk_pin):
-    base_url = "https://blynk.cloud/external/api/update"
+    """Queue a pin value."""
+    _queue(blynk_auth, blynk_pin, value)
+
+
+def update_blynk_batch(updates, blynk_auth):
+    """Queue several pin values."""
+    for pin, value in updates.items():
+        _queue(blynk_auth, pin, value)
+
+
+def _send_values(blynk_auth, values):
     try:
-        url = f"{base_url}?token={blynk_auth}&pin={blynk_pin}&value={value}"
-        response = requests.get(url, timeout=10)
+        response = transport.get(BLYNK_BATCH_UPDATE_URL, params={"token": blynk_auth, **values}, timeout=10)
         response.raise_for_status()
-        print(f"Blynk pin {blynk_pin} updated successfully with value {value}.")
+        print(f"Blynk batch update successful with values: {values}")
+        return True
     except Exception as e:
-        print(f"Error updating Blynk pin value: {e}")
+        print(f"Error during Blynk batch update: {e}")
+        return False
 
-def update_blynk_batch(updates, blynk_auth):
-    base_url = "https://blynk.cloud/external/api/batch/update"
-    try:
-        # Format updates for batch request
-        params = {'token': blynk_auth}
-        params.update({f'{pin}': value for pin, value in updates.items()})
 
-        # Send batch request
-        response = requests.get(base_url, params=params, timeout=10)
+def _send_properties(blynk_auth, blynk_pin, properties):
+    try:
+        params = {"token": blynk_auth, "pin": blynk_pin, **properties}
+        response = transport.get(BLYNK_PROPERTY_UPDATE_URL, params=params, timeout=10)
         response.raise_for_status()
-        print(f"Blynk batch update successful with values: {updates}")
+        print(f"Blynk property updated successfully for pin {blynk_pin}.")
+        return True
     except Exception as e:
-        print(f"Error during Blynk batch update: {e}")
\ No newline at end of file
+        print(f"Error updating Blynk property: {e}")
+        return False
+
+
+def flush_outbox(send=True):
+    """Send the writes left over from earlier cycles and everything queued
+    since the last flush, in as few requests as the API allows. Offline
+    (`send=False`) or on failure they're saved for the next flush. Returns
+    True when nothing is left pending."""
+    pending = load_state(OUTBOX_PATH, []) or []
+    with _outbox_lock:
+        writes = {(token, pin, prop): value for token, pin, prop, value in pending}
+        for key, value in _outbox.items():
+            writes.pop(key, None)
+            writes[key] = value
+        _outbox.clear()
+    if not writes:
+        return True
+
+    failed = writes
+    if send:
+        values, properties = {}, {}
+        for (token, pin, prop), value in writes.items():
+            if prop is None:
+                values.setdefault(token, {})[pin] = value
+            else:
+                properties.setdefault((token, pin), {})[prop] = value
+        failed = {}
+        for token, pin_values in values.items():
+            if not _send_values(token, pin_values):
+                failed.update({(token, pin, None): value for pin, value in pin_values.items()})
+        for (token, pin), props in properties.items():
+            if not _send_properties(token, pin, props):
+                failed.update({(token, pin, prop): value for prop, value in props.items()})
+
+    if failed or pending:
+        save_state(OUTBOX_PATH, [[token, pin, prop, value] for (token, pin, prop), value in failed.items()])
+    if failed:
+        print(f"{len(failed)} Blynk write(s) kept for the next connected cycle.")
+    return not failed
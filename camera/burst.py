@@ -0,0 +1,131 @@
+"""In-process continuous monitoring ("burst mode") after a person detection.
+
+Burst mode runs in the cycle's own process, with the camera, the detector and
+the settings already loaded, as a three-stage pipeline on separate threads:
+
+    capture N+1  ──►  detect N  ──►  deliver N-1
+
+Queues between the stages hold a single frame, so the camera never runs more
+than one frame ahead of detection. The burst ends after `max_empty_frames`
+consecutive frames without a person, after `max_duration_seconds`, or when a
+stage fails; frames already in flight are still delivered.
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+# Sentinel passed down the pipeline once capturing has stopped.
+_DONE = object()
+
+STOP_EMPTY_FRAMES = "empty_frames"
+STOP_MAX_DURATION = "max_duration"
+STOP_ERROR = "error"
+
+
+@dataclass
+class BurstStats:
+    frames: int = 0
+    frames_with_person: int = 0
+    elapsed_seconds: float = 0.0
+    stop_reason: str = None
+
+    @property
+    def fps(self):
+        return self.frames / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+def run_burst(capture, detect, deliver, max_empty_frames=3, max_duration_seconds=300,
+              min_frame_interval=0.0):
+    """Run capture → detect → deliver as a pipeline until an exit condition.
+
+    capture(frame_no) -> frame, or None if the camera failed
+    detect(frame)     -> (item, person_detected)
+    deliver(item)     -> None (upload / spool; runs on the calling thread)
+
+    `min_frame_interval` spaces capture starts so a fast camera doesn't
+    outrun the detector for no benefit. Returns BurstStats.
+    """
+    stats = BurstStats()
+    stop = threading.Event()
+    captured = queue.Queue(maxsize=1)
+    detected = queue.Queue(maxsize=1)
+    start = time.monotonic()
+
+    def halt(reason):
+        if not stop.is_set():
+            stats.stop_reason = reason
+            print(f"⏹ Burst stopping: {reason}")
+            stop.set()
+
+    def capture_loop():
+        frame_no = 0
+        while not stop.is_set():
+            if time.monotonic() - start >= max_duration_seconds:
+                halt(STOP_MAX_DURATION)
+                break
+            frame_start = time.monotonic()
+            frame_no += 1
+            try:
+                frame = capture(frame_no)
+            except Exception as e:
+                print(f"Burst capture failed: {e}")
+                frame = None
+            if frame is None:
+                halt(STOP_ERROR)
+                break
+            # Blocks while the detector is busy — that's the back-pressure.
+            # Every stage drains its input until _DONE, so this can't wedge.
+            captured.put(frame)
+            remaining = min_frame_interval - (time.monotonic() - frame_start)
+            if remaining > 0:
+                stop.wait(remaining)
+        captured.put(_DONE)
+
+    def detect_loop():
+        empty_streak = 0
+        while True:
+            frame = captured.get()
+            if frame is _DONE:
+                break
+            try:
+                item, person_detected = detect(frame)
+            except Exception as e:
+                print(f"Burst detection failed: {e}")
+                halt(STOP_ERROR)
+                continue
+            if person_detected:
+                stats.frames_with_person += 1
+                empty_streak = 0
+            else:
+                empty_streak += 1
+                if empty_streak >= max_empty_frames:
+                    halt(STOP_EMPTY_FRAMES)
+            detected.put(item)
+        detected.put(_DONE)
+
+    threads = [
+        threading.Thread(target=capture_loop, name="burst-capture", daemon=True),
+        threading.Thread(target=detect_loop, name="burst-detect", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    while True:
+        item = detected.get()
+        if item is _DONE:
+            break
+        try:
+            deliver(item)
+        except Exception as e:
+            print(f"Burst delivery failed: {e}")
+            halt(STOP_ERROR)
+        stats.frames += 1
+
+    for t in threads:
+        t.join()
+    stats.elapsed_seconds = time.monotonic() - start
+    print(f"📸 Burst done: {stats.frames} frames ({stats.frames_with_person} with a person) "
+          f"in {stats.elapsed_seconds:.1f}s — {stats.fps:.2f} fps, stop: {stats.stop_reason}")
+    return stats
@@ -1,20 +1,25 @@
+import os
+import shutil
 import subprocess
-from PIL import Image, ImageDraw, ImageFont
+import time
 
-def capture_photo(temp_path, use_tuning_file):
-    tuning_file = "imx219_160d.json"
+_CAMERA_DIR = os.path.dirname(os.path.abspath(__file__))
+TUNING_FILE = os.path.join(_CAMERA_DIR, "imx219_160d.json")
+CAPTURE_TIMEOUT = 30
 
-    command = [
-    "rpicam-still",
-    "-o", temp_path,
-    "--awb", "auto",
-    "--nopreview"]
 
+def _rpicam_args(use_tuning_file):
+    args = ["--awb", "auto", "--nopreview"]
     if use_tuning_file:
-        command.extend(["--tuning-file", tuning_file])
+        args.extend(["--tuning-file", TUNING_FILE])
+    return args
+
+
+def capture_photo(temp_path, use_tuning_file):
+    command = ["rpicam-still", "-o", temp_path] + _rpicam_args(use_tuning_file)
 
     try:
-        subprocess.run(command, check=True, timeout=30)
+        subprocess.run(command, check=True, timeout=CAPTURE_TIMEOUT)
         print("Photo captured successfully.")
         return True, None
     except Exception as e:
@@ -22,28 +27,278 @@ def capture_photo(temp_path, use_tuning_file):
         print(error_message)
         return False, error_message
 
+
+# ---- Capture backends --------------------------------------------------------
+# A backend turns "give me a frame at this path" into a JPEG on disk and
+# returns (success, error_message) like capture_photo(). The one-shot backend
+# is the default: a fresh rpicam-still per frame re-initialises the sensor,
+# reloads the tuning file and waits for AE/AWB to converge — seconds per
+# shot, which is fine once per wake but dominates burst mode. The persistent
+# backends keep the camera streaming and return frames on demand; close()
+# releases the camera, and the next capture() reopens it.
+
+
+class OneShotBackend:
+    """A fresh rpicam-still process per frame (the original behaviour)."""
+
+    def __init__(self, use_tuning_file):
+        self.use_tuning_file = use_tuning_file
+
+    def capture(self, path):
+        return capture_photo(path, self.use_tuning_file)
+
+    def close(self):
+        pass
+
+
+def _is_complete_jpeg(path):
+    """True once `path` ends with the JPEG EOI marker (fully written)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(-2, os.SEEK_END)
+            return f.read(2) == b"\xff\xd9"
+    except OSError:
+        return False
+
+
+class RpicamKeypressBackend:
+    """One long-running `rpicam-still -t 0 --keypress`: the camera keeps
+    streaming (AE/AWB stay converged) and every Enter on stdin writes the next
+    numbered frame. Keypress mode rather than --signal: an early SIGUSR1 kills
+    the process before rpicam installs its handler, while an early Enter just
+    waits in the pipe buffer. If the process dies it's restarted on the next
+    capture."""
+
+    def __init__(self, use_tuning_file, frame_dir="/tmp"):
+        self.use_tuning_file = use_tuning_file
+        self.frame_pattern = os.path.join(frame_dir, "rpicam_frame_%04d.jpg")
+        self._process = None
+        self._frame_no = 0
+
+    def _start(self):
+        command = (["rpicam-still", "-t", "0", "--keypress", "-o", self.frame_pattern]
+                   + _rpicam_args(self.use_tuning_file))
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, text=True,
+        )
+        self._frame_no = 0
+
+    def capture(self, path):
+        try:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            frame_path = self.frame_pattern % self._frame_no
+            if os.path.exists(frame_path):
+                os.remove(frame_path)
+            self._process.stdin.write("\n")
+            self._process.stdin.flush()
+            deadline = time.monotonic() + CAPTURE_TIMEOUT
+            while not _is_complete_jpeg(frame_path):
+                if self._process.poll() is not None:
+                    raise RuntimeError(f"rpicam-still exited with {self._process.returncode}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"no frame after {CAPTURE_TIMEOUT}s")
+                time.sleep(0.02)
+            self._frame_no += 1
+            shutil.move(frame_path, path)
+            print("Photo captured successfully.")
+            return True, None
+        except Exception as e:
+            self.close()
+            error_message = f"An error occurred while capturing the photo: {e}"
+            print(error_message)
+            return False, error_message
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            if self._process.poll() is None:
+                self._process.stdin.write("x\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+        except Exception:
+            self._process.kill()
+        self._process = None
+
+
+class Picamera2Backend:
+    """Keeps a Picamera2 instance open in still configuration. Needs the
+    python3-picamera2 package (checked at construction, so a missing package
+    falls back to one-shot); the camera itself opens on the first capture."""
+
+    def __init__(self, use_tuning_file):
+        from picamera2 import Picamera2
+        self._picamera2_cls = Picamera2
+        self.use_tuning_file = use_tuning_file
+        self._camera = None
+
+    def _start(self):
+        tuning = None
+        if self.use_tuning_file:
+            tuning = self._picamera2_cls.load_tuning_file(os.path.basename(TUNING_FILE), dir=_CAMERA_DIR)
+        self._camera = self._picamera2_cls(tuning=tuning)
+        self._camera.configure(self._camera.create_still_configuration())
+        self._camera.start()
+
+    def capture(self, path):
+        try:
+            if self._camera is None:
+                self._start()
+            self._camera.capture_file(path)
+            print("Photo captured successfully.")
+            return True, None
+        except Exception as e:
+            error_message = f"An error occurred while capturing the photo: {e}"
+            print(error_message)
+            return False, error_message
+
+    def close(self):
+        if self._camera is None:
+            return
+        try:
+            self._camera.stop()
+            self._camera.close()
+        finally:
+            self._camera = None
+
+
+class FakeBackend:
+    """No camera: copies a fixed JPEG (the README sample by default), after an
+    optional delay that stands in for sensor time. For development off the Pi
+    and for exercising the pipeline in benchmarks."""
+
+    def __init__(self, use_tuning_file=False, source=os.path.join(_CAMERA_DIR, "img", "img.jpg"), delay=0.0):
+        self.source = source
+        self.delay = delay
+        self.frames = 0
+
+    def capture(self, path):
+        time.sleep(self.delay)
+        try:
+            shutil.copyfile(self.source, path)
+        except OSError as e:
+            return False, f"An error occurred while capturing the photo: {e}"
+        self.frames += 1
+        return True, None
+
+    def close(self):
+        pass
+
+
+CAPTURE_BACKENDS = {
+    "oneshot": OneShotBackend,
+    "rpicam_keypress": RpicamKeypressBackend,
+    "picamera2": Picamera2Backend,
+    "fake": FakeBackend,
+}
+
+
+def get_capture_backend(name, use_tuning_file):
+    """Instantiate a backend by config name; falls back to one-shot if the
+    requested one is unknown or can't start (e.g. picamera2 not installed)."""
+    backend_cls = CAPTURE_BACKENDS.get(name)
+    if backend_cls is None:
+        print(f"Unknown camera backend {name!r}, using oneshot.")
+        return OneShotBackend(use_tuning_file)
+    try:
+        return backend_cls(use_tuning_file)
+    except Exception as e:
+        print(f"Camera backend {name!r} failed to start ({e}), using oneshot.")
+        return OneShotBackend(use_tuning_file)
+
+LABEL_FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+LABEL_FONT_SIZE = 70
+LABEL_PADDING = 20
+LABEL_EXTRA_PADDING_TOP = 10
+LABEL_EXTRA_PADDING_BOTTOM = 20
+
+_label_font = None
+# char -> (alpha mask, bbox relative to the pen position, advance). The label
+# only ever uses a few dozen characters, so after the first frame of a burst
+# it's assembled from these without touching FreeType.
+_glyph_cache = {}
+
+
+def _get_label_font():
+    global _label_font
+    if _label_font is None:
+        from PIL import ImageFont
+        _label_font = ImageFont.truetype(LABEL_FONT_PATH, LABEL_FONT_SIZE)
+    return _label_font
+
+
+def _glyph(char):
+    glyph = _glyph_cache.get(char)
+    if glyph is None:
+        from PIL import Image, ImageDraw
+        font = _get_label_font()
+        bbox = font.getbbox(char)
+        mask = Image.new("L", (max(bbox[2] - bbox[0], 1), max(bbox[3] - bbox[1], 1)), 0)
+        ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), char, fill=255, font=font)
+        glyph = _glyph_cache[char] = (mask, bbox, font.getlength(char))
+    return glyph
+
+
+def render_label(text):
+    """The white label box with black text as a small RGB image, to be placed
+    at (LABEL_PADDING, LABEL_PADDING). Same geometry as drawing it straight
+    onto the photo, but only the label's pixels are touched. Glyphs come from
+    the cache and are laid out by their advances (no kerning pairs, which
+    DejaVu's digits and separators don't use anyway)."""
+    from PIL import Image
+
+    placed = []
+    pen = 0.0
+    for char in text:
+        mask, bbox, advance = _glyph(char)
+        x = round(pen)
+        placed.append((mask, (x + bbox[0], bbox[1], x + bbox[2], bbox[3])))
+        pen += advance
+    boxes = [box for _, box in placed] or [(0, 0, 0, 0)]
+    text_width = max(b[2] for b in boxes) - min(b[0] for b in boxes)
+    text_height = max(b[3] for b in boxes) - min(b[1] for b in boxes)
+    # +1: ImageDraw.rectangle includes its bottom-right corner.
+    patch = Image.new("RGB", (
+        text_width + 20 + 1,
+        text_height + LABEL_EXTRA_PADDING_TOP + LABEL_EXTRA_PADDING_BOTTOM + 1,
+    ), "white")
+    for mask, box in placed:
+        patch.paste((0, 0, 0), (10 + box[0], LABEL_EXTRA_PADDING_TOP + box[1]), mask)
+    return patch
+
+
+def add_text_to_frame(frame, text, jpeg_domain=True):
+    """Stamp the label onto an in-memory Frame (see frame.py). If nothing
+    has drawn on the frame yet, only the MCUs under the label are
+    re-encoded (jpeg_overlay.py). Otherwise, or if this JPEG can't be
+    edited in place, the label goes into the decoded pixels."""
+    import jpeg_overlay
+
+    try:
+        patch = render_label(text)
+        if jpeg_domain and not frame.dirty:
+            try:
+                jpeg, canvas, origin = jpeg_overlay.stamp(frame.jpeg, patch, (LABEL_PADDING, LABEL_PADDING))
+            except jpeg_overlay.Unsupported as e:
+                print(f"Label can't be stamped in the JPEG domain ({e}), re-encoding the frame.")
+            else:
+                frame.replace_jpeg(jpeg, canvas, origin)
+                return True
+        frame.paste(patch, (LABEL_PADDING, LABEL_PADDING))
+        return True
+    except Exception as e:
+        print(f"An error occurred while processing the image: {e}")
+        return False
+
+
 def add_text_to_image(input_path, output_path, text):
-    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-    font_size = 70
-    padding = 20
-    extra_padding_top = 10
-    extra_padding_bottom = 20
+    from PIL import Image
 
     try:
         img = Image.open(input_path)
-        draw = ImageDraw.Draw(img)
-        font = ImageFont.truetype(font_path, font_size)
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
-        background_position = (
-            padding,
-            padding,
-            padding + text_width + 20,
-            padding + text_height + extra_padding_top + extra_padding_bottom
-        )
-        draw.rectangle(background_position, fill="white")
-        text_position = (padding + 10, padding + extra_padding_top)
-        draw.text(text_position, text, fill="black", font=font)
+        img.paste(render_label(text), (LABEL_PADDING, LABEL_PADDING))
         img.save(output_path)
         print(f"Photo with text saved to {output_path}")
     except Exception as e:
@@ -1,23 +1,205 @@
+"""Uploads to Cloudinary, in resumable chunks.
+
+Frames are sent with Cloudinary's large-upload protocol: consecutive pieces
+of the file, each a POST with the same form fields plus
+
+    X-Unique-Upload-Id: <id>
+    Content-Range: bytes <first>-<last>/<total>
+
+and the response to the last piece is the usual upload result. Every piece
+but the last must be at least MIN_CHUNK_BYTES; beyond that the chunk size
+follows the measured throughput (about CHUNK_SECONDS of transfer).
+
+After every acknowledged chunk the offset is saved in STATE_DIR under the
+caller's `resume_key` with a fingerprint of the bytes and form fields. A
+failed chunk is retried; after MAX_CHUNK_FAILURES the call gives up, and a
+later upload under the same key with the same bytes and fields picks up at
+the saved offset. Anything else under that key, and progress older than
+RESUME_MAX_AGE_SECONDS, starts over. If Cloudinary turns the first chunk
+down with a 4xx, the frame goes up in one plain request.
+
+`python3 bench.py upload` runs both against a local stand-in.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+
 import requests
 
+import transport
+from utils import STATE_DIR, load_state, save_state
+
+STATE_PATH = os.path.join(STATE_DIR, "cloudinary_uploads.json")
+
+CONNECT_TIMEOUT = 10
+# Longest pause in the transfer (either way) before the request is dropped.
+READ_TIMEOUT = 30
+CHUNK_SECONDS = 4
+# Cloudinary refuses a non-final chunk under 5 MB, so a smaller frame goes
+# up as one (final) chunk.
+MIN_CHUNK_BYTES = 5 * 1024 * 1024
+INITIAL_CHUNK_BYTES = MIN_CHUNK_BYTES
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+# Failed chunk requests per call before giving up; each one halves the chunk.
+MAX_CHUNK_FAILURES = 5
+RETRY_DELAY_SECONDS = 1
+RESUME_MAX_AGE_SECONDS = 12 * 3600
+# Weight of the newest chunk in the throughput estimate.
+THROUGHPUT_SMOOTHING = 0.5
+
+
+class _ChunkingRejected(Exception):
+    pass
+
+
+def _form(cloudinary_upload_preset, camera_number, tags, public_id, context, folder=None):
+    data = {
+        "upload_preset": cloudinary_upload_preset,
+        "folder": folder or f"camera_{camera_number}",
+    }
+    if tags:
+        data["tags"] = ",".join(tags)
+    if public_id:
+        data["public_id"] = public_id
+    if context:
+        data["context"] = "|".join(f"{k}={v}" for k, v in context.items() if v is not None)
+    return data
+
+
+def _chunk_size(throughput):
+    if not throughput:
+        return INITIAL_CHUNK_BYTES
+    return int(min(max(throughput * CHUNK_SECONDS, MIN_CHUNK_BYTES), MAX_CHUNK_BYTES))
+
 
-def upload_to_cloudinary(file_path, cloudinary_url, cloudinary_upload_preset, camera_number, tags=None):
+def _content_type(content):
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _load_progress(now):
+    state = load_state(STATE_PATH, {}) or {}
+    uploads = {fingerprint: upload for fingerprint, upload in state.get("uploads", {}).items()
+               if now - upload["started_at"] < RESUME_MAX_AGE_SECONDS}
+    return uploads, state.get("throughput")
+
+
+def has_progress(resume_key, now=None):
+    """Whether an upload under `resume_key` got partway and can resume."""
+    uploads, _ = _load_progress(now or time.time())
+    upload = uploads.get(resume_key)
+    return bool(upload and upload["offset"])
+
+
+def _upload_single(content, filename, data, cloudinary_url):
+    files = {"file": (filename, content, _content_type(content))}
+    response = transport.post(cloudinary_url, files=files, data=data,
+                              timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    response.raise_for_status()
+    return response.json()
+
+
+def _upload_chunked(content, filename, data, cloudinary_url, resume_key=None):
+    """Send `content` chunk by chunk, resuming progress saved under
+    `resume_key` (default: the fingerprint itself). Returns the upload
+    result; raises requests.RequestException after MAX_CHUNK_FAILURES,
+    _ChunkingRejected if the first chunk is refused."""
+    now = time.time()
+    uploads, throughput = _load_progress(now)
+    fingerprint = hashlib.sha1(
+        content + json.dumps([filename, data], sort_keys=True).encode()
+    ).hexdigest()
+    key = resume_key or fingerprint
+    upload = uploads.get(key)
+    if upload is None or upload.get("fingerprint") != fingerprint:
+        upload = {"id": uuid.uuid4().hex, "offset": 0, "started_at": now, "fingerprint": fingerprint}
+    total = len(content)
+    content_type = _content_type(content)
+    if upload["offset"]:
+        print(f"Resuming Cloudinary upload at {upload['offset']}/{total} bytes.")
+
+    def save():
+        save_state(STATE_PATH, {"uploads": uploads, "throughput": throughput})
+
+    chunk = _chunk_size(throughput)
+    failures = 0
+    while True:
+        offset = upload["offset"]
+        end = min(offset + chunk, total)
+        headers = {
+            "X-Unique-Upload-Id": upload["id"],
+            "Content-Range": f"bytes {offset}-{end - 1}/{total}",
+        }
+        started = time.monotonic()
+        try:
+            response = transport.post(
+                cloudinary_url, files={"file": (filename, content[offset:end], content_type)},
+                data=data, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            )
+            if offset == 0 and 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                raise _ChunkingRejected(f"HTTP {response.status_code}: {response.text[:200]}")
+            response.raise_for_status()
+            result = response.json()
+        except requests.RequestException as e:
+            failures += 1
+            if failures >= MAX_CHUNK_FAILURES:
+                uploads[key] = upload
+                save()
+                raise
+            chunk = max(chunk // 2, MIN_CHUNK_BYTES)
+            print(f"Chunk {offset}-{end - 1}/{total} failed ({e}); retrying in {chunk // 1024} KB chunks.")
+            time.sleep(RETRY_DELAY_SECONDS)
+            continue
+
+        measured = (end - offset) / max(time.monotonic() - started, 1e-3)
+        throughput = measured if not throughput else (
+            THROUGHPUT_SMOOTHING * measured + (1 - THROUGHPUT_SMOOTHING) * throughput
+        )
+        if end == total:
+            uploads.pop(key, None)
+            save()
+            return result
+        upload["offset"] = end
+        uploads[key] = upload
+        save()
+        chunk = _chunk_size(throughput)
+
+
+def upload_to_cloudinary(photo, cloudinary_url, cloudinary_upload_preset, camera_number, tags=None,
+                         public_id=None, context=None, filename=None, folder=None, resume_key=None):
     """Upload a photo to Cloudinary. `tags` is an optional iterable of strings
     that get attached to the resource — used by the dashboard to filter
     detection hits and surface confidence in the UI without parsing filenames.
+
+    `public_id` makes the upload idempotent: an unsigned upload to an id that
+    already exists returns the existing asset instead of a duplicate (the
+    spool relies on that). `context` is an optional dict stored as Cloudinary
+    contextual metadata.
+
+    `photo` is a file path, or the JPEG bytes themselves — those are sent
+    straight from memory, nothing touches the SD card. `filename` overrides
+    the multipart filename (defaults to the path's basename / "photo.jpg"),
+    `folder` the Cloudinary folder (defaults to camera_<camera_number>).
+    `resume_key` names the upload's saved chunk progress (see above).
     """
     try:
-        with open(file_path, "rb") as f:
-            files = {"file": f}
-            data = {
-                "upload_preset": cloudinary_upload_preset,
-                "folder": f"camera_{camera_number}",
-            }
-            if tags:
-                data["tags"] = ",".join(tags)
-            response = requests.post(cloudinary_url, files=files, data=data)
-        response.raise_for_status()
-        response_data = response.json()
+        if isinstance(photo, (bytes, bytearray, memoryview)):
+            content = bytes(photo)
+            filename = filename or "photo.jpg"
+        else:
+            with open(photo, "rb") as f:
+                content = f.read()
+            filename = filename or os.path.basename(photo)
+        data = _form(cloudinary_upload_preset, camera_number, tags, public_id, context, folder)
+        try:
+            response_data = _upload_chunked(content, filename, data, cloudinary_url, resume_key)
+        except _ChunkingRejected as e:
+            print(f"Cloudinary refused a chunked upload ({e}); sending it in one request.")
+            response_data = _upload_single(content, filename, data, cloudinary_url)
         image_url = response_data.get("secure_url", "No URL returned")
         print(f"Image uploaded successfully. URL: {image_url}")
         return image_url
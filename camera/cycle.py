@@ -0,0 +1,822 @@
+"""One wake cycle of the camera: capture → detect → overlay → upload, then
+schedule the next wake and cut the power. main.py just calls run().
+
+Importing this module is cheap on purpose. The heavy imports — requests
+(blynk, cloudinary), PIL and cv2/numpy (overlay, detection) — happen inside
+the functions that need them, and the `preload` task pulls them in on a
+task-graph thread while rpicam-still and the WiFi association run, instead
+of delaying both. `python3 bench.py startup` fails when the import of the
+entry point goes over STARTUP_IMPORT_BUDGET_MS or drags a heavy module in.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+import timing
+from timing import span
+from camera import get_capture_backend, add_text_to_frame
+from frame import Frame
+from utils import generate_text, get_wifi_signal_strength, get_ip_address, get_current_time, is_connected_to_internet, get_next_start_time_from_start, is_in_time_interval, decode_time_interval, current_time, delete_photo, get_next_start_time, shutdown_device, peak_rss_mb
+from witty_sheduler import DRIVER_NATIVE, schedule_deep_sleep, sync_time, close_session
+from task_graph import TaskGraph
+import spool
+from settings_cache import SettingsCache, SETTINGS_KEYS
+from burst import run_burst, STOP_MAX_DURATION
+
+version = "3.3.0"
+# Min spacing between burst-mode frames; also the wake interval requested when
+# a burst hit its max duration with a person still in view.
+sleep_interval_person_detected = 1
+default_deep_sleep_interval = 300
+
+# Hardcoded fallback — keeps working on Pis whose local config.json (gitignored)
+# hasn't been updated to include sys_temperature_url.
+DEFAULT_SYS_TEMPERATURE_URL = "https://sys.zaoral.cz/api/public/outdoor/temperature"
+# Fallback for force-sync Blynk pin — every camera uses V23, no need to add it
+# to config.json after `git pull` (configs are gitignored).
+DEFAULT_FORCE_SYNC_PIN = "v23"
+# Max seconds per connected cycle spent uploading frames spooled while offline.
+DEFAULT_SPOOL_DRAIN_BUDGET_SECONDS = 60
+# Burst mode (continuous monitoring after a hit) ends after this many frames
+# in a row without a person, or after this many seconds.
+DEFAULT_BURST_MAX_EMPTY_FRAMES = 3
+DEFAULT_BURST_MAX_SECONDS = 300
+# Stamp the label by re-encoding only the MCUs under it (see jpeg_overlay.py);
+# false forces the old decode + full re-encode.
+DEFAULT_JPEG_DOMAIN_LABEL = True
+# Skip YOLO when the scene hasn't changed since the last wakes (see
+# scene_change.py).
+DEFAULT_SCENE_CHANGE_GATE = True
+# "script" drives the wittyPi.sh menu and the gpio CLI as before; "native"
+# talks to the WittyPi RTC/MCU over I2C and to GPIO-4 through the character
+# device (wittypi.py). Opt-in until it's been verified on a real WittyPi 4
+# Mini — a wrong alarm register leaves a camera dark until someone visits.
+DEFAULT_WITTYPI_DRIVER = "script"
+# No energy budget → wake every Blynk deep-sleep interval. With one (Wh/day),
+# energy_scheduler.py picks the in-hours interval.
+DEFAULT_ENERGY_BUDGET_WH_PER_DAY = None
+# Let WittyPi arm the startups from a daily .wpi script (wpi_schedule.py)
+# instead of programming the alarm every cycle. Replaces the board's
+# schedule.wpi, so it's opt-in.
+DEFAULT_WITTYPI_DAILY_SCHEDULE = False
+# Seconds a frame's upload may take; encoding_policy.py picks resolution and
+# quality to fit (detections get more). None uploads the frame as captured
+# (uploads are still logged, so the estimates have data once it's set).
+DEFAULT_UPLOAD_BUDGET_SECONDS = None
+# Upload a thumbnail for the Blynk image pin first, and the original only if
+# it still fits the upload budget or shows a person; otherwise it's spooled
+# for a cycle with a better link. Previews go to a separate Cloudinary folder.
+DEFAULT_PREVIEW_FIRST = False
+# With complete cached settings, wait this long for the live Blynk read before
+# deciding from the cache (settings_cache.py); the read carries on meanwhile.
+DEFAULT_SETTINGS_WAIT_SECONDS = 5
+# End of cycle: how long to let this cycle's background refreshes finish
+# before persisting the cache.
+PREFETCH_WAIT_SECONDS = 10
+
+# `import main` on a Pi Zero 2 W with warm bytecode (bench.py startup).
+# Generous on purpose: it's there to catch a heavy import creeping back into
+# the startup path, not to track milliseconds.
+STARTUP_IMPORT_BUDGET_MS = 800
+# Must not be imported before the cycle starts — they're what preload() is for.
+HEAVY_MODULES = ("requests", "PIL", "cv2", "numpy")
+
+# Set up by run(): the loaded config.json and what's derived from it.
+config = None
+use_person_detection = False
+witty_pi_path = None
+wittypi_driver = None
+blynk_camera_auth = None
+force_sync_pin = None
+camera_backend = None
+graph = None
+# Set once the working window is known (wpi_schedule.DailySchedule).
+daily_schedule = None
+settings_cache = None
+
+def wait_for_rtc_sync():
+    """sync_time runs on a graph worker thread; block until it's finished so
+    the RTC (and the one wittyPi.sh session) is never driven from two threads."""
+    try:
+        graph.result("sync_time")
+    except Exception as e:
+        print(f"RTC sync task failed: {e}")
+
+
+def prepare_exec():
+    """Before the OTA update re-execs main.py: let the RTC sync finish and
+    end the wittyPi.sh session (the new process opens its own), and persist
+    what handle_deep_sleep would have."""
+    wait_for_rtc_sync()
+    close_session()
+    settings_cache.save()
+    timing.flush()
+
+
+def handle_deep_sleep(interval, startup_time_str=None):
+    """Schedule next wakeup, then shut down. Pass an explicit startup_time_str
+    to wake at a specific moment (e.g. the next working-window start); otherwise
+    it's computed as now+interval. With a daily WittyPi schedule installed that
+    already armed this startup, nothing is programmed. On schedule failure,
+    force a fresh RTC sync and retry once — schedule fails almost always trace
+    back to RTC drift, so re-syncing usually fixes it and avoids the device
+    going dark.
+    """
+    wait_for_rtc_sync()
+    explicit_startup = startup_time_str
+    if startup_time_str is None:
+        startup_time_str = get_next_start_time(interval)
+    with span("schedule"):
+        if (daily_schedule is not None and daily_schedule.ensure_installed(witty_pi_path, wittypi_driver)
+                and daily_schedule.covers(interval, explicit_startup, witty_pi_path, wittypi_driver)):
+            print("📅 Next startup is armed by the daily WittyPi schedule.")
+            success, error = True, ""
+        else:
+            success, error = schedule_deep_sleep(startup_time_str, witty_pi_path, driver=wittypi_driver)
+
+        if not success:
+            print("⚠️ schedule_deep_sleep failed — forcing RTC sync and retrying once.")
+            sync_ok, _, _ = sync_time(witty_pi_path, last_sync_iso=None, force=True, driver=wittypi_driver)
+            if sync_ok:
+                success, error = schedule_deep_sleep(startup_time_str, witty_pi_path, driver=wittypi_driver)
+        close_session()
+
+    from blynk import flush_outbox, update_blynk_pin_value
+    if not success:
+        update_blynk_pin_value(error, blynk_camera_auth, config["blynk_camera_error_pin"])
+    # Every Blynk write of the cycle goes out here, in one go.
+    with span("telemetry"):
+        flush_outbox(send=graph.result("internet_wait"))
+
+    camera_backend.close()
+    settings_cache.save()
+    print(f"Peak RSS this cycle: {peak_rss_mb():.0f} MB")
+    # Persist phase timings before GPIO cuts power — nothing after this line
+    # is guaranteed to run.
+    timing.flush()
+    shutdown_device(native_gpio=wittypi_driver == DRIVER_NATIVE)
+    # Always exit 0 to prevent systemd restart loop — if GPIO didn't cut power,
+    # restarting the script won't help and would drain the battery.
+    sys.exit(0)
+
+
+def plan_interval(nominal, person_detected, window):
+    """The in-hours wake interval: Blynk's `nominal`, or the energy
+    scheduler's pick when config.json sets a daily energy budget."""
+    budget = config.get("energy_budget_wh_per_day", DEFAULT_ENERGY_BUDGET_WH_PER_DAY)
+    if budget is None:
+        return nominal
+    import energy_scheduler
+    from witty_sheduler import input_voltage
+
+    now = time.time()
+    voltage = input_voltage()
+    scheduler = energy_scheduler.EnergyScheduler.load()
+    scheduler.record(now, timing.elapsed(), person_detected, voltage)
+    interval, reason = scheduler.interval(now, window, float(budget), voltage)
+    scheduler.save()
+    print(f"⚡ Energy scheduler: {interval}s instead of {nominal}s ({reason})")
+    return interval
+
+
+def push_telemetry(status, error, interval, time_range_val=""):
+    """Push the standard dashboard telemetry (time, wifi, ip, version, schedule,
+    status, error); flush_outbox sends it with the cycle's other writes.
+    Called both on camera-fail and on the happy path so the sys dashboard
+    never shows a stale cycle-old snapshot.
+    """
+    from blynk import update_blynk_batch
+
+    startup_time_str = get_next_start_time(interval) or ""
+    updates = {
+        config["blynk_camera_wifi_signal_pin"]: get_wifi_signal_strength(),
+        config["blynk_camera_ip_pin"]: get_ip_address(),
+        config["blynk_camera_pin_current_time"]: get_current_time(),
+        config["blynk_camera_pin_setted_working_time"]: time_range_val,
+        config["blynk_camera_deep_sleep_interval_setted_pin"]: interval,
+        config["blynk_camera_version_pin"]: version,
+        config["blynk_camera_next_start_time_pin"]: startup_time_str,
+        config["blynk_camera_status_pin"]: status,
+        config["blynk_camera_error_pin"]: error,
+    }
+    updates = {pin: value for pin, value in updates.items() if value is not None}
+    update_blynk_batch(updates, blynk_camera_auth)
+
+temp_photo_path = "/tmp/photo.jpg"
+
+
+def read_settings(connected):
+    """All per-cycle Blynk settings in one batched read, or None offline."""
+    if not connected:
+        return None
+    from blynk import get_cycle_settings
+
+    settings = get_cycle_settings(
+        blynk_camera_auth,
+        last_sync_pin=config["blynk_camera_pin_last_sync_date"],
+        force_sync_pin=force_sync_pin,
+        working_time_pin=config["blynk_camera_pin_working_time"],
+        deep_sleep_interval_pin=config["blynk_camera_deep_sleep_interval_pin"],
+        run_update_pin=config["blynk_camera_run_update_pin"],
+    )
+    if settings.force_sync:
+        print("🔧 Force sync requested via Blynk pin.")
+    settings_cache.remember(settings)
+    return settings
+
+
+def cycle_settings():
+    """This cycle's settings: the live Blynk read, with whatever it couldn't
+    provide taken from the cache. When the cache alone is complete, the read
+    gets DEFAULT_SETTINGS_WAIT_SECONDS and the cycle goes on from the cache
+    if Blynk is slower — the read finishes in the background and lands in
+    the cache for the next boot (its flags only apply then)."""
+    cached = settings_cache.fill()
+    wait = config.get("settings_wait_seconds", DEFAULT_SETTINGS_WAIT_SECONDS) if cached.complete else None
+    try:
+        settings = graph.result("blynk_read_settings", timeout=wait)
+    except FutureTimeoutError:
+        print("Blynk is slow — deciding from cached settings.")
+        return cached
+    return settings_cache.fill(settings)
+
+
+def prefetch_settings(interval):
+    """End of a connected cycle: let this cycle's background refreshes finish,
+    then refetch what the next boot, `interval` seconds away, would find too
+    old in the cache. None (sleeping until the window reopens) skips the
+    refetch — nothing short-lived would still be fresh by then."""
+    for name in ("blynk_read_settings", "temperature_refresh"):
+        if name in graph:
+            try:
+                graph.result(name, timeout=PREFETCH_WAIT_SECONDS)
+            except Exception:
+                pass
+    if interval is None:
+        return
+    stale = settings_cache.stale_keys(time.time() + interval)
+    if "temperature" in stale:
+        fetch_temperature(True)
+    if stale.intersection(SETTINGS_KEYS):
+        from blynk import flush_outbox
+
+        # Send this cycle's writes first (the last_sync_date the RTC sync
+        # queued, the force_sync reset), or the read returns the values
+        # they replace and the cache takes those back.
+        wait_for_rtc_sync()
+        flush_outbox()
+        read_settings(True)
+
+
+def run_sync_time(settings, temperature):
+    """Sync-and-verify the RTC. WittyPi's sync pulls network time into the
+    RTC and the skip decision needs the last sync date from Blynk (and the
+    outdoor temperature, for the drift model), so this waits for
+    connectivity — but it overlaps detection."""
+    if settings is None:
+        return None
+    from blynk import update_blynk_pin_value
+
+    try:
+        temperature_c = float(temperature)
+    except (TypeError, ValueError):
+        temperature_c = None
+    force_sync = settings.force_sync
+    sync_success, sync_message, new_sync_iso = sync_time(
+        witty_pi_path, settings.last_sync_date, force=force_sync, driver=wittypi_driver,
+        temperature=temperature_c,
+    )
+
+    if new_sync_iso:
+        settings_cache.put("last_sync_date", new_sync_iso)
+        update_blynk_pin_value(new_sync_iso, blynk_camera_auth, config["blynk_camera_pin_last_sync_date"])
+
+    if force_sync and sync_success:
+        update_blynk_pin_value(0, blynk_camera_auth, force_sync_pin)
+
+    if not sync_success:
+        update_blynk_pin_value(sync_message, blynk_camera_auth, config["blynk_camera_error_pin"])
+    return sync_success
+
+
+def capture_frame(photo_path=temp_photo_path):
+    """Capture into an in-memory Frame. Backends hand over a JPEG file, which
+    is read once and removed; from here on the frame never touches the SD
+    card unless it has to be spooled. Returns (frame or None, error)."""
+    ok, error = camera_backend.capture(photo_path)
+    if not ok:
+        return None, error
+    try:
+        frame = Frame.from_file(photo_path)
+    except OSError as e:
+        return None, f"Captured frame unreadable: {e}"
+    delete_photo(photo_path)
+    return frame, None
+
+
+def run_detection(captured, use_gate=True):
+    """Detect persons on the captured frame and draw the boxes into it.
+    Returns (person_detected, upload_tags). With the scene-change gate, an
+    unchanged scene skips YOLO (and the full decode) and a local change
+    only runs it around that spot."""
+    frame, _ = captured
+    upload_tags = []
+    if frame is None or not use_person_detection:
+        return False, upload_tags
+
+    from human_detection import detect_persons_in_image, draw_detections, DRAW_REJECTED_CANDIDATES
+
+    regions = None
+    if use_gate and config.get("scene_change_gate", DEFAULT_SCENE_CHANGE_GATE):
+        import scene_change
+        decision = scene_change.gate(frame.jpeg)
+        if not decision.run:
+            return False, upload_tags
+        regions = decision.regions
+
+    image = frame.array()
+    accepted, rejected = detect_persons_in_image(image, regions=regions)
+    person_detected = bool(accepted)
+
+    # Draw boxes on the photo so the gallery shows what was detected. While
+    # tuning is active (DRAW_REJECTED_CANDIDATES=True), call draw_detections
+    # unconditionally so the yellow zone-of-interest line is visible on every
+    # frame — that's our reference marker for the `above_zone` filter, and
+    # without it the user has no way to verify where the cutoff sits when no
+    # candidates were found in the frame.
+    if accepted or DRAW_REJECTED_CANDIDATES:
+        draw_detections(image, accepted, rejected)
+        frame.touch()
+
+    if person_detected:
+        max_confidence = max(d.confidence for d in accepted)
+        # Cloudinary tags travel out of the camera — these are how the dashboard
+        # filters hits and shows the confidence badge in the gallery.
+        upload_tags = ["person", f"conf_{int(max_confidence * 100):02d}"]
+
+    # Persist info about rejected candidates (úl, strom, větev, ...) to
+    # Cloudinary tags so we can analyse false-positive sources later without
+    # SSHing into the camera. Tags don't trigger the gallery "Pouze
+    # detekované" filter (that's tags:person), so they're invisible by
+    # default — opt-in for debug / tuning.
+    if rejected:
+        max_rejected_conf = max(d.confidence for d in rejected)
+        upload_tags.append("candidate")
+        upload_tags.append(f"cand_conf_{int(max_rejected_conf * 100):02d}")
+        for reason in sorted({d.rejected_reason for d in rejected}):
+            upload_tags.append(f"cand_{reason}")
+    return person_detected, upload_tags
+
+
+def fetch_temperature(connected):
+    if not connected:
+        return None
+    from blynk import get_sys_property
+    temperature = get_sys_property(config.get("sys_temperature_url", DEFAULT_SYS_TEMPERATURE_URL))
+    settings_cache.put("temperature", temperature)
+    return temperature
+
+
+def render_overlay(captured, detection, temperature, timestamp=current_time):
+    """Stamp camera/time/temperature onto the frame and name it; returns the
+    frame (None when there's no frame)."""
+    frame, _ = captured
+    if frame is None:
+        return None
+    person_detected, _ = detection
+    frame.name = f"DETECTED_{timestamp}.jpg" if person_detected else f"{timestamp}.jpg"
+    text = generate_text(temperature, config["camera_number"], timestamp)
+    add_text_to_frame(frame, text, jpeg_domain=config.get("jpeg_domain_label", DEFAULT_JPEG_DOMAIN_LABEL))
+    return frame
+
+
+def upload_photo(frame, detection, connected, rung=None, captured_at=current_time):
+    """Upload the frame, encoded to fit the upload budget for the current
+    signal (encoding_policy.py) unless a `rung` is given. A failed upload is
+    spooled: as sent, when it got partway (so the drain resumes it), else
+    the original."""
+    if not (frame and connected):
+        return None
+    from cloudinary import upload_to_cloudinary, has_progress
+    import encoding_policy
+
+    person_detected, upload_tags = detection
+    original = frame.encode()
+    budget = config.get("upload_budget_seconds", DEFAULT_UPLOAD_BUDGET_SECONDS)
+    policy = encoding_policy.EncodingPolicy.load()
+    signal = get_wifi_signal_strength()
+    if rung is None:
+        if budget is None:
+            rung = encoding_policy.LADDER[0]
+        else:
+            rung, reason = policy.choose(len(original), signal, float(budget), person_detected,
+                                         allow_webp=config.get("upload_webp", False))
+            print(f"Upload encoding: {rung.name}, {reason}")
+    content, extension = encoding_policy.encode(original, rung)
+    filename = f"{os.path.splitext(frame.name)[0]}.{extension}"
+
+    # The id the frame gets if it's spooled, from the start: it names the
+    # saved chunk progress, and as the public_id it makes a re-send from the
+    # spool return this asset instead of a duplicate.
+    entry_id = spool.new_entry_id()
+    started = time.monotonic()
+    secure_url = upload_to_cloudinary(
+        content,
+        config["cloudinary_url"],
+        config["cloudinary_upload_preset"],
+        config["camera_number"],
+        tags=upload_tags or None,
+        public_id=entry_id,
+        filename=filename,
+        resume_key=entry_id,
+    )
+    if secure_url:
+        seconds = time.monotonic() - started
+        print(f"📤 {len(content) / 1024:.0f} KB ({rung.name}) in {seconds:.1f}s")
+        policy.record(rung, len(original), len(content), seconds, signal)
+        policy.save()
+    elif has_progress(entry_id):
+        spool_frame(frame, detection, captured_at, attempt=(entry_id, content, filename))
+    else:
+        spool_frame(frame, detection, captured_at)
+    return secure_url
+
+
+def upload_preview(frame, detection, connected):
+    """Preview-first mode: upload a thumbnail of the frame for the Blynk image
+    pin. Returns (secure_url, seconds); deliver_original() takes care of the
+    original."""
+    if not (frame and connected):
+        return None, 0.0
+    from cloudinary import upload_to_cloudinary
+    import encoding_policy
+
+    _, upload_tags = detection
+    content, extension = encoding_policy.encode(frame.encode(), encoding_policy.PREVIEW)
+    started = time.monotonic()
+    secure_url = upload_to_cloudinary(
+        content,
+        config["cloudinary_url"],
+        config["cloudinary_upload_preset"],
+        config["camera_number"],
+        tags=list(upload_tags) + ["preview"],
+        filename=f"{os.path.splitext(frame.name)[0]}.{extension}",
+        folder=f"camera_{config['camera_number']}_preview",
+    )
+    seconds = time.monotonic() - started
+    if secure_url:
+        print(f"📤 {len(content) / 1024:.0f} KB (preview) in {seconds:.1f}s")
+    return secure_url, seconds
+
+
+def originals_fit(original_bytes, spent_seconds=0.0):
+    """Whether an original of `original_bytes` is expected to upload within
+    what's left of the upload budget at the current signal."""
+    budget = config.get("upload_budget_seconds", DEFAULT_UPLOAD_BUDGET_SECONDS)
+    if budget is None:
+        return True
+    import encoding_policy
+
+    throughput, source = encoding_policy.EncodingPolicy.load().throughput(get_wifi_signal_strength())
+    predicted = original_bytes / throughput
+    print(f"Original: ~{predicted:.0f}s of {float(budget) - spent_seconds:.0f}s left ({source})")
+    return predicted <= float(budget) - spent_seconds
+
+
+def deliver_original(frame, detection, preview_seconds):
+    """Preview-first mode, once the preview is up: upload the original now
+    when a person was detected or it fits the rest of the upload budget,
+    else spool it — a later cycle with a better link drains it."""
+    import encoding_policy
+
+    person_detected, _ = detection
+    if person_detected or originals_fit(len(frame.encode()), preview_seconds):
+        upload_photo(frame, detection, True, rung=encoding_policy.LADDER[0])
+    else:
+        spool_frame(frame, detection, deferred=True)
+
+
+def spool_frame(frame, detection, captured_at=current_time, deferred=False, attempt=None):
+    """Keep a frame we couldn't (or chose not to) upload for a later
+    connected cycle. `attempt` is (entry_id, content, filename) of a live
+    upload that got partway: those bytes are spooled under the id its chunk
+    progress is saved as."""
+    person_detected, upload_tags = detection
+    telemetry = {
+        "captured_at": captured_at,
+        "wifi_signal": get_wifi_signal_strength(),
+    }
+    if deferred:
+        telemetry["deferred"] = 1
+    if attempt is None:
+        spool.enqueue(
+            frame.encode(),
+            tags=upload_tags,
+            person_detected=person_detected,
+            telemetry=telemetry,
+        )
+        return
+    entry_id, content, filename = attempt
+    spool.enqueue(
+        content,
+        tags=upload_tags,
+        person_detected=person_detected,
+        telemetry=telemetry,
+        entry_id=entry_id,
+        resume={"filename": filename},
+    )
+
+
+def upload_spooled(entry):
+    """Upload one spooled frame under its spool id (idempotent re-send)."""
+    from cloudinary import upload_to_cloudinary, has_progress
+
+    if entry["resume"] and has_progress(entry["id"]):
+        # A live upload that got partway: finish it with the form it started
+        # with, or the saved progress wouldn't match.
+        secure_url = upload_to_cloudinary(
+            entry["photo_path"],
+            config["cloudinary_url"],
+            config["cloudinary_upload_preset"],
+            config["camera_number"],
+            tags=entry["tags"] or None,
+            public_id=entry["id"],
+            filename=entry["resume"]["filename"],
+            resume_key=entry["id"],
+        )
+        return secure_url is not None
+    secure_url = upload_to_cloudinary(
+        entry["photo_path"],
+        config["cloudinary_url"],
+        config["cloudinary_upload_preset"],
+        config["camera_number"],
+        tags=entry["tags"] + ["spooled"],
+        public_id=entry["id"],
+        context=entry["telemetry"],
+        resume_key=entry["id"],
+    )
+    return secure_url is not None
+
+
+def run_person_burst(temperature):
+    """Continuous monitoring after a hit, in this process: YOLO, the HTTP
+    session and this cycle's settings/temperature stay warm. Each frame is
+    uploaded (or spooled) and pushed to the Blynk image pin."""
+    from blynk import flush_outbox, update_blynk_url
+
+    def capture(frame_no):
+        timestamp = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        frame, _ = capture_frame(f"/tmp/burst_{frame_no}.jpg")
+        return (frame, timestamp) if frame is not None else None
+
+    def detect(captured):
+        frame, timestamp = captured
+        # No gate here: someone is known to be in view, and the burst must
+        # not teach the background model to absorb them.
+        detection = run_detection((frame, None), use_gate=False)
+        render_overlay((frame, None), detection, temperature, timestamp)
+        return (frame, detection, timestamp), detection[0]
+
+    def deliver(item):
+        frame, detection, timestamp = item
+        secure_url = upload_photo(frame, detection, True, captured_at=timestamp)
+        if secure_url:
+            # The dashboard follows a burst live, so its writes don't wait
+            # for the end of the cycle.
+            update_blynk_url(secure_url, blynk_camera_auth, config["blynk_camera_image_pin"])
+            flush_outbox()
+
+    return run_burst(
+        capture, detect, deliver,
+        max_empty_frames=config.get("burst_max_empty_frames", DEFAULT_BURST_MAX_EMPTY_FRAMES),
+        max_duration_seconds=config.get("burst_max_seconds", DEFAULT_BURST_MAX_SECONDS),
+        min_frame_interval=sleep_interval_person_detected,
+    )
+
+
+def preload():
+    """Import the heavy modules this cycle will need (and load YOLO) off the
+    main thread, while capture and the WiFi association are busy waiting."""
+    import importlib
+
+    for name in ("blynk", "cloudinary", "jpeg_overlay"):
+        importlib.import_module(name)
+    if use_person_detection:
+        import human_detection
+        importlib.import_module("scene_change")
+        human_detection._get_detector()
+
+
+def load_config(path="config.json"):
+    with open(path, "r") as config_file:
+        return json.load(config_file)
+
+
+def run():
+    """One cycle, start to power-off (ends in handle_deep_sleep → sys.exit)."""
+    global config, use_person_detection, witty_pi_path, wittypi_driver, blynk_camera_auth, force_sync_pin, camera_backend, graph
+    global daily_schedule, settings_cache
+
+    # Wire up logging so logger.info() in human_detection.py reaches systemd
+    # journal (default level is WARNING, which would silently drop our detection
+    # stats). Format mirrors print() output so existing journalctl scrapes still
+    # work.
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    config = load_config()
+    use_person_detection = config.get("use_person_detection", False)
+    witty_pi_path = config["witty_pi_path"]
+    wittypi_driver = config.get("wittypi_driver", DEFAULT_WITTYPI_DRIVER)
+    blynk_camera_auth = config["blynk_camera_auth"]
+    # Force-sync button (Blynk V23): when the user toggles it on, ignore the
+    # "already synced today" shortcut and run a full sync-and-verify cycle. The
+    # pin is reset back to 0 after a successful sync so it doesn't keep firing.
+    force_sync_pin = config.get("blynk_camera_force_sync_pin", DEFAULT_FORCE_SYNC_PIN)
+
+    # "oneshot" (default) spawns rpicam-still per frame; "rpicam_keypress" /
+    # "picamera2" keep the camera streaming, which pays off in burst mode.
+    camera_backend = get_capture_backend(config.get("camera_backend", "oneshot"), config["use_tuning_file"])
+    settings_cache = SettingsCache.load()
+
+    # The cycle as a dependency graph: capture → detect → overlay runs while WiFi
+    # associates; only the Blynk/sys/Cloudinary tasks wait for connectivity.
+    graph = TaskGraph()
+    graph.add("preload", preload)
+    graph.add("internet_wait", is_connected_to_internet)
+    graph.add("capture", capture_frame)
+    graph.add("detect", run_detection, deps=("capture",))
+    graph.add("blynk_read_settings", read_settings, deps=("internet_wait",))
+    # A fresh cached temperature lets the overlay go ahead without the network;
+    # the live value still gets fetched, for the next cycle.
+    cached_temperature = settings_cache.get("temperature")
+    if cached_temperature is not None:
+        graph.add("temperature", lambda: cached_temperature)
+        graph.add("temperature_refresh", fetch_temperature, deps=("internet_wait",))
+    else:
+        graph.add("temperature", fetch_temperature, deps=("internet_wait",))
+    graph.add("sync_time", run_sync_time, deps=("blynk_read_settings", "temperature"))
+    graph.add("overlay", render_overlay, deps=("capture", "detect", "temperature"))
+    preview_first = config.get("preview_first", DEFAULT_PREVIEW_FIRST)
+    graph.add("upload", upload_preview if preview_first else upload_photo,
+              deps=("overlay", "detect", "internet_wait"))
+
+    # Check internet connection. Offline, the frame captured meanwhile isn't
+    # thrown away — it goes to the spool and is uploaded by a later cycle.
+    if not graph.result("internet_wait"):
+        print("No internet connection — spooling the frame and sleeping.")
+        offline_frame = graph.result("overlay")
+        if offline_frame:
+            spool_frame(offline_frame, graph.result("detect"))
+        # Keep to the working window and interval the camera last knew of.
+        cached = settings_cache.fill()
+        if cached.complete:
+            print("Sleeping per the cached working window and interval.")
+            is_within, start_time, _ = is_in_time_interval(cached.working_time)
+            if not is_within:
+                morning = get_next_start_time_from_start(start_time) if start_time is not None else None
+                handle_deep_sleep(default_deep_sleep_interval, startup_time_str=morning)
+            handle_deep_sleep(cached.deep_sleep_interval)
+        handle_deep_sleep(default_deep_sleep_interval)
+
+    # Get Blynk settings (cached ones fill in for what the live read lacks)
+    settings = cycle_settings()
+
+    if not settings.complete:
+        print("Error: One or more Blynk properties could not be retrieved. Exiting.")
+        handle_deep_sleep(default_deep_sleep_interval)
+
+    encoded_time = settings.working_time
+    deep_sleep_interval = settings.deep_sleep_interval
+
+    # Check working time. We no longer bail out early when outside the window —
+    # the camera still takes & uploads one photo this cycle (e.g. the boundary
+    # frame just after 20:00, or any stray wake), and only the *sleep target*
+    # differs: out-of-hours wakes sleep until the next working-window start instead
+    # of the normal interval. Decision is applied after capture/upload below.
+    is_within, start_time, time_range = is_in_time_interval(encoded_time)
+    out_of_hours = not is_within
+    if out_of_hours:
+        print("Outside working hours — taking one photo, then sleeping until the window reopens.")
+    if start_time is not None and config.get("wittypi_daily_schedule", DEFAULT_WITTYPI_DAILY_SCHEDULE):
+        from wpi_schedule import DailySchedule
+        daily_schedule = DailySchedule(decode_time_interval(encoded_time), int(deep_sleep_interval))
+
+    def next_wake_for_cycle():
+        """(interval, explicit_startup_time) for handle_deep_sleep at the end of a
+        cycle. Out-of-hours → wake at the next working-window start; in-hours →
+        the normal now+interval (explicit None)."""
+        if out_of_hours:
+            morning = get_next_start_time_from_start(start_time) if start_time is not None else None
+            return default_deep_sleep_interval, morning
+        return deep_sleep_interval, None
+
+    # Capture photo
+    frame, error_message = graph.result("capture")
+
+    # The OTA check may exec the new version, so it only runs once the capture
+    # is done (no point re-exec'ing in the middle of it).
+    if settings.run_update:
+        # A persistent backend's camera would stay claimed across the exec.
+        camera_backend.close()
+        from update_repository import check_and_update_repository
+        check_and_update_repository(config, before_exec=prepare_exec)
+
+    if frame is None:
+        # Camera hardware is dead — still push the rest of the telemetry so the
+        # dashboard shows fresh time/wifi/ip/version, not stale values from the
+        # last cycle when capture was still working.
+        push_telemetry(
+            status="Camera hardware error",
+            error=f"Camera fail: {(error_message or '')[:180]}",
+            interval=deep_sleep_interval,
+            time_range_val=time_range,
+        )
+        fail_interval, fail_startup = next_wake_for_cycle()
+        handle_deep_sleep(fail_interval, startup_time_str=fail_startup)
+
+    # Person detection
+    person_detected, upload_tags = graph.result("detect")
+
+    # Upload photo
+    frame = graph.result("overlay")
+    if preview_first:
+        secure_url, preview_seconds = graph.result("upload")
+    else:
+        secure_url = graph.result("upload")
+    from blynk import flush_outbox, update_blynk_batch, update_blynk_url
+
+    with span("telemetry"):
+        wifi_signal = get_wifi_signal_strength()
+        ip_address = get_ip_address()
+
+        if secure_url:
+            update_blynk_url(secure_url, blynk_camera_auth, config["blynk_camera_image_pin"])
+            if preview_first:
+                # The dashboard shows the preview while the original goes up.
+                flush_outbox()
+
+    # upload_photo spools what it fails to send; a failed preview leaves the
+    # original to spool here.
+    if preview_first and not secure_url:
+        spool_frame(frame, (person_detected, upload_tags))
+    elif preview_first:
+        with span("original"):
+            deliver_original(frame, (person_detected, upload_tags), preview_seconds)
+
+    # Person-triggered continuous monitoring only makes sense within working
+    # hours; outside the window we always take the single photo above and then
+    # sleep until the window reopens. The burst runs in this process, with
+    # everything already imported and synced.
+    if person_detected and not out_of_hours:
+        print("Person detected! Switching to burst mode.")
+        with span("burst"):
+            burst_stats = run_person_burst(graph.result("temperature"))
+        if burst_stats.stop_reason == STOP_MAX_DURATION:
+            # Still someone in view — wake again as soon as WittyPi allows.
+            deep_sleep_interval = sleep_interval_person_detected
+    if not out_of_hours and deep_sleep_interval != sleep_interval_person_detected:
+        deep_sleep_interval = plan_interval(
+            deep_sleep_interval, person_detected, decode_time_interval(encoded_time)
+        )
+
+    # The link works — catch up on frames spooled by earlier cycles. Originals
+    # deferred by preview-first mode wait for a link they fit through.
+    if secure_url and (not preview_first or originals_fit(len(frame.encode()), preview_seconds)):
+        with span("spool_drain"):
+            spool.drain(
+                upload_spooled,
+                config.get("spool_drain_budget_seconds", DEFAULT_SPOOL_DRAIN_BUDGET_SECONDS),
+                order=config.get("spool_drain_order", spool.ORDER_DETECTIONS),
+            )
+
+    # Decide the next wakeup (used both for the dashboard and the actual sleep).
+    cycle_interval, cycle_startup = next_wake_for_cycle()
+    startup_time_str = cycle_startup or get_next_start_time(cycle_interval)
+    updates = {
+        config["blynk_camera_human_detected_pin"]: 1 if person_detected else 0,
+        config["blynk_camera_wifi_signal_pin"]: wifi_signal if wifi_signal else None,
+        config["blynk_camera_ip_pin"]: ip_address if ip_address else None,
+        config["blynk_camera_pin_current_time"]: get_current_time(),
+        config["blynk_camera_pin_setted_working_time"]: time_range,
+        config["blynk_camera_deep_sleep_interval_setted_pin"]: deep_sleep_interval,
+        config["blynk_camera_version_pin"]: version,
+        config["blynk_camera_next_start_time_pin"]: startup_time_str,
+        config["blynk_camera_status_pin"]: "OK (mimo pracovní dobu)" if out_of_hours else "OK",
+        config["blynk_camera_error_pin"]: ""
+    }
+    updates = {pin: value for pin, value in updates.items() if value is not None}
+    update_blynk_batch(updates, config["blynk_camera_auth"])
+
+    with span("prefetch"):
+        prefetch_settings(cycle_interval if cycle_startup is None else None)
+
+    handle_deep_sleep(cycle_interval, startup_time_str=cycle_startup)
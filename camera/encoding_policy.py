@@ -0,0 +1,173 @@
+"""Pick how a frame is encoded for upload, to fit an upload time budget.
+
+With `upload_budget_seconds` set, the frame is encoded at the best rung of
+LADDER whose predicted upload time fits it:
+
+- the uplink throughput is the median of recent uploads made at a similar
+  signal level (get_wifi_signal_strength), or, until there are enough of
+  those, a guess from the signal alone (SIGNAL_THROUGHPUT);
+- a rung's size is the original's times its size ratio, learned from what
+  earlier encodes at that rung actually produced;
+- frames with a detection get DETECTION_BUDGET_FACTOR times the budget and
+  never go below DETECTION_MIN_RUNG.
+
+WebP rungs are only used with `"upload_webp": true` in config.json. Every
+upload is logged (rung, bytes, seconds, signal), which is the history the
+next estimates come from. Recent log:
+
+    python3 encoding_policy.py [entries]
+"""
+
+import io
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+
+from utils import STATE_DIR, load_state, save_state
+
+STATE_PATH = os.path.join(STATE_DIR, "encoding_policy.json")
+
+
+@dataclass(frozen=True)
+class Rung:
+    name: str
+    scale: float = 1.0
+    quality: int = None     # None: the frame's own bytes, no re-encode
+    progressive: bool = False
+    webp: bool = False
+    # Size relative to the original until the log knows better.
+    prior_ratio: float = 1.0
+
+
+# Best first.
+LADDER = (
+    Rung("original"),
+    Rung("full_q75_progressive", 1.0, 75, True, prior_ratio=0.45),
+    Rung("full_q60_progressive", 1.0, 60, True, prior_ratio=0.33),
+    Rung("full_webp_q60", 1.0, 60, webp=True, prior_ratio=0.22),
+    Rung("half_q75_progressive", 0.5, 75, True, prior_ratio=0.13),
+    Rung("half_webp_q60", 0.5, 60, webp=True, prior_ratio=0.07),
+    Rung("quarter_q60_progressive", 0.25, 60, True, prior_ratio=0.03),
+)
+DETECTION_MIN_RUNG = "half_q75_progressive"
+# The Blynk image pin's thumbnail in preview-first mode (cycle.py).
+PREVIEW = Rung("preview", 0.25, 70, True, prior_ratio=0.04)
+DETECTION_BUDGET_FACTOR = 3
+
+# Uplink bytes/s of a Pi Zero 2 W by RSSI (dBm), weakest last; a guess until
+# uploads at that signal level have been logged.
+SIGNAL_THROUGHPUT = ((-55, 800_000), (-62, 500_000), (-68, 250_000), (-74, 100_000),
+                     (-80, 40_000), (-200, 15_000))
+UNKNOWN_SIGNAL_THROUGHPUT = 100_000
+SIMILAR_SIGNAL_DB = 5
+MIN_SIMILAR_UPLOADS = 3
+HISTORY_MAX_AGE_SECONDS = 3 * 86400
+LOG_SIZE = 200
+RATIO_SMOOTHING = 0.3
+
+
+def signal_throughput(signal_dbm):
+    if signal_dbm is None:
+        return UNKNOWN_SIGNAL_THROUGHPUT
+    for floor, throughput in SIGNAL_THROUGHPUT:
+        if signal_dbm >= floor:
+            return throughput
+    return SIGNAL_THROUGHPUT[-1][1]
+
+
+class EncodingPolicy:
+    def __init__(self, state=None):
+        state = state or {}
+        # {"t", "rung", "bytes", "seconds", "signal"} per upload, oldest first.
+        self.log = state.get("log", [])
+        # Learned size ratio (encoded / original) per rung name.
+        self.ratios = state.get("ratios", {})
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        return cls(load_state(path, {}) or {})
+
+    def save(self, path=STATE_PATH):
+        save_state(path, {"log": self.log[-LOG_SIZE:], "ratios": self.ratios})
+
+    def throughput(self, signal_dbm, now=None):
+        """(bytes/s, source) expected for an upload at `signal_dbm`."""
+        now = now or time.time()
+        similar = [e["bytes"] / e["seconds"] for e in self.log
+                   if e["seconds"] > 0 and now - e["t"] <= HISTORY_MAX_AGE_SECONDS
+                   and signal_dbm is not None and e["signal"] is not None
+                   and abs(e["signal"] - signal_dbm) <= SIMILAR_SIGNAL_DB]
+        if len(similar) >= MIN_SIMILAR_UPLOADS:
+            return statistics.median(similar), f"{len(similar)} uploads at {signal_dbm} dBm"
+        if signal_dbm is None:
+            return signal_throughput(signal_dbm), "guess, signal unknown"
+        return signal_throughput(signal_dbm), f"guess for {signal_dbm} dBm"
+
+    def ratio(self, rung):
+        return self.ratios.get(rung.name, rung.prior_ratio)
+
+    def choose(self, original_bytes, signal_dbm, budget_seconds, person_detected=False,
+               allow_webp=False, now=None):
+        """(rung, reason): the best rung whose predicted upload fits the
+        budget, or the smallest one allowed if none does."""
+        throughput, source = self.throughput(signal_dbm, now)
+        budget = budget_seconds * (DETECTION_BUDGET_FACTOR if person_detected else 1)
+        rungs = [r for r in LADDER if allow_webp or not r.webp]
+        if person_detected:
+            floor = [r.name for r in LADDER].index(DETECTION_MIN_RUNG)
+            rungs = [r for r in rungs if LADDER.index(r) <= floor]
+        for rung in rungs:
+            seconds = original_bytes * self.ratio(rung) / throughput
+            if seconds <= budget:
+                break
+        return rung, f"~{seconds:.0f}s of {budget:.0f}s at {throughput / 1024:.0f} KB/s ({source})"
+
+    def record(self, rung, original_bytes, encoded_bytes, seconds, signal_dbm, now=None):
+        """Log an upload, and what the rung's encode came to."""
+        if rung.quality is not None and original_bytes:
+            ratio = encoded_bytes / original_bytes
+            previous = self.ratios.get(rung.name)
+            self.ratios[rung.name] = ratio if previous is None else (
+                RATIO_SMOOTHING * ratio + (1 - RATIO_SMOOTHING) * previous
+            )
+        self.log.append({"t": now or time.time(), "rung": rung.name, "bytes": encoded_bytes,
+                         "seconds": round(seconds, 2), "signal": signal_dbm})
+        self.log = self.log[-LOG_SIZE:]
+
+
+def encode(jpeg, rung):
+    """`jpeg` re-encoded at `rung`; returns (bytes, file extension)."""
+    if rung.quality is None:
+        return jpeg, "jpg"
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(jpeg))
+    size = (max(1, int(image.width * rung.scale)), max(1, int(image.height * rung.scale)))
+    if rung.scale < 1:
+        # Let libjpeg decode at 1/2, 1/4 ... scale instead of the full 8 MP.
+        image.draft("RGB", size)
+        image = image.convert("RGB").resize(size, Image.BILINEAR)
+    out = io.BytesIO()
+    if rung.webp:
+        image.save(out, format="WEBP", quality=rung.quality, method=0)
+        return out.getvalue(), "webp"
+    image.convert("RGB").save(out, format="JPEG", quality=rung.quality,
+                              progressive=rung.progressive, optimize=rung.progressive)
+    return out.getvalue(), "jpg"
+
+
+def print_log(entries=20, path=STATE_PATH):
+    policy = EncodingPolicy.load(path)
+    if not policy.log:
+        print(f"No uploads logged in {path}")
+        return
+    print(f"{'rung':<26}{'KB':>8}{'s':>7}{'KB/s':>8}{'dBm':>6}")
+    for e in policy.log[-entries:]:
+        rate = e["bytes"] / 1024 / e["seconds"] if e["seconds"] else 0
+        print(f"{e['rung']:<26}{e['bytes'] / 1024:>8.0f}{e['seconds']:>7.1f}{rate:>8.0f}{str(e['signal']):>6}")
+
+
+if __name__ == "__main__":
+    print_log(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
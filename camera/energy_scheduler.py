@@ -0,0 +1,201 @@
+"""Energy-aware wake interval.
+
+By default the camera wakes every Blynk deep-sleep interval, whatever that
+costs. With `energy_budget_wh_per_day` in config.json the in-hours interval
+is picked here instead, so that the rest of today's working window fits the
+rest of today's energy budget, spent where people are likely:
+
+- a wake costs the median awake time of recent cycles (plus boot and
+  shutdown) at AWAKE_POWER_W;
+- every hour of the day gets a weight from the detection history (a
+  smoothed, slowly decaying hit rate), and the wakes the budget still
+  affords are spread over the rest of the window in proportion: short
+  intervals in the hours people usually show up, long ones otherwise;
+- right after a detection the interval drops to RECENT_DETECTION_INTERVAL;
+- a sagging WittyPi input voltage stretches the interval.
+
+Never below MIN_STARTUP_MARGIN_SECONDS, never above MAX_INTERVAL_SECONDS.
+Burst mode's "wake again right away" still overrides it (cycle.py).
+
+The cycle log in STATE_DIR doubles as recorded input for a replay of the
+last logged day, fixed interval vs. this scheduler (run on the Pi, or on a
+copy of the log):
+
+    python3 energy_scheduler.py budget_wh [fixed_interval] [cycles.json]
+"""
+
+import os
+import statistics
+import sys
+from datetime import datetime, timedelta
+
+from utils import MIN_STARTUP_MARGIN_SECONDS, STATE_DIR, load_state, save_state
+
+STATE_PATH = os.path.join(STATE_DIR, "energy_scheduler.json")
+
+AWAKE_POWER_W = 1.2          # Pi Zero 2 W + camera module, busy
+SLEEP_POWER_W = 0.01         # WittyPi 4 Mini standby with the Pi off
+BOOT_SHUTDOWN_SECONDS = 35   # boot before main.py starts + WittyPi's power-cut delay
+DEFAULT_AWAKE_SECONDS = 40   # until the log has cycles
+AWAKE_SAMPLE = 20            # median awake time over this many recent cycles
+MAX_INTERVAL_SECONDS = 3600
+RECENT_DETECTION_SECONDS = 900
+RECENT_DETECTION_INTERVAL = 120
+ACTIVITY_FLOOR = 0.1         # weight of an hour nobody ever shows up in
+ACTIVITY_HALF_LIFE_DAYS = 7
+# WittyPi input of a 5 V supply: sagging, and nearly flat.
+LOW_VOLTAGE = 4.6
+LOW_VOLTAGE_STRETCH = 3
+CRITICAL_VOLTAGE = 4.3
+CYCLE_LOG_SIZE = 600         # ~2 days of 5-minute wakes
+# Replay: a logged detection means someone was in view this long around it.
+VISIT_SECONDS = 300
+
+
+def _wake_energy_wh(awake_seconds):
+    return (awake_seconds + BOOT_SHUTDOWN_SECONDS) * AWAKE_POWER_W / 3600
+
+
+class EnergyScheduler:
+    def __init__(self, state=None):
+        state = state or {}
+        # {"t", "awake", "person", "voltage"} per cycle, oldest first.
+        self.cycles = state.get("cycles", [])
+        # [wakes, hits] per hour of the day, decayed with ACTIVITY_HALF_LIFE_DAYS.
+        self.hours = state.get("hours") or [[0.0, 0.0] for _ in range(24)]
+        self.decayed_at = state.get("decayed_at")
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        return cls(load_state(path, {}) or {})
+
+    def save(self, path=STATE_PATH):
+        save_state(path, {
+            "cycles": self.cycles[-CYCLE_LOG_SIZE:],
+            "hours": self.hours,
+            "decayed_at": self.decayed_at,
+        })
+
+    def record(self, now, awake_seconds, person_detected, voltage=None):
+        """Log a finished (or finishing) cycle."""
+        if self.decayed_at is not None:
+            factor = 0.5 ** ((now - self.decayed_at) / 86400 / ACTIVITY_HALF_LIFE_DAYS)
+            self.hours = [[wakes * factor, hits * factor] for wakes, hits in self.hours]
+        self.decayed_at = now
+        hour = self.hours[datetime.fromtimestamp(now).hour]
+        hour[0] += 1
+        hour[1] += 1 if person_detected else 0
+        self.cycles.append({"t": now, "awake": round(awake_seconds, 1),
+                            "person": bool(person_detected), "voltage": voltage})
+        self.cycles = self.cycles[-CYCLE_LOG_SIZE:]
+
+    def hour_weight(self, hour):
+        wakes, hits = self.hours[hour]
+        return ACTIVITY_FLOOR + (hits + 0.5) / (wakes + 1)
+
+    def wake_energy_wh(self):
+        awake = [c["awake"] for c in self.cycles[-AWAKE_SAMPLE:]]
+        return _wake_energy_wh(statistics.median(awake) if awake else DEFAULT_AWAKE_SECONDS)
+
+    def spent_today_wh(self, now):
+        today = datetime.fromtimestamp(now).date()
+        return sum(_wake_energy_wh(c["awake"]) for c in self.cycles
+                   if datetime.fromtimestamp(c["t"]).date() == today)
+
+    def interval(self, now, window, budget_wh, voltage=None):
+        """(seconds, reason) until the next wake. `window` is the working
+        window as (start, end) timedeltas since midnight (utils.decode_time_interval)."""
+        if voltage is not None and voltage < CRITICAL_VOLTAGE:
+            return MAX_INTERVAL_SECONDS, f"input at {voltage:.2f} V"
+        local = datetime.fromtimestamp(now)
+        end = local.replace(hour=0, minute=0, second=0, microsecond=0) + window[1]
+
+        # Activity-weighted seconds left in the window, hour by hour.
+        weighted, t = 0.0, local
+        while t < end:
+            next_hour = t.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            weighted += (min(next_hour, end) - t).total_seconds() * self.hour_weight(t.hour)
+            t = next_hour
+        wakes_left = (budget_wh - SLEEP_POWER_W * 24 - self.spent_today_wh(now)) / self.wake_energy_wh()
+        weight = self.hour_weight(local.hour)
+        if wakes_left < 1 or weighted <= 0:
+            interval, reason = MAX_INTERVAL_SECONDS, "today's budget is spent"
+        else:
+            interval = weighted / wakes_left / weight
+            reason = f"{wakes_left:.0f} wakes left in today's budget, hour weight {weight:.2f}"
+
+        if any(c["person"] and now - c["t"] <= RECENT_DETECTION_SECONDS for c in self.cycles):
+            interval, reason = min(interval, RECENT_DETECTION_INTERVAL), "recent detection"
+        if voltage is not None and voltage < LOW_VOLTAGE:
+            interval *= LOW_VOLTAGE_STRETCH
+            reason += f", input at {voltage:.2f} V"
+        return int(min(max(interval, MIN_STARTUP_MARGIN_SECONDS), MAX_INTERVAL_SECONDS)), reason
+
+
+# ---- Replay --------------------------------------------------------------------
+
+
+def simulate(cycles, budget_wh, fixed_interval=None, window=None):
+    """Replay the last day in `cycles` (the scheduler's cycle log format)
+    under a fixed interval and under the scheduler, which learns from the
+    earlier days first. Each simulated wake takes the awake time and input
+    voltage of the nearest logged cycle and sees a person if it falls
+    within VISIT_SECONDS around a logged detection.
+
+    Returns {policy: {"wakes", "energy_wh", "visits_seen", "visits"}}."""
+    cycles = sorted(cycles, key=lambda c: c["t"])
+    last_day = datetime.fromtimestamp(cycles[-1]["t"]).date()
+    history = [c for c in cycles if datetime.fromtimestamp(c["t"]).date() < last_day]
+    day = [c for c in cycles if datetime.fromtimestamp(c["t"]).date() == last_day]
+    start, end = day[0]["t"], day[-1]["t"]
+    if window is None:
+        midnight = datetime.combine(last_day, datetime.min.time())
+        window = (datetime.fromtimestamp(start) - midnight, datetime.fromtimestamp(end) - midnight)
+    if fixed_interval is None:
+        gaps = [b["t"] - a["t"] - a["awake"] for a, b in zip(day, day[1:])]
+        fixed_interval = statistics.median(gaps) if gaps else 300
+    visits = [c["t"] for c in day if c["person"]]
+
+    def replay(next_interval):
+        scheduler = EnergyScheduler()
+        for c in history:
+            scheduler.record(c["t"], c["awake"], c["person"], c.get("voltage"))
+        t, wakes, energy, seen = start, 0, SLEEP_POWER_W * 24, set()
+        while t <= end:
+            nearest = min(day, key=lambda c: abs(c["t"] - t))
+            in_view = [v for v in visits if abs(t - v) <= VISIT_SECONDS / 2]
+            seen.update(in_view)
+            wakes += 1
+            energy += _wake_energy_wh(nearest["awake"])
+            scheduler.record(t, nearest["awake"], bool(in_view), nearest.get("voltage"))
+            t += nearest["awake"] + next_interval(scheduler, t, nearest)
+        return {"wakes": wakes, "energy_wh": energy, "visits_seen": len(seen), "visits": len(visits)}
+
+    return {
+        f"fixed {fixed_interval:.0f}s": replay(lambda s, t, c: fixed_interval),
+        "energy scheduler": replay(lambda s, t, c: s.interval(t, window, budget_wh, c.get("voltage"))[0]),
+    }
+
+
+def print_replay(budget_wh, fixed_interval=None, path=STATE_PATH):
+    cycles = load_state(path, {})
+    cycles = cycles.get("cycles") if isinstance(cycles, dict) else cycles
+    if not cycles:
+        print(f"No logged cycles in {path}")
+        return
+    print(f"Replay of {datetime.fromtimestamp(max(c['t'] for c in cycles)).date()}, "
+          f"budget {budget_wh:.1f} Wh/day")
+    for policy, r in simulate(cycles, budget_wh, fixed_interval).items():
+        print(f"  {policy:<18} {r['wakes']:>5} wakes  {r['energy_wh']:6.2f} Wh  "
+              f"{r['visits_seen']}/{r['visits']} detections caught")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1].strip())
+        sys.exit(1)
+    print_replay(
+        float(sys.argv[1]),
+        float(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] else None,
+        sys.argv[3] if len(sys.argv) > 3 else STATE_PATH,
+    )
@@ -0,0 +1,114 @@
+"""In-memory frame carried from capture to upload.
+
+A Frame keeps the captured JPEG bytes and decodes them at most once, into
+whichever library touches the pixels first:
+
+- detection on: one cv2.imdecode → BGR ndarray; boxes are drawn into it and
+  the label patch is pasted into it (no PIL round-trip of the whole image);
+- detection off: one PIL decode, label drawn in place.
+
+A frame nobody drew on doesn't need decoding at all for the label: it's
+stamped into the JPEG bytes directly (jpeg_overlay.py). encode() produces
+the final JPEG once (and returns the captured bytes as-is if nothing
+touched the pixels). Nothing is written to disk unless the frame has to be
+spooled.
+"""
+
+import io
+
+# PIL's default, i.e. what add_text_to_image's img.save() always produced.
+JPEG_QUALITY = 75
+
+
+class Frame:
+    def __init__(self, jpeg, name="photo.jpg"):
+        self.jpeg = jpeg
+        self.name = name
+        self._array = None      # BGR ndarray (cv2 layout)
+        self._pil = None        # PIL.Image
+        self._dirty = False
+        self._encoded = None
+
+    @classmethod
+    def from_file(cls, path, name=None):
+        with open(path, "rb") as f:
+            return cls(f.read(), name or "photo.jpg")
+
+    def array(self):
+        """The pixels as a BGR ndarray, decoded on first use. Callers that
+        draw into it must call touch() afterwards."""
+        if self._array is None:
+            import cv2
+            import numpy as np
+            if self._pil is not None:
+                # Already decoded by PIL — convert instead of decoding twice.
+                self._array = cv2.cvtColor(np.asarray(self._pil.convert("RGB")), cv2.COLOR_RGB2BGR)
+                self._pil = None
+            else:
+                self._array = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if self._array is None:
+                    raise ValueError("frame is not a decodable JPEG")
+        return self._array
+
+    @property
+    def dirty(self):
+        """True when the pixels changed since `jpeg` was produced."""
+        return self._dirty
+
+    def touch(self):
+        """Mark the pixels as changed, so encode() re-encodes."""
+        self._dirty = True
+        self._encoded = None
+
+    def paste(self, patch, position):
+        """Paste a PIL RGB image at (x, y), clipped to the frame. Works on
+        whichever decoded form already exists; decodes with PIL otherwise."""
+        if self._array is None and self._pil is None:
+            from PIL import Image
+            self._pil = Image.open(io.BytesIO(self.jpeg))
+            self._pil.load()
+        self._paste_decoded(patch, position)
+        self.touch()
+
+    def replace_jpeg(self, jpeg, patch, position):
+        """Swap in JPEG bytes that were edited in the compressed domain (see
+        jpeg_overlay.py) by pasting `patch` at `position`. The frame stays
+        clean; pixels decoded earlier get the same paste so they keep
+        matching the bytes."""
+        self.jpeg = jpeg
+        self._encoded = None
+        self._paste_decoded(patch, position)
+
+    def _paste_decoded(self, patch, position):
+        x, y = position
+        if self._array is not None:
+            import numpy as np
+            h = min(patch.height, self._array.shape[0] - y)
+            w = min(patch.width, self._array.shape[1] - x)
+            if h > 0 and w > 0:
+                self._array[y:y + h, x:x + w] = np.asarray(patch.convert("RGB"))[:h, :w, ::-1]
+        elif self._pil is not None:
+            self._pil.paste(patch, (x, y))
+
+    def encode(self, quality=JPEG_QUALITY):
+        """Final JPEG bytes: the captured bytes untouched if nothing drew on
+        the frame, otherwise one encode, cached until the pixels change."""
+        if not self._dirty:
+            return self.jpeg
+        if self._encoded is not None:
+            return self._encoded
+        if self._array is not None:
+            import cv2
+            ok, buffer = cv2.imencode(".jpg", self._array, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise ValueError("JPEG encode failed")
+            self._encoded = buffer.tobytes()
+        else:
+            out = io.BytesIO()
+            self._pil.save(out, format="JPEG", quality=quality)
+            self._encoded = out.getvalue()
+        return self._encoded
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.encode())
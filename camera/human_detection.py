@@ -11,10 +11,15 @@ lower part, person at 5-10 m typically 100-250 px tall in full-res.
 """
 
 import logging
+import math
 import os
+import threading
 from dataclasses import dataclass
 
 import cv2
+import numpy as np
+
+import inference
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +37,19 @@ DETECTION_ZONE_TOP_RATIO = 0.32
 MIN_BOX_HEIGHT_RATIO = 0.08
 MIN_BOX_ASPECT_RATIO = 1.3
 
+# Inference mode. "single" squashes the whole frame into one 416x416 blob
+# (~8x downscale on 8 MP, a person 100 px tall shrinks to ~17 px). "tiled"
+# adds overlapping TILE_SIZE tiles covering only the zone of interest, run in
+# the same batch as the full-frame blob, and merges all boxes in full-image
+# coordinates. More compute, better recall on distant people — compare with
+# `python3 bench.py detection`.
+INFERENCE_MODE = "single"
+TILE_SIZE = 1280          # tile edge in full-res px, scaled to INPUT_SIZE
+TILE_OVERLAP = 256        # ≥ a typical person height: every person fits one tile whole
+# A box touching a tile's inner edge is cut off; it's dropped when this
+# fraction of it lies inside another kept box (the whole person).
+TILE_CONTAINMENT = 0.6
+
 # Debug visualization: draw rejected candidates as red boxes with reason label.
 # Set False once tuning is dialed in — the gallery will only show accepted hits.
 DRAW_REJECTED_CANDIDATES = True
@@ -52,27 +70,27 @@ _WEIGHTS_PATH = os.path.join(_MODEL_DIR, "yolo", "yolov4-tiny.weights")
 # YOLO weights are ~23 MB. Loading them per call (each detection cycle) eats
 # 200-400 ms of disk I/O on a Pi Zero 2 W. With detection re-firing every 1 s
 # in continuous-monitoring mode, that adds up fast. Load once, reuse.
-_NET = None
-_OUTPUT_LAYERS = None
-
-
-def _get_net():
-    global _NET, _OUTPUT_LAYERS
-    if _NET is not None:
-        return _NET, _OUTPUT_LAYERS
-    try:
-        net = cv2.dnn.readNetFromDarknet(_CONFIG_PATH, _WEIGHTS_PATH)
-        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-        layer_names = net.getLayerNames()
-        output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
-    except cv2.error as e:
-        logger.exception("YOLO model load failed: %s", e)
-        return None, None
-    _NET = net
-    _OUTPUT_LAYERS = output_layers
-    logger.info("YOLO model loaded and cached")
-    return _NET, _OUTPUT_LAYERS
+# Across processes, the ONNX Runtime backends load a prepared ORT-format model
+# (see inference.py, `python3 bench.py model_load`). Which runtime runs the model
+# (OpenCV DNN, ONNX Runtime, INT8) is picked per device by inference.py.
+_DETECTOR = None
+# cycle.py's preload task and the detect task can both get here first.
+_DETECTOR_LOCK = threading.Lock()
+
+
+def _get_detector():
+    global _DETECTOR
+    with _DETECTOR_LOCK:
+        if _DETECTOR is not None:
+            return _DETECTOR
+        try:
+            detector = inference.load_detector(_CONFIG_PATH, _WEIGHTS_PATH)
+        except inference.BackendUnavailable as e:
+            logger.exception("YOLO model load failed: %s", e)
+            return None
+        _DETECTOR = detector
+    logger.info("YOLO model loaded and cached (%s, %d threads)", detector.name, detector.threads)
+    return _DETECTOR
 
 
 # ---- Data --------------------------------------------------------------------
@@ -94,8 +112,9 @@ class Detection:
 # ---- Detection ---------------------------------------------------------------
 
 
-def _evaluate_box(box, confidence, image_h, image_w):
-    """Return rejection reason or None if the box passes all filters.
+def _evaluate_boxes(boxes, confidences, image_h, image_w):
+    """Rejection reason per box (None = passes all filters), for an (N, 4)
+    int array of (x, y, w, h) boxes and their confidences.
 
     `above_zone` is checked first (priority) so a low-confidence detection
     in tree foliage gets that label instead of `low_conf` — that lets
@@ -103,16 +122,14 @@ def _evaluate_box(box, confidence, image_h, image_w):
     other reject reasons. Tag-level info (cand_above_zone) is still
     persisted regardless.
     """
-    x, y, w, h = box
-    if (y + h) < image_h * DETECTION_ZONE_TOP_RATIO:
-        return "above_zone"
-    if confidence < PERSON_CONFIDENCE_THRESHOLD:
-        return "low_conf"
-    if h < image_h * MIN_BOX_HEIGHT_RATIO:
-        return "too_small"
-    if h / max(w, 1) < MIN_BOX_ASPECT_RATIO:
-        return "wrong_aspect"
-    return None
+    x, y, w, h = boxes.T
+    reasons = np.full(len(boxes), None, dtype=object)
+    # Lowest priority first, so higher-priority reasons overwrite.
+    reasons[h / np.maximum(w, 1) < MIN_BOX_ASPECT_RATIO] = "wrong_aspect"
+    reasons[h < image_h * MIN_BOX_HEIGHT_RATIO] = "too_small"
+    reasons[confidences < PERSON_CONFIDENCE_THRESHOLD] = "low_conf"
+    reasons[(y + h) < image_h * DETECTION_ZONE_TOP_RATIO] = "above_zone"
+    return reasons
 
 
 def detect_persons(image_path):
@@ -121,8 +138,7 @@ def detect_persons(image_path):
     Returns (image, accepted, rejected) where image is the loaded ndarray
     (None if load failed) and the two lists hold Detection objects.
     """
-    net, output_layers = _get_net()
-    if net is None:
+    if _get_detector() is None:
         return None, [], []
 
     image = cv2.imread(image_path)
@@ -130,40 +146,141 @@ def detect_persons(image_path):
         logger.warning("Image not found or invalid: %s", image_path)
         return None, [], []
 
+    accepted, rejected = detect_persons_in_image(image)
+    return image, accepted, rejected
+
+
+def _tiles(image_w, image_h):
+    """(x, y, w, h) tiles covering the zone of interest, plus a TILE_OVERLAP
+    band above it for the heads of people standing at its top edge."""
+    top = max(0, int(image_h * DETECTION_ZONE_TOP_RATIO) - TILE_OVERLAP)
+    size = min(TILE_SIZE, image_w, image_h - top)
+    overlap = min(TILE_OVERLAP, size // 2)
+
+    def starts(origin, length):
+        count = max(1, math.ceil((length - overlap) / (size - overlap)))
+        if count == 1:
+            return [origin]
+        return [origin + round(i * (length - size) / (count - 1)) for i in range(count)]
+
+    return [(x, y, size, size) for y in starts(top, image_h - top) for x in starts(0, image_w)]
+
+
+def _batch_item(output, index, batch_size):
+    """Rows of one image from a batched YOLO output. OpenCV returns
+    (batch, rows, 85) in newer versions and stacks the rows in older ones."""
+    if output.ndim == 3:
+        return output[index]
+    rows = output.shape[0] // batch_size
+    return output[index * rows:(index + 1) * rows]
+
+
+def _touches_inner_edge(boxes, region, image_w, image_h, margin=2):
+    """Per box: does it run into an edge of `region` that isn't the image
+    border, i.e. did the tile cut the object off?"""
+    x, y, w, h = boxes.T
+    rx, ry, rw, rh = region
+    return (((rx > 0) & (x <= rx + margin))
+            | ((ry > 0) & (y <= ry + margin))
+            | ((rx + rw < image_w) & (x + w >= rx + rw - margin))
+            | ((ry + rh < image_h) & (y + h >= ry + rh - margin)))
+
+
+def _contained(inner, outer):
+    """Fraction of each `inner` box's area that lies inside each `outer`
+    box: (N, 4) × (M, 4) → (N, M)."""
+    inner, outer = inner[:, None, :], outer[None, :, :]
+    ix = np.minimum(inner[..., 0] + inner[..., 2], outer[..., 0] + outer[..., 2]) - np.maximum(inner[..., 0], outer[..., 0])
+    iy = np.minimum(inner[..., 1] + inner[..., 3], outer[..., 1] + outer[..., 3]) - np.maximum(inner[..., 1], outer[..., 1])
+    return np.clip(ix, 0, None) * np.clip(iy, 0, None) / np.maximum(inner[..., 2] * inner[..., 3], 1)
+
+
+def detect_persons_in_image(image, mode=None, regions=None):
+    """Same as detect_persons() but on an already decoded BGR ndarray (the
+    in-memory Frame pipeline). `mode` overrides INFERENCE_MODE; `regions`
+    ((x, y, w, h) crops, from the scene-change gate) replaces the full frame
+    and tiles. Returns (accepted, rejected)."""
+    detector = _get_detector()
+    if detector is None:
+        return [], []
+
+    mode = mode or INFERENCE_MODE
     image_h, image_w = image.shape[:2]
-    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, INPUT_SIZE, swapRB=True, crop=False)
-    net.setInput(blob)
-    outputs = net.forward(output_layers)
-
-    # Collect raw person-class candidates. We use scores[0] directly (COCO
-    # class 0 = person) instead of argmax — the previous argmax approach would
-    # silently drop a valid person detection if any other class scored higher
-    # on the same anchor (e.g. a horse at conf 0.6 masking a person at 0.55).
-    boxes = []
-    confidences = []
-    for output in outputs:
-        for detection in output:
-            # detection layout: [cx, cy, w, h, objectness, class_0, class_1, ...]
-            # COCO class 0 = person. Read the person score directly (matches the
-            # OpenCV YOLO sample convention) instead of argmax-ing over all
-            # classes — the previous argmax approach silently dropped a valid
-            # person detection if any other class scored higher on the same
-            # anchor (e.g. horse 0.6 masking person 0.55).
-            person_confidence = float(detection[5])
-            if person_confidence <= 0.05:
+    if regions:
+        mode = "regions"
+        regions = [(x, y, min(w, image_w - x), min(h, image_h - y)) for x, y, w, h in regions]
+    else:
+        regions = [(0, 0, image_w, image_h)]
+        if mode == "tiled":
+            regions += _tiles(image_w, image_h)
+    # One forward pass for the full frame and all tiles.
+    blob = cv2.dnn.blobFromImages(
+        [image[y:y + h, x:x + w] for x, y, w, h in regions],
+        1 / 255.0, INPUT_SIZE, swapRB=True, crop=False,
+    )
+    outputs = detector.forward(blob)
+    accepted, rejected = _postprocess(outputs, regions, image_w, image_h)
+
+    logger.info(
+        "Detection (%s, %d blob%s): accepted=%d (max_conf=%.2f) rejected=%d (reasons=%s)",
+        mode,
+        len(regions),
+        "s" if len(regions) > 1 else "",
+        len(accepted),
+        max((d.confidence for d in accepted), default=0.0),
+        len(rejected),
+        ",".join(sorted({d.rejected_reason for d in rejected})) or "none",
+    )
+
+    return accepted, rejected
+
+
+def _candidates(outputs, regions, image_w, image_h):
+    """Raw person-class candidates from the YOLO outputs, in full-image
+    coordinates: (boxes (N, 4) int, confidences (N,) float32, truncated (N,)
+    bool), in output order.
+
+    Row layout: [cx, cy, w, h, objectness, class_0, class_1, ...]. COCO class
+    0 = person. Read the person score directly (matches the OpenCV YOLO
+    sample convention) instead of argmax-ing over all classes — the previous
+    argmax approach silently dropped a valid person detection if any other
+    class scored higher on the same anchor (e.g. horse 0.6 masking person
+    0.55)."""
+    boxes, confidences, truncated = [], [], []
+    for n, region in enumerate(regions):
+        region_x, region_y, region_w, region_h = region
+        for output in outputs:
+            rows = _batch_item(output, n, len(regions))
+            rows = rows[rows[:, 5] > 0.05]
+            if not len(rows):
                 continue
-            box_norm = detection[0:4] * [image_w, image_h, image_w, image_h]
-            (cx, cy, w, h) = box_norm.astype("int")
-            x = int(cx - w / 2)
-            y = int(cy - h / 2)
-            boxes.append([x, y, int(w), int(h)])
-            confidences.append(person_confidence)
-
-    # NMS to merge overlapping boxes for the same physical person.
+            # Same rounding as int() per value: truncate the scaled centre and
+            # size, then truncate centre - size / 2.
+            cx, cy, w, h = (rows[:, 0:4] * [region_w, region_h, region_w, region_h]).astype(int).T
+            region_boxes = np.stack([
+                region_x + (cx - w / 2).astype(int),
+                region_y + (cy - h / 2).astype(int),
+                w, h,
+            ], axis=1)
+            boxes.append(region_boxes)
+            confidences.append(rows[:, 5])
+            truncated.append(_touches_inner_edge(region_boxes, region, image_w, image_h))
+    if not boxes:
+        return np.empty((0, 4), dtype=int), np.empty(0, dtype=np.float32), np.empty(0, dtype=bool)
+    return np.concatenate(boxes), np.concatenate(confidences), np.concatenate(truncated)
+
+
+def _postprocess(outputs, regions, image_w, image_h):
+    """Candidates → NMS → filters. Returns (accepted, rejected)."""
+    boxes, confidences, truncated = _candidates(outputs, regions, image_w, image_h)
+
+    # NMS in full-image coordinates merges overlapping boxes for the same
+    # physical person, across tiles too.
     accepted, rejected = [], []
-    if boxes:
+    if len(boxes):
+        box_list = boxes.tolist()
         indices = cv2.dnn.NMSBoxes(
-            boxes, confidences,
+            box_list, confidences.tolist(),
             score_threshold=0.05,           # keep low so weak candidates still go through filter pipeline below
             nms_threshold=NMS_IOU_THRESHOLD,
         )
@@ -172,25 +289,25 @@ def detect_persons(image_path):
             flat_indices = (
                 indices.flatten().tolist() if hasattr(indices, "flatten") else list(indices)
             )
-            for i in flat_indices:
-                box = tuple(boxes[i])
-                conf = confidences[i]
-                reason = _evaluate_box(box, conf, image_h, image_w)
-                det = Detection(box=box, confidence=conf, rejected_reason=reason)
+            # A tile-cut box inside a kept whole box is the same person
+            # again; IoU-based NMS misses it because the areas differ.
+            kept = np.array(flat_indices)
+            cut = kept[truncated[kept]]
+            if len(cut):
+                inside = _contained(boxes[cut], boxes[kept]) >= TILE_CONTAINMENT
+                inside[cut[:, None] == kept[None, :]] = False
+                dropped = set(cut[inside.any(axis=1)].tolist())
+                flat_indices = [i for i in flat_indices if i not in dropped]
+            reasons = _evaluate_boxes(
+                boxes[flat_indices], confidences[flat_indices].astype(np.float64), image_h, image_w)
+            kept_confidences = confidences[flat_indices].tolist()
+            for i, conf, reason in zip(flat_indices, kept_confidences, reasons):
+                det = Detection(box=tuple(box_list[i]), confidence=conf, rejected_reason=reason)
                 if reason is None:
                     accepted.append(det)
                 else:
                     rejected.append(det)
-
-    logger.info(
-        "Detection: accepted=%d (max_conf=%.2f) rejected=%d (reasons=%s)",
-        len(accepted),
-        max((d.confidence for d in accepted), default=0.0),
-        len(rejected),
-        ",".join(sorted({d.rejected_reason for d in rejected})) or "none",
-    )
-
-    return image, accepted, rejected
+    return accepted, rejected
 
 
 # ---- Drawing -----------------------------------------------------------------
@@ -0,0 +1,382 @@
+"""Inference backends for the person detector, picked once per device.
+
+human_detection only needs "input blob in, YOLO rows out". A backend turns
+an (N, 3, 416, 416) blob into the rows OpenCV's Darknet region layers emit
+([cx, cy, w, h, objectness, class scores...], one (N, rows, 85) array per
+head), so _postprocess stays the same whichever backend ran:
+
+- opencv            cv2.dnn on the Darknet cfg + weights (the original),
+                    with an explicit cv2.setNumThreads count
+- onnxruntime       ONNX Runtime CPU on an ONNX export of the same weights
+- onnxruntime_int8  the same, statically quantized to INT8
+
+The ONNX Runtime models are loaded from a prepared ORT-format copy
+(prepare()), optimized once for this CPU and used in place from the file's
+bytes, so model load stays short.
+
+Which one is fastest on a Pi Zero 2 W depends on the OpenCV build, the
+onnxruntime wheel and the thread count, so it's measured rather than
+guessed. calibrate() builds the ONNX models (yolo_export.py), times every
+backend × thread count and keeps the fastest one whose detections on the
+reference images agree with opencv's (fp32, the reference) at least
+ACCURACY_FLOOR. The choice goes to STATE_DIR, keyed by the model files and
+runtime versions, and holds until an OTA or package upgrade changes one of
+those. Calibrate on the Pi with
+
+    python3 inference.py
+
+(or set AUTO_CALIBRATE); without a current choice, opencv is used.
+"""
+
+import glob
+import importlib.metadata
+import os
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import yolo_export
+from utils import STATE_DIR, load_state, save_state
+
+MODELS_DIR = os.path.join(STATE_DIR, "models")
+CHOICE_PATH = os.path.join(STATE_DIR, "inference_backend.json")
+_CAMERA_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames with people in them, from the camera's own scene. Falls back to
+# the repo's sample image, which only checks the backends agree on "nobody".
+REFERENCE_DIR = os.path.join(_CAMERA_DIR, "yolo", "reference")
+FALLBACK_REFERENCE = os.path.join(_CAMERA_DIR, "img", "img.jpg")
+
+THREAD_CHOICES = (1, 2, 4)
+ACCURACY_FLOOR = 0.9        # F1 against the opencv fp32 detections
+MATCH_IOU = 0.5
+# Candidates weaker than this flicker between backends and don't matter.
+MATCH_MIN_CONFIDENCE = 0.3
+CALIBRATION_RUNS = 3
+# True: calibrate in the cycle's first detection after install/OTA (~1-2 min
+# of ONNX export, quantization and timing, on battery). False: use opencv
+# until `python3 inference.py` is run by hand.
+AUTO_CALIBRATE = False
+# OpenCV's region layer zeroes class scores at or below this.
+REGION_THRESHOLD = 0.2
+
+
+class BackendUnavailable(Exception):
+    pass
+
+
+def decode_heads(heads, yolo_layers, input_size):
+    """Raw (N, A × (5 + C), H, W) YOLO head maps → region-layer rows
+    (N, H × W × A, 5 + C), in OpenCV's order and with its maths: logistic
+    x/y with scale_x_y, exp w/h × anchor, class score × objectness."""
+    input_w, input_h = input_size
+    outputs = []
+    for head, layer in zip(heads, yolo_layers):
+        n, _, rows, cols = head.shape
+        anchors = np.array(layer["anchors"], dtype=np.float32)
+        raw = head.reshape(n, len(anchors), -1, rows, cols).transpose(0, 3, 4, 1, 2)
+        sig = 1 / (1 + np.exp(-raw))
+        scale = layer["scale_x_y"]
+        x = (np.arange(cols, dtype=np.float32)[None, None, :, None]
+             + sig[..., 0] * scale - (scale - 1) / 2) / cols
+        y = (np.arange(rows, dtype=np.float32)[None, :, None, None]
+             + sig[..., 1] * scale - (scale - 1) / 2) / rows
+        w = np.exp(raw[..., 2]) * anchors[:, 0] / input_w
+        h = np.exp(raw[..., 3]) * anchors[:, 1] / input_h
+        objectness = sig[..., 4]
+        scores = sig[..., 5:] * objectness[..., None]
+        scores[scores <= REGION_THRESHOLD] = 0
+        rows_out = np.concatenate([np.stack([x, y, w, h, objectness], axis=-1), scores], axis=-1)
+        outputs.append(rows_out.reshape(n, -1, rows_out.shape[-1]).astype(np.float32))
+    return outputs
+
+
+class OpenCVBackend:
+    name = "opencv"
+
+    def __init__(self, cfg_path, weights_path, threads, models_dir=MODELS_DIR):
+        self.threads = threads
+        cv2.setNumThreads(threads)
+        try:
+            net = cv2.dnn.readNetFromDarknet(cfg_path, weights_path)
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        except cv2.error as e:
+            raise BackendUnavailable(f"Darknet model load failed: {e}")
+        layer_names = net.getLayerNames()
+        self.net = net
+        self.output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
+
+    def forward(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward(self.output_layers)
+
+
+def _session_options(onnxruntime, threads):
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    # Saving an optimized model warns that it's hardware specific — it's
+    # built on the device that runs it, that's the point.
+    options.log_severity_level = 3
+    return options
+
+
+def prepare(onnx_path, prepared_path, threads=1):
+    """Optimize an ONNX model for this CPU and save it in ORT format: a
+    flatbuffer with the graph already fused and the weights already in
+    onnxruntime's layout, so loading it skips protobuf parsing and graph
+    optimization. Returns the session made on the way."""
+    import onnxruntime
+
+    tmp = f"{prepared_path}.tmp"
+    options = _session_options(onnxruntime, threads)
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.optimized_model_filepath = tmp
+    options.add_session_config_entry("session.save_model_format", "ORT")
+    session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    os.replace(tmp, prepared_path)
+    return session
+
+
+class OnnxRuntimeBackend:
+    name = "onnxruntime"
+    model_file = "yolov4-tiny.onnx"
+    prepared_file = "yolov4-tiny.ort"
+
+    def __init__(self, cfg_path, weights_path, threads, models_dir=MODELS_DIR):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise BackendUnavailable("onnxruntime is not installed")
+        path = os.path.join(models_dir, self.model_file)
+        prepared_path = os.path.join(models_dir, self.prepared_file)
+        self.session = None
+        if os.path.exists(prepared_path):
+            try:
+                self.session = self._load_prepared(onnxruntime, prepared_path, threads)
+            except Exception as e:
+                print(f"{prepared_path} failed to load ({e}), rebuilding it.")
+        if self.session is None:
+            if not os.path.exists(path):
+                raise BackendUnavailable(f"{path} hasn't been built")
+            try:
+                self.session = prepare(path, prepared_path, threads)
+            except Exception as e:
+                raise BackendUnavailable(f"{path} failed to load: {e}")
+        self.threads = threads
+        self.yolo_layers = yolo_export.yolo_layers(cfg_path)
+        self.input_size = yolo_export.input_size(cfg_path)
+
+    def _load_prepared(self, onnxruntime, prepared_path, threads):
+        """One sequential read, then onnxruntime builds the session straight
+        from that buffer instead of copying it first. It has to outlive the
+        session, hence self._model_bytes. (Pointing the initializers into it
+        too, session.use_ort_model_bytes_for_initializers, crashed the first
+        run() — Python's bytes buffer isn't aligned the way it needs.)"""
+        with open(prepared_path, "rb") as f:
+            self._model_bytes = f.read()
+        options = _session_options(onnxruntime, threads)
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        options.add_session_config_entry("session.load_model_format", "ORT")
+        options.add_session_config_entry("session.use_ort_model_bytes_directly", "1")
+        return onnxruntime.InferenceSession(self._model_bytes, options, providers=["CPUExecutionProvider"])
+
+    def forward(self, blob):
+        heads = self.session.run(None, {"input": blob})
+        return decode_heads(heads, self.yolo_layers, self.input_size)
+
+
+class OnnxRuntimeInt8Backend(OnnxRuntimeBackend):
+    name = "onnxruntime_int8"
+    model_file = "yolov4-tiny.int8.onnx"
+    prepared_file = "yolov4-tiny.int8.ort"
+
+
+BACKENDS = {backend.name: backend for backend in (OpenCVBackend, OnnxRuntimeBackend, OnnxRuntimeInt8Backend)}
+
+
+def _thread_choices():
+    cpus = os.cpu_count() or 1
+    return [n for n in THREAD_CHOICES if n <= cpus] or [1]
+
+
+def _fingerprint(cfg_path, weights_path):
+    """What the choice depends on: the model files and the runtimes."""
+    # Its version, without importing it: this runs on every boot.
+    try:
+        onnxruntime_version = importlib.metadata.version("onnxruntime")
+    except importlib.metadata.PackageNotFoundError:
+        onnxruntime_version = None
+    files = []
+    for path in (cfg_path, weights_path):
+        try:
+            stat = os.stat(path)
+            files.append([os.path.basename(path), stat.st_size, int(stat.st_mtime)])
+        except OSError:
+            files.append([os.path.basename(path), None, None])
+    return {"files": files, "opencv": cv2.__version__, "onnxruntime": onnxruntime_version,
+            "cpus": os.cpu_count()}
+
+
+def _iou(a, b):
+    ix = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    iy = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    inter = max(ix, 0) * max(iy, 0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _agreement(found, truth):
+    """F1 of `found` person boxes against `truth`, per image lists of
+    Detection. 1.0 when neither backend sees anyone."""
+    tp = fp = fn = 0
+    for found_boxes, truth_boxes in zip(found, truth):
+        found_boxes = [d.box for d in found_boxes if d.confidence >= MATCH_MIN_CONFIDENCE]
+        truth_boxes = [d.box for d in truth_boxes if d.confidence >= MATCH_MIN_CONFIDENCE]
+        unmatched = list(range(len(truth_boxes)))
+        for box in found_boxes:
+            best = max(unmatched, key=lambda i: _iou(box, truth_boxes[i]), default=None)
+            if best is not None and _iou(box, truth_boxes[best]) >= MATCH_IOU:
+                unmatched.remove(best)
+                tp += 1
+            else:
+                fp += 1
+        fn += len(unmatched)
+    return 1.0 if tp + fp + fn == 0 else 2 * tp / (2 * tp + fp + fn)
+
+
+def reference_images():
+    paths = sorted(glob.glob(os.path.join(REFERENCE_DIR, "*.jpg")))
+    return paths or [FALLBACK_REFERENCE]
+
+
+def build_models(cfg_path, weights_path, blobs, models_dir=MODELS_DIR):
+    """(Re)build the ONNX and INT8 models and their prepared ORT-format
+    copies. A missing package just leaves the backends that need it
+    unavailable."""
+    os.makedirs(models_dir, exist_ok=True)
+    backends = (OnnxRuntimeBackend, OnnxRuntimeInt8Backend)
+    for backend in backends:
+        for name in (backend.model_file, backend.prepared_file):
+            path = os.path.join(models_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+    onnx_path, int8_path = (os.path.join(models_dir, backend.model_file) for backend in backends)
+    try:
+        yolo_export.export_onnx(cfg_path, weights_path, onnx_path)
+        yolo_export.quantize_int8(onnx_path, int8_path, blobs)
+        for backend in backends:
+            prepare(os.path.join(models_dir, backend.model_file), os.path.join(models_dir, backend.prepared_file))
+    except ImportError as e:
+        print(f"Skipping ONNX models: {e}")
+    except Exception as e:
+        print(f"ONNX model build failed: {e}")
+
+
+def calibrate(cfg_path, weights_path, photos=None, models_dir=MODELS_DIR, save=True):
+    """Time every backend × thread count, check its accuracy against opencv
+    and return (and, with `save`, persist) the choice: a dict with backend,
+    threads and the per-candidate results. None if even opencv can't run."""
+    import human_detection  # imports this module; only needed here
+
+    images = [image for image in (cv2.imread(p) for p in photos or reference_images()) if image is not None]
+    if not images:
+        print("Inference calibration: no readable reference images.")
+        return None
+    blobs = [cv2.dnn.blobFromImages([image], 1 / 255.0, human_detection.INPUT_SIZE, swapRB=True, crop=False)
+             for image in images]
+    print(f"Calibrating inference backends on {len(images)} reference image(s)...")
+    build_models(cfg_path, weights_path, blobs, models_dir)
+
+    results, reference = [], None
+    for name, backend_cls in BACKENDS.items():
+        detections = None
+        for threads in _thread_choices():
+            start = time.perf_counter()
+            try:
+                backend = backend_cls(cfg_path, weights_path, threads, models_dir)
+                first_outputs = backend.forward(blobs[0])
+            except BackendUnavailable as e:
+                print(f"  {name}: unavailable ({e})")
+                break
+            # OpenCV finishes setting the net up in its first forward pass.
+            cold_seconds = time.perf_counter() - start
+            if detections is None:
+                # Thread count doesn't change the numbers, accuracy once.
+                detections = []
+                for i, (image, blob) in enumerate(zip(images, blobs)):
+                    h, w = image.shape[:2]
+                    outputs = first_outputs if i == 0 else backend.forward(blob)
+                    accepted, rejected = human_detection._postprocess(outputs, [(0, 0, w, h)], w, h)
+                    detections.append(accepted + rejected)
+                if reference is None:
+                    reference = detections
+            start = time.perf_counter()
+            for _ in range(CALIBRATION_RUNS):
+                backend.forward(blobs[0])
+            forward_seconds = (time.perf_counter() - start) / CALIBRATION_RUNS
+            result = {
+                "backend": name,
+                "threads": threads,
+                "cold_ms": round(cold_seconds * 1000, 1),
+                "forward_ms": round(forward_seconds * 1000, 1),
+                "accuracy": round(_agreement(detections, reference), 3),
+            }
+            results.append(result)
+            print(f"  {name:<18} {threads} thread(s)   cold {result['cold_ms']:7.1f} ms   "
+                  f"forward {result['forward_ms']:7.1f} ms   accuracy {result['accuracy']:.3f}")
+    if not results or results[0]["backend"] != OpenCVBackend.name:
+        return None
+
+    # Rank by model load + the first forward pass (one detection per wake);
+    # warm passes (burst mode) break ties.
+    eligible = [r for r in results if r["accuracy"] >= ACCURACY_FLOOR]
+    best = min(eligible, key=lambda r: (r["cold_ms"], r["forward_ms"]))
+    choice = {
+        "backend": best["backend"],
+        "threads": best["threads"],
+        "fingerprint": _fingerprint(cfg_path, weights_path),
+        "calibrated_at": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+    print(f"Inference backend: {best['backend']} with {best['threads']} thread(s).")
+    if save:
+        save_state(CHOICE_PATH, choice)
+    return choice
+
+
+def load_detector(cfg_path, weights_path):
+    """The backend to use on this device: the calibrated choice, calibrating
+    first if there's none for the current model and runtimes. Falls back to
+    opencv; raises BackendUnavailable if even that can't load."""
+    choice = load_state(CHOICE_PATH)
+    if not choice or choice.get("fingerprint") != _fingerprint(cfg_path, weights_path):
+        choice = None
+        if AUTO_CALIBRATE:
+            try:
+                choice = calibrate(cfg_path, weights_path)
+            except Exception as e:
+                print(f"Inference calibration failed ({e}), using opencv.")
+            if choice is None:
+                # Not again on every boot: only once the model or runtimes change.
+                save_state(CHOICE_PATH, {
+                    "backend": OpenCVBackend.name,
+                    "threads": _thread_choices()[-1],
+                    "fingerprint": _fingerprint(cfg_path, weights_path),
+                    "calibrated_at": datetime.now().isoformat(timespec="seconds"),
+                    "failed": True,
+                })
+    if choice:
+        try:
+            return BACKENDS[choice["backend"]](cfg_path, weights_path, choice["threads"])
+        except (BackendUnavailable, KeyError) as e:
+            print(f"Calibrated backend {choice.get('backend')} unusable ({e}), using opencv.")
+    return OpenCVBackend(cfg_path, weights_path, _thread_choices()[-1])
+
+
+if __name__ == "__main__":
+    import human_detection
+
+    calibrate(human_detection._CONFIG_PATH, human_detection._WEIGHTS_PATH)
@@ -0,0 +1,427 @@
+"""Stamp the timestamp label straight into the JPEG bitstream.
+
+The pixel path decodes the whole 8 MP frame, draws a ~1600×110 px label and
+re-encodes everything, which costs a second generation of JPEG loss over the
+entire photo to change about 1 % of it. Here only the MCUs under the label
+are re-encoded, from the rendered label itself. Every other MCU keeps its
+original entropy-coded bits:
+
+- The label rectangle is widened to the MCU grid (16 px for the camera's
+  4:2:0 output) and filled white. No MCU mixes label and photo pixels, so no
+  part of the photo has to be decoded to pixels.
+- The scan is Huffman-decoded (symbols only, no IDCT) up to the MCU after the
+  label. That gives the bit offsets and DC predictors. MCUs before the label
+  are copied bit for bit, and the label MCUs are encoded with the frame's own
+  quantisation and Huffman tables. The first MCU after the label gets its DC
+  differences re-coded against the new predictors. The rest of the scan is
+  appended unchanged, only bit-shifted.
+- With restart markers, only the restart intervals holding the label are
+  rewritten.
+
+Only sequential Huffman JPEGs are handled: a single interleaved scan, 8-bit,
+YCbCr or greyscale, with luma at full resolution. Anything else raises
+Unsupported and the caller falls back to the pixel path: progressive,
+arithmetic, optimised tables missing a symbol, or a label that doesn't fit.
+Needs numpy for the forward DCT (it's there whenever cv2 is).
+"""
+
+import re
+import struct
+
+from PIL import Image
+
+# Zig-zag position -> natural (row-major) index within an 8x8 block.
+ZIGZAG = (
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+)
+
+_SOF_SEQUENTIAL = (0xC0, 0xC1)
+_SOF_OTHER = set(range(0xC2, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# First marker that isn't byte stuffing or a restart marker ends the scan.
+_SCAN_END = re.compile(rb"\xff[^\x00\xd0-\xd7]")
+_RST = re.compile(rb"\xff[\xd0-\xd7]")
+
+# (counts, symbols) -> (16-bit decode lookup, symbol -> (code, length)).
+# Every frame from the camera carries the same tables, so a burst builds them once.
+_huffman_cache = {}
+# (AC table, quantised block) -> encoded AC bits. Label blocks repeat a lot
+# (all-white ones above all); cleared when it grows, so a burst stays bounded.
+_ac_cache = {}
+AC_CACHE_MAX = 20000
+
+
+class Unsupported(Exception):
+    """The JPEG can't be edited in place; use the pixel path."""
+
+
+class _BitWriter:
+    __slots__ = ("out", "acc", "nbits")
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.nbits = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | value
+        self.nbits += nbits
+        if self.nbits > 1024:
+            self._flush()
+
+    def _flush(self):
+        keep = self.nbits & 7
+        self.out += (self.acc >> keep).to_bytes(self.nbits >> 3, "big")
+        self.acc &= (1 << keep) - 1
+        self.nbits = keep
+
+    def finish(self):
+        """Pad the last byte with 1-bits (as the JPEG spec asks) and return
+        the bytes, still unstuffed."""
+        pad = -self.nbits % 8
+        self.write((1 << pad) - 1, pad)
+        self._flush()
+        return bytes(self.out)
+
+
+def _bits(data, start, end):
+    """Bits [start, end) of `data` as an int."""
+    chunk = int.from_bytes(data[start >> 3:(end + 7) >> 3], "big")
+    return (chunk >> (-end % 8)) & ((1 << (end - start)) - 1)
+
+
+def _huffman_tables(counts, symbols):
+    key = (counts, symbols)
+    cached = _huffman_cache.get(key)
+    if cached is not None:
+        return cached
+    lookup = [0] * 65536
+    encode = {}
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            if code >= 1 << length:
+                raise Unsupported("malformed Huffman table")
+            symbol = symbols[k]
+            k += 1
+            encode[symbol] = (code, length)
+            span = 1 << (16 - length)
+            start = code << (16 - length)
+            lookup[start:start + span] = [(symbol << 5) | length] * span
+            code += 1
+        code <<= 1
+    _huffman_cache[key] = lookup, encode
+    return lookup, encode
+
+
+def _parse(jpeg):
+    """Tables, geometry and scan bounds of a single-scan sequential JPEG."""
+    if jpeg[:2] != b"\xff\xd8":
+        raise Unsupported("not a JPEG")
+    quant, dc_tables, ac_tables = {}, {}, {}
+    frame = None
+    restart_interval = 0
+    adobe_transform = None
+    pos = 2
+    while True:
+        if jpeg[pos] != 0xFF:
+            raise Unsupported("corrupt marker structure")
+        marker = jpeg[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        length = struct.unpack_from(">H", jpeg, pos + 2)[0]
+        body = jpeg[pos + 4:pos + 2 + length]
+        pos += 2 + length
+        if marker in _SOF_SEQUENTIAL:
+            precision, height, width, count = struct.unpack_from(">BHHB", body)
+            if precision != 8:
+                raise Unsupported(f"{precision}-bit samples")
+            frame = (width, height, {
+                body[6 + 3 * i]: (body[7 + 3 * i] >> 4, body[7 + 3 * i] & 15, body[8 + 3 * i])
+                for i in range(count)
+            })
+        elif marker in _SOF_OTHER:
+            raise Unsupported(f"SOF{marker - 0xC0} (not baseline)")
+        elif marker == 0xC4:
+            i = 0
+            while i < len(body):
+                counts = tuple(body[i + 1:i + 17])
+                symbols = bytes(body[i + 17:i + 17 + sum(counts)])
+                (ac_tables if body[i] >> 4 else dc_tables)[body[i] & 15] = _huffman_tables(counts, symbols)
+                i += 17 + len(symbols)
+        elif marker == 0xDB:
+            i = 0
+            while i < len(body):
+                if body[i] >> 4:
+                    quant[body[i] & 15] = struct.unpack_from(">64H", body, i + 1)
+                    i += 129
+                else:
+                    quant[body[i] & 15] = tuple(body[i + 1:i + 65])
+                    i += 65
+        elif marker == 0xDD:
+            restart_interval = struct.unpack_from(">H", body)[0]
+        elif marker == 0xEE and body[:5] == b"Adobe" and len(body) >= 12:
+            adobe_transform = body[11]
+        elif marker == 0xDA:
+            break
+        elif marker == 0xD9:
+            raise Unsupported("no image data")
+
+    if frame is None:
+        raise Unsupported("no SOF before the scan")
+    width, height, frame_components = frame
+    if len(frame_components) not in (1, 3):
+        raise Unsupported(f"{len(frame_components)} components")
+    if len(frame_components) == 3 and adobe_transform == 0:
+        raise Unsupported("RGB-coded JPEG")
+    count = body[0]
+    scan_ids = [body[1 + 2 * i] for i in range(count)]
+    if count != len(frame_components) or tuple(body[1 + 2 * count:4 + 2 * count]) != (0, 63, 0):
+        raise Unsupported("not a single interleaved sequential scan")
+    components = []
+    for i, component_id in enumerate(scan_ids):
+        h, v, tq = frame_components[component_id]
+        tables = body[2 + 2 * i]
+        components.append((h, v, quant[tq], dc_tables[tables >> 4], ac_tables[tables & 15]))
+
+    scan_end = _SCAN_END.search(jpeg, pos)
+    if scan_end is None or jpeg[scan_end.start() + 1] != 0xD9:
+        raise Unsupported("more than one scan")
+    return width, height, components, restart_interval, pos, scan_end.start()
+
+
+def _encode_dc(diff, dc_encode):
+    size = abs(diff).bit_length()
+    code, length = dc_encode[size]
+    return (code << size) | (diff if diff >= 0 else diff + (1 << size) - 1), length + size
+
+
+def _encode_ac(coefficients, ac_encode):
+    value = nbits = run = 0
+    for k in range(1, 64):
+        c = coefficients[k]
+        if not c:
+            run += 1
+            continue
+        while run > 15:
+            code, length = ac_encode[0xF0]
+            value = (value << length) | code
+            nbits += length
+            run -= 16
+        size = abs(c).bit_length()
+        code, length = ac_encode[(run << 4) | size]
+        value = (((value << length) | code) << size) | (c if c > 0 else c + (1 << size) - 1)
+        nbits += length + size
+        run = 0
+    if run:
+        code, length = ac_encode[0x00]
+        value = (value << length) | code
+        nbits += length
+    return value, nbits
+
+
+def _label_mcus(canvas, components, mcu_size, first_mcu, mcus_x):
+    """Encoded blocks of the label canvas per MCU index, in scan order:
+    {mcu: [(dc, ac_value, ac_bits), ...]}. Chroma is neutral
+    (the label is black on white), so chroma blocks are all-zero."""
+    try:
+        import numpy as np
+    except ImportError:
+        raise Unsupported("numpy not available")
+
+    mcu_w, mcu_h = mcu_size
+    h, v, luma_quant = components[0][:3]
+    rows, cols = canvas.height // mcu_h, canvas.width // mcu_w
+    pixels = np.asarray(canvas, dtype=np.float64) - 128.0
+    # (rows, cols, v, h, 8, 8): MCUs in raster order, luma blocks within an
+    # MCU in raster order — the order they appear in the scan.
+    blocks = pixels.reshape(rows, v, 8, cols, h, 8).transpose(0, 3, 1, 4, 2, 5).reshape(-1, 8, 8)
+    x = np.arange(8)
+    dct = np.cos((2 * x[None, :] + 1) * x[:, None] * np.pi / 16) / 2
+    dct[0] /= np.sqrt(2)
+    coefficients = (dct @ blocks @ dct.T).reshape(-1, 64)[:, ZIGZAG]
+    quantised = np.rint(coefficients / np.asarray(luma_quant, dtype=np.float64)).astype(int).tolist()
+
+    if len(_ac_cache) > AC_CACHE_MAX:
+        _ac_cache.clear()
+    luma_ac = components[0][4][1]
+    luma_blocks = []
+    for block in quantised:
+        key = (id(luma_ac), tuple(block))
+        ac = _ac_cache.get(key)
+        if ac is None:
+            ac = _ac_cache[key] = _encode_ac(block, luma_ac)
+        luma_blocks.append((block[0],) + ac)
+
+    per_mcu = h * v
+    chroma = []
+    for ch, cv, _, _, (_, ac_encode) in components[1:]:
+        chroma += [(0,) + _encode_ac([0] * 64, ac_encode)] * (ch * cv)
+    mcus = {}
+    for n in range(rows * cols):
+        row, col = divmod(n, cols)
+        mcus[first_mcu + row * mcus_x + col] = luma_blocks[n * per_mcu:(n + 1) * per_mcu] + chroma
+    return mcus
+
+
+def _rewrite(data, components, layout, label, first, stop, mcu_count):
+    """Re-encode MCUs [first, first + mcu_count) of one entropy-coded segment
+    (`data`, unstuffed). MCUs in `label` are replaced; the others are copied
+    bit for bit, except for DC differences whose predictor changed. Decoding
+    stops at MCU `stop`; anything after it is appended as-is."""
+    dc_lookups = [c[3][0] for c in components]
+    ac_lookups = [c[4][0] for c in components]
+    dc_encodes = [c[3][1] for c in components]
+    end_bits = len(data) * 8
+    data = data + b"\x00\x00\x00"  # lets the 24-bit peek read past the end
+    writer = _BitWriter()
+    old_pred = [0] * len(components)
+    new_pred = [0] * len(components)
+    p = 0
+    raw_start = 0  # start of the pending bit-for-bit copy, or None
+
+    for mcu in range(first, stop):
+        replacement = label.get(mcu)
+        if replacement is not None and raw_start is not None:
+            writer.write(_bits(data, raw_start, p), p - raw_start)
+            raw_start = None
+        for i, c in enumerate(layout):
+            # DC: category symbol + difference bits.
+            b = p >> 3
+            window = (data[b] << 16) | (data[b + 1] << 8) | data[b + 2]
+            entry = dc_lookups[c][(window >> (8 - (p & 7))) & 0xFFFF]
+            if not entry:
+                raise Unsupported("corrupt scan data")
+            p += entry & 31
+            size = entry >> 5
+            diff = 0
+            if size:
+                b = p >> 3
+                window = (data[b] << 16) | (data[b + 1] << 8) | data[b + 2]
+                bits = (window >> (24 - (p & 7) - size)) & ((1 << size) - 1)
+                diff = bits if bits >> (size - 1) else bits - (1 << size) + 1
+                p += size
+            block_start = p - (entry & 31) - size
+            dc_end = p
+            # AC: only the lengths matter, the values are never needed.
+            lookup = ac_lookups[c]
+            k = 1
+            while k < 64:
+                b = p >> 3
+                window = (data[b] << 16) | (data[b + 1] << 8) | data[b + 2]
+                entry = lookup[(window >> (8 - (p & 7))) & 0xFFFF]
+                if not entry:
+                    raise Unsupported("corrupt scan data")
+                rs = entry >> 5
+                p += (entry & 31) + (rs & 15)
+                if rs & 15:
+                    k += (rs >> 4) + 1
+                elif rs == 0xF0:
+                    k += 16
+                else:
+                    break
+            dc = old_pred[c] + diff
+            old_pred[c] = dc
+
+            if replacement is not None:
+                new_dc, ac_value, ac_bits = replacement[i]
+                writer.write(*_encode_dc(new_dc - new_pred[c], dc_encodes[c]))
+                writer.write(ac_value, ac_bits)
+                new_pred[c] = new_dc
+            else:
+                if new_pred[c] != dc - diff:
+                    # First block after the label: same coefficients, DC
+                    # difference re-coded against the label's predictor.
+                    if raw_start is not None:
+                        writer.write(_bits(data, raw_start, block_start), block_start - raw_start)
+                    writer.write(*_encode_dc(dc - new_pred[c], dc_encodes[c]))
+                    raw_start = dc_end
+                elif raw_start is None:
+                    raw_start = block_start
+                new_pred[c] = dc
+
+    # Everything past `stop` is unchanged: the predictors agree again after
+    # the first non-label MCU. When the whole segment was decoded, what's
+    # left is only its padding, which finish() redoes. An appended tail keeps
+    # its own padding bits, so at worst one extra 0xFF padding byte precedes
+    # the EOI marker. Decoders skip it.
+    tail_end = end_bits if stop < first + mcu_count else p
+    if raw_start is not None and tail_end > raw_start:
+        writer.write(_bits(data, raw_start, tail_end), tail_end - raw_start)
+    return writer.finish()
+
+
+def stamp(jpeg, patch, position):
+    """Put `patch` (a PIL image of the black-on-white label) at `position`,
+    re-encoding only the MCUs it covers.
+
+    Returns (jpeg, canvas, origin). `canvas` is the MCU-aligned greyscale
+    image actually written and `origin` is its top-left corner, so a caller
+    holding decoded pixels can apply the same change. Raises Unsupported.
+    """
+    try:
+        width, height, components, restart_interval, scan_start, scan_end = _parse(jpeg)
+    except (IndexError, KeyError, struct.error) as e:
+        raise Unsupported(f"unreadable header ({e!r})")
+
+    if len(components) == 1:
+        components = [(1, 1) + components[0][2:]]
+    hmax = max(c[0] for c in components)
+    vmax = max(c[1] for c in components)
+    if components[0][:2] != (hmax, vmax):
+        raise Unsupported("subsampled luma")
+    mcu_w, mcu_h = 8 * hmax, 8 * vmax
+    mcus_x = -(-width // mcu_w)
+    mcu_total = mcus_x * -(-height // mcu_h)
+
+    x, y = position
+    col0, row0 = x // mcu_w, y // mcu_h
+    col1 = -(-(x + patch.width) // mcu_w)
+    row1 = -(-(y + patch.height) // mcu_h)
+    if col1 * mcu_w > width or row1 * mcu_h > height:
+        raise Unsupported("label doesn't fit the frame")
+    origin = (col0 * mcu_w, row0 * mcu_h)
+    canvas = Image.new("L", ((col1 - col0) * mcu_w, (row1 - row0) * mcu_h), 255)
+    canvas.paste(patch.convert("L"), (x - origin[0], y - origin[1]))
+
+    try:
+        label = _label_mcus(canvas, components, (mcu_w, mcu_h), row0 * mcus_x + col0, mcus_x)
+        layout = [i for i, c in enumerate(components) for _ in range(c[0] * c[1])]
+        scan = jpeg[scan_start:scan_end]
+        last_label = max(label)
+
+        if not restart_interval:
+            stop = min(last_label + 2, mcu_total)
+            rewritten = _rewrite(scan.replace(b"\xff\x00", b"\xff"), components, layout,
+                                 label, 0, stop, mcu_total)
+            new_scan = rewritten.replace(b"\xff", b"\xff\x00")
+        else:
+            segments, markers, previous = [], [], 0
+            for marker in _RST.finditer(scan):
+                segments.append(scan[previous:marker.start()])
+                markers.append(marker.group())
+                previous = marker.end()
+            segments.append(scan[previous:])
+            if len(segments) != -(-mcu_total // restart_interval):
+                raise Unsupported("restart markers don't match the MCU count")
+            parts = []
+            for n, segment in enumerate(segments):
+                first = n * restart_interval
+                count = min(restart_interval, mcu_total - first)
+                if any(mcu in label for mcu in range(first, first + count)):
+                    segment = _rewrite(segment.replace(b"\xff\x00", b"\xff"), components, layout,
+                                       label, first, first + count, count).replace(b"\xff", b"\xff\x00")
+                parts.append(segment)
+                if n < len(markers):
+                    parts.append(markers[n])
+            new_scan = b"".join(parts)
+    except (KeyError, IndexError) as e:
+        # KeyError: the frame's (optimised) Huffman table lacks a symbol the
+        # label needs; IndexError: scan data ran out.
+        raise Unsupported(f"can't re-encode the label ({e!r})")
+
+    return jpeg[:scan_start] + new_scan + jpeg[scan_end:], canvas, origin
@@ -0,0 +1,135 @@
+"""Learned RTC drift, so sync_time can skip reading the WittyPi clock.
+
+The PCF85063 drifts by a few ppm, mostly with temperature: a tuning-fork
+crystal runs slow by roughly the square of its distance from the ~25 °C
+turnover point. Every RTC reading is kept (time since the last sync, signed
+drift, outdoor temperature) and the drift rate is fitted as
+
+    ppm = a + b · (T − TURNOVER_C)²
+
+falling back to a single mean rate until the history covers enough of a
+temperature spread. While the predicted drift stays under SAFETY_FRACTION of
+the acceptable drift, the reading is skipped; at least every
+VERIFY_EVERY_SECONDS it's done anyway and corrects the fit.
+
+Drift is system − RTC in seconds, measured once NTP has set the system clock.
+"""
+
+import os
+
+from utils import STATE_DIR, load_state, save_state
+
+STATE_PATH = os.path.join(STATE_DIR, "rtc_drift.json")
+
+HISTORY_SIZE = 60
+TURNOVER_C = 25.0
+MIN_SAMPLES = 3
+# Shorter intervals since the sync say little beyond the whole-second
+# truncation of the readings.
+MIN_SAMPLE_SECONDS = 3600
+# Temperature term only once the samples span this much (T − TURNOVER_C)².
+MIN_CURVATURE_SPREAD = 100.0
+# Skip only while the prediction stays under this share of the threshold...
+SAFETY_FRACTION = 0.5
+# ... with the fitted rate inflated by this factor, plus the whole second
+# both readings are truncated to.
+RATE_MARGIN = 1.5
+READ_RESOLUTION_SECONDS = 1.0
+VERIFY_EVERY_SECONDS = 6 * 3600
+
+
+def _solve_2x2(a11, a12, a22, b1, b2):
+    det = a11 * a22 - a12 * a12
+    if abs(det) < 1e-12:
+        return None
+    return (b1 * a22 - b2 * a12) / det, (a11 * b2 - a12 * b1) / det
+
+
+class DriftModel:
+    def __init__(self, state=None):
+        state = state or {}
+        self.synced_at = state.get("synced_at")
+        self.offset = state.get("offset", 0.0)
+        self.verified_at = state.get("verified_at")
+        self.samples = state.get("samples", [])
+        self.readings = state.get("readings", 0)
+        self.skipped = state.get("skipped", 0)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        return cls(load_state(path, {}) or {})
+
+    def save(self, path=STATE_PATH):
+        save_state(path, {
+            "synced_at": self.synced_at,
+            "offset": self.offset,
+            "verified_at": self.verified_at,
+            "samples": self.samples[-HISTORY_SIZE:],
+            "readings": self.readings,
+            "skipped": self.skipped,
+        })
+
+    def record_sync(self, now, drift):
+        """The RTC was just set; `drift` is what's left right after."""
+        self.synced_at = now
+        self.offset = drift
+        self.verified_at = now
+
+    def record_reading(self, now, drift, temperature=None):
+        """A measured drift; becomes a sample if the last sync is known and
+        long enough ago."""
+        self.readings += 1
+        self.verified_at = now
+        if self.synced_at is not None and now - self.synced_at >= MIN_SAMPLE_SECONDS:
+            self.samples.append({
+                "elapsed": now - self.synced_at,
+                "drift": drift - self.offset,
+                "temp": temperature,
+            })
+            self.samples = self.samples[-HISTORY_SIZE:]
+
+    def rate_ppm(self, temperature=None):
+        """Fitted drift rate at `temperature` (the history's mean when None),
+        or None without enough samples. Least squares on drift = rate × elapsed,
+        which weights the long (least quantized) intervals most."""
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        with_temp = [s for s in self.samples if s["temp"] is not None]
+        curvatures = [(s["temp"] - TURNOVER_C) ** 2 for s in with_temp]
+        if len(with_temp) >= MIN_SAMPLES and max(curvatures) - min(curvatures) >= MIN_CURVATURE_SPREAD:
+            # drift = (a + b·c) × elapsed, c = (T − TURNOVER_C)²
+            a11 = a12 = a22 = b1 = b2 = 0.0
+            for s, c in zip(with_temp, curvatures):
+                t = s["elapsed"]
+                a11 += t * t
+                a12 += t * t * c
+                a22 += t * t * c * c
+                b1 += s["drift"] * t
+                b2 += s["drift"] * t * c
+            fit = _solve_2x2(a11, a12, a22, b1, b2)
+            if fit is not None:
+                if temperature is None:
+                    temperature = sum(s["temp"] for s in with_temp) / len(with_temp)
+                return (fit[0] + fit[1] * (temperature - TURNOVER_C) ** 2) * 1e6
+        t2 = sum(s["elapsed"] ** 2 for s in self.samples)
+        return sum(s["drift"] * s["elapsed"] for s in self.samples) / t2 * 1e6
+
+    def predicted_drift(self, now, temperature=None):
+        """Worst-case |drift| expected now, or None when unknown."""
+        rate = self.rate_ppm(temperature)
+        if rate is None or self.synced_at is None:
+            return None
+        expected = self.offset + rate * 1e-6 * (now - self.synced_at)
+        return abs(expected) + abs(rate) * 1e-6 * (now - self.synced_at) * (RATE_MARGIN - 1) \
+            + READ_RESOLUTION_SECONDS
+
+    def skip_reading(self, now, temperature, threshold):
+        """(skip, reason): whether reading the RTC can be skipped this wake."""
+        if self.verified_at is None or now - self.verified_at >= VERIFY_EVERY_SECONDS:
+            return False, "periodic verification"
+        predicted = self.predicted_drift(now, temperature)
+        if predicted is None:
+            return False, "not enough drift history"
+        if predicted >= SAFETY_FRACTION * threshold:
+            return False, f"predicted drift {predicted:.1f}s"
+        return True, f"predicted drift {predicted:.1f}s"
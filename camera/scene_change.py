@@ -0,0 +1,222 @@
+"""Scene-change gate in front of YOLO.
+
+Most wakes show the same static orchard, and a YOLOv4-tiny forward pass
+costs seconds of CPU on the Pi Zero 2 W. This module keeps a small grey
+running-average background model in STATE_DIR across cold boots and compares
+every frame with it:
+
+- The frame is decoded at 1/8 scale (libjpeg DCT scaling) straight from the
+  JPEG bytes, so a skipped frame never gets a full decode.
+- A global gain correction follows exposure changes. Each pixel's threshold
+  is a multiple of its own running noise (mean absolute deviation), so leaves
+  in the wind and slow lighting drift raise their own bar.
+- No meaningful change in the zone of interest means YOLO is skipped. A few
+  changed blobs mean YOLO runs only on crops around them. Change almost
+  everywhere (exposure jump, sunrise) means a full-frame run, and the
+  background re-learns fast.
+
+Changed pixels are learned much more slowly than static ones, so a person
+doesn't fade into the background within a few cycles. As a backstop, every
+FORCE_FULL_EVERY-th frame runs the full detector anyway.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from human_detection import DETECTION_ZONE_TOP_RATIO
+from utils import STATE_DIR, load_state, save_state
+
+MODEL_PATH = os.path.join(STATE_DIR, "background.npz")
+STATS_PATH = os.path.join(STATE_DIR, "scene_gate_stats.json")
+
+MODEL_SIZE = (320, 240)            # ~10 full-res px per model px on 8 MP
+LEARNING_RATE = 0.05               # background EMA for unchanged pixels
+FOREGROUND_LEARNING_RATE = 0.005   # ... and for changed ones
+NOISE_K = 4.0                      # changed = deviation > NOISE_K × pixel noise
+MIN_DIFF = 12                      # ... and at least this many grey levels
+MIN_BLOB_PIXELS = 6                # a person at 10 m is ~3×10 model px
+# Rows above the zone of interest can still hold the head of someone
+# standing in it.
+ZONE_MARGIN_RATIO = 0.1
+GLOBAL_CHANGE_FRACTION = 0.3       # more than this of the zone changed → re-learn
+MAX_REGIONS = 4                    # more blobs than this → just run the full frame
+REGION_MIN_SIZE = 640              # crop edge in full-res px
+REGION_PADDING = 0.5               # grow each blob by half its size per side
+FORCE_FULL_EVERY = 12
+# A background older than this (camera was off overnight) is re-seeded.
+MAX_MODEL_AGE_SECONDS = 3 * 3600
+
+
+@dataclass
+class GateDecision:
+    run: bool
+    # Full-res (x, y, w, h) crops to run YOLO on; None = the whole frame.
+    regions: list = None
+    reason: str = ""
+    changed_fraction: float = 0.0
+
+
+def _small_gray(jpeg):
+    """The frame as MODEL_SIZE float32 grey, plus the full-res size."""
+    reduced = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if reduced is None:
+        raise ValueError("frame is not a decodable JPEG")
+    full_size = (reduced.shape[1] * 8, reduced.shape[0] * 8)
+    small = cv2.resize(reduced, MODEL_SIZE, interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32), full_size
+
+
+def _merge(boxes):
+    """Union overlapping (x0, y0, x1, y1) boxes until none overlap."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+def _regions(blobs, full_size):
+    """Full-res crops around the changed blobs (model-pixel x, y, w, h)."""
+    full_w, full_h = full_size
+    sx, sy = full_w / MODEL_SIZE[0], full_h / MODEL_SIZE[1]
+    boxes = []
+    for x, y, w, h in blobs:
+        cx, cy = (x + w / 2) * sx, (y + h / 2) * sy
+        size = max(REGION_MIN_SIZE, w * sx * (1 + 2 * REGION_PADDING), h * sy * (1 + 2 * REGION_PADDING))
+        size = min(size, full_w, full_h)
+        x0 = int(min(max(cx - size / 2, 0), full_w - size))
+        y0 = int(min(max(cy - size / 2, 0), full_h - size))
+        boxes.append((x0, y0, x0 + int(size), y0 + int(size)))
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in _merge(boxes)]
+
+
+class BackgroundModel:
+    def __init__(self, background=None, noise=None, updated_at=0.0, since_full=0):
+        self.background = background
+        self.noise = noise
+        self.updated_at = updated_at
+        self.since_full = since_full
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        try:
+            with np.load(path) as data:
+                return cls(
+                    data["background"].astype(np.float32),
+                    data["noise"].astype(np.float32),
+                    float(data["updated_at"]),
+                    int(data["since_full"]),
+                )
+        except (OSError, KeyError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Background model unreadable ({e}), starting a new one.")
+            return cls()
+
+    def save(self, path=MODEL_PATH):
+        """Atomic write, like utils.save_state; float16 keeps it ~300 KB."""
+        if self.background is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                background=self.background.astype(np.float16),
+                noise=self.noise.astype(np.float16),
+                updated_at=self.updated_at,
+                since_full=self.since_full,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _full(self, reason, changed_fraction=0.0):
+        self.since_full = 0
+        return GateDecision(True, None, reason, changed_fraction)
+
+    def check(self, jpeg, now=None):
+        """Compare a frame (JPEG bytes) with the background, learn from it
+        and decide whether, and where, YOLO has to run."""
+        now = time.time() if now is None else now
+        frame, full_size = _small_gray(jpeg)
+        if (self.background is None or self.background.shape != frame.shape
+                or now - self.updated_at > MAX_MODEL_AGE_SECONDS):
+            self.background = frame
+            self.noise = np.full_like(frame, MIN_DIFF / NOISE_K)
+            self.updated_at = now
+            return self._full("no recent background model")
+
+        # Exposure/white-balance drift moves the whole frame. Compare
+        # shapes, not absolute levels.
+        gain = float(np.clip(self.background.mean() / max(frame.mean(), 1.0), 0.5, 2.0))
+        frame *= gain
+        diff = np.abs(frame - self.background)
+        mask = diff > np.maximum(MIN_DIFF, NOISE_K * self.noise)
+        zone_row = max(0, int(MODEL_SIZE[1] * (DETECTION_ZONE_TOP_RATIO - ZONE_MARGIN_RATIO)))
+        mask[:zone_row] = False
+        changed_fraction = float(mask[zone_row:].mean())
+
+        # Selective update: static pixels learn background and noise, changed
+        # ones barely, so a standing person doesn't blend in.
+        rate = np.where(mask, FOREGROUND_LEARNING_RATE, LEARNING_RATE).astype(np.float32)
+        if changed_fraction > GLOBAL_CHANGE_FRACTION:
+            rate[:] = 0.5
+        self.background += rate * (frame - self.background)
+        self.noise = np.where(mask, self.noise, self.noise + LEARNING_RATE * (diff - self.noise))
+        self.updated_at = now
+
+        if changed_fraction > GLOBAL_CHANGE_FRACTION:
+            return self._full("global change (lighting)", changed_fraction)
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+        blobs = [tuple(stats[i, :4]) for i in range(1, count) if stats[i, cv2.CC_STAT_AREA] >= MIN_BLOB_PIXELS]
+        self.since_full += 1
+        if not blobs:
+            if self.since_full >= FORCE_FULL_EVERY:
+                return self._full("periodic full pass", changed_fraction)
+            return GateDecision(False, None, "no change", changed_fraction)
+        regions = _regions(blobs, full_size)
+        if len(regions) > MAX_REGIONS:
+            return self._full(f"{len(regions)} changed regions", changed_fraction)
+        return GateDecision(True, regions, f"{len(blobs)} changed blob(s)", changed_fraction)
+
+
+_model = None
+
+
+def gate(jpeg):
+    """Per-cycle entry point: load the persisted model, check the frame,
+    save the model back and keep running skip stats in STATE_DIR. Any
+    failure means "run YOLO on the whole frame"."""
+    global _model
+    try:
+        if _model is None:
+            _model = BackgroundModel.load()
+        decision = _model.check(jpeg)
+        _model.save()
+    except Exception as e:
+        print(f"Scene gate failed ({e}), running full detection.")
+        return GateDecision(True, None, "gate error")
+
+    stats = load_state(STATS_PATH, {}) or {}
+    stats["frames"] = stats.get("frames", 0) + 1
+    key = "skipped" if not decision.run else ("regions" if decision.regions else "full")
+    stats[key] = stats.get(key, 0) + 1
+    save_state(STATS_PATH, stats)
+    print(f"Scene gate: {key} ({decision.reason}, {decision.changed_fraction:.1%} of zone changed) — "
+          f"{stats.get('skipped', 0)}/{stats['frames']} forward passes skipped so far")
+    return decision
@@ -0,0 +1,105 @@
+"""The last Blynk settings and outdoor temperature, persisted in STATE_DIR.
+
+Each value read live is stored with its fetch time, and a cycle missing one
+takes it from here while it's younger than its MAX_AGE_SECONDS:
+
+- the working window and the interval change rarely and are safe to reuse
+  for days;
+- the temperature only goes into the overlay and the drift model, so a
+  fresh cached one lets the overlay run without waiting for the network
+  while the live read refreshes the cache in the background;
+- the command flags (force_sync, run_update) aren't cached at all — acting
+  on a stale command is worse than missing one, so without a live read they
+  stay off.
+
+At the end of a connected cycle, stale_keys() says what a fetch now would
+keep fresh until the next wake but the cache wouldn't (cycle.py prefetches
+those), so that boot starts from fresh values.
+"""
+
+import os
+import time
+
+from utils import STATE_DIR, load_state, save_state
+
+STATE_PATH = os.path.join(STATE_DIR, "settings_cache.json")
+
+MAX_AGE_SECONDS = {
+    "working_time": 7 * 86400,
+    "deep_sleep_interval": 86400,
+    "last_sync_date": 2 * 86400,
+    "temperature": 1800,
+}
+# CycleSettings fields the cache can fill in; the rest are live-only.
+SETTINGS_KEYS = ("last_sync_date", "working_time", "deep_sleep_interval")
+
+
+class SettingsCache:
+    def __init__(self, state=None):
+        state = state or {}
+        # {key: [value, fetched_at]}
+        self.entries = state.get("entries", {})
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        return cls(load_state(path, {}) or {})
+
+    def save(self, path=STATE_PATH):
+        save_state(path, {"entries": self.entries})
+
+    def put(self, key, value, now=None):
+        if value is not None:
+            self.entries[key] = [value, now or time.time()]
+
+    def get(self, key, now=None):
+        """The cached value while it's fresh enough, else None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, fetched_at = entry
+        if (now or time.time()) - fetched_at > MAX_AGE_SECONDS[key]:
+            return None
+        return value
+
+    def remember(self, settings, now=None):
+        """Store the fields a live Blynk read returned."""
+        for key in SETTINGS_KEYS:
+            self.put(key, getattr(settings, key), now)
+
+    def fill(self, settings=None, now=None):
+        """`settings` (a CycleSettings, or an empty one) with every field the
+        live read couldn't provide taken from the cache when fresh enough.
+        Without a live read (or when it got nothing at all: Blynk is down)
+        run_update is off; a live read that got the rest but not run_update
+        leaves it None, so the settings stay incomplete as before."""
+        read = settings is not None
+        live = read and any(
+            getattr(settings, key) is not None for key in SETTINGS_KEYS + ("run_update",)
+        )
+        if not read:
+            from blynk import CycleSettings
+            settings = CycleSettings()
+        filled = []
+        for key in SETTINGS_KEYS:
+            if getattr(settings, key) is None:
+                value = self.get(key, now)
+                if value is not None:
+                    setattr(settings, key, value)
+                    filled.append(key)
+        if not live:
+            settings.run_update = False
+        if filled and read:
+            print(f"Using cached settings: {', '.join(filled)}")
+        return settings
+
+    def stale_keys(self, wake_at, now=None):
+        """Keys the next boot (at `wake_at`) would find too old, but that a
+        fetch right now would keep fresh until then."""
+        now = now or time.time()
+        stale = set()
+        for key, max_age in MAX_AGE_SECONDS.items():
+            if wake_at - now > max_age:
+                continue
+            if self.get(key, wake_at) is None:
+                stale.add(key)
+        return stale
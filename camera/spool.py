@@ -0,0 +1,193 @@
+"""Store-and-forward spool for frames that couldn't be uploaded.
+
+A frame that can't go up (no connectivity, or the upload failed) is moved
+into a bounded queue directory in STATE_DIR together with its Cloudinary
+tags and telemetry, and a later connected cycle drains the backlog within a
+time budget.
+
+Layout: each entry is `<id>.jpg` + `<id>.json`. The JSON sidecar is written
+last and removed first, so it marks a complete entry; a .jpg whose sidecar is
+missing (power cut mid-enqueue) is still picked up with empty metadata.
+
+Every entry is uploaded under its entry id as the Cloudinary public_id, and
+Cloudinary returns the existing asset when that id was already uploaded. So
+an entry is only removed after its upload is acknowledged, and a power cut in
+between just means the next drain re-sends it without a duplicate.
+"""
+
+import os
+import shutil
+import time
+from datetime import datetime
+
+from utils import STATE_DIR, load_state, save_state
+
+SPOOL_DIR = os.path.join(STATE_DIR, "spool")
+# An 8 MP frame is ~3-5 MB; the SD card has room, but keep it bounded.
+MAX_ENTRIES = 300
+MAX_BYTES = 800 * 1024 * 1024
+
+ORDER_OLDEST = "oldest"
+ORDER_DETECTIONS = "detections"
+
+
+def _entry_paths(spool_dir, entry_id):
+    base = os.path.join(spool_dir, entry_id)
+    return f"{base}.jpg", f"{base}.json"
+
+
+def _move_durably(src, dst):
+    """Move `src` to `dst` atomically. Falls back to copy+fsync+rename when
+    they're on different filesystems (e.g. /tmp is tmpfs)."""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError:
+        pass
+    tmp = f"{dst}.tmp"
+    shutil.copyfile(src, tmp)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    os.remove(src)
+
+
+def pending(spool_dir=SPOOL_DIR):
+    """All spooled entries, oldest first. Each is a dict with id, photo_path,
+    size, person_detected, tags, telemetry, spooled_at and resume."""
+    try:
+        names = os.listdir(spool_dir)
+    except FileNotFoundError:
+        return []
+    entries = []
+    for name in sorted(names):
+        if not name.endswith(".jpg"):
+            continue
+        entry_id = name[:-len(".jpg")]
+        photo_path, meta_path = _entry_paths(spool_dir, entry_id)
+        meta = load_state(meta_path, {}) or {}
+        try:
+            size = os.path.getsize(photo_path)
+        except OSError:
+            continue
+        entries.append({
+            "id": entry_id,
+            "photo_path": photo_path,
+            "size": size,
+            "person_detected": bool(meta.get("person_detected")),
+            "tags": meta.get("tags") or [],
+            "telemetry": meta.get("telemetry") or {},
+            "spooled_at": meta.get("spooled_at"),
+            "resume": meta.get("resume"),
+        })
+    return entries
+
+
+def remove(entry, spool_dir=SPOOL_DIR):
+    """Drop an entry: sidecar first, so a half-removed entry is never
+    mistaken for a complete one."""
+    photo_path, meta_path = _entry_paths(spool_dir, entry["id"])
+    for path in (meta_path, photo_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _evict(spool_dir, max_entries, max_bytes):
+    """Enforce the bounds: oldest plain frames go first, detections only
+    when nothing else is left."""
+    entries = pending(spool_dir)
+    total = sum(e["size"] for e in entries)
+    victims = ([e for e in entries if not e["person_detected"]]
+               + [e for e in entries if e["person_detected"]])
+    while victims and (len(entries) > max_entries or total > max_bytes):
+        victim = victims.pop(0)
+        remove(victim, spool_dir)
+        entries.remove(victim)
+        total -= victim["size"]
+        print(f"Spool full — evicted {victim['id']}")
+
+
+def _write_durably(data, dst):
+    tmp = f"{dst}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+
+
+def new_entry_id(now=None):
+    """A fresh entry id. It doubles as the Cloudinary public_id, so it must
+    never repeat — not even after an RTC reset rewinds the clock. The
+    timestamp prefix keeps lexical order == spool order."""
+    return f"{now or datetime.now():%Y%m%d_%H%M%S}_{os.urandom(3).hex()}"
+
+
+def enqueue(photo, tags=None, telemetry=None, person_detected=False,
+            spool_dir=SPOOL_DIR, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+            entry_id=None, resume=None):
+    """Store a frame in the spool: `photo` is either a file path (moved in)
+    or the encoded JPEG bytes (written out — the only SD-card write an
+    in-memory frame ever gets). `entry_id` comes from new_entry_id() when
+    the caller needed it earlier; `resume` is kept for the uploader (the
+    form fields of a live upload that got partway). Returns the entry id,
+    or None if it couldn't be stored (a path is left where it was)."""
+    now = datetime.now()
+    entry_id = entry_id or new_entry_id(now)
+    try:
+        os.makedirs(spool_dir, exist_ok=True)
+        spooled_photo, meta_path = _entry_paths(spool_dir, entry_id)
+        if isinstance(photo, (bytes, bytearray, memoryview)):
+            _write_durably(photo, spooled_photo)
+        else:
+            _move_durably(photo, spooled_photo)
+    except OSError as e:
+        print(f"Failed to spool frame: {e}")
+        return None
+    save_state(meta_path, {
+        "person_detected": bool(person_detected),
+        "tags": list(tags or []),
+        "telemetry": telemetry or {},
+        "spooled_at": now.isoformat(timespec="seconds"),
+        "resume": resume,
+    })
+    print(f"📦 Spooled frame {entry_id} for a later upload.")
+    _evict(spool_dir, max_entries, max_bytes)
+    return entry_id
+
+
+def drain(upload, budget_seconds, order=ORDER_DETECTIONS, spool_dir=SPOOL_DIR):
+    """Upload spooled entries until the backlog is empty or the time budget
+    runs out. `upload(entry)` must return True once the frame is safely
+    stored remotely (and must be idempotent per entry["id"]). A new upload
+    isn't started if the previous one suggests it wouldn't fit the budget.
+
+    Returns (uploaded, remaining).
+    """
+    entries = pending(spool_dir)
+    if order == ORDER_DETECTIONS:
+        entries.sort(key=lambda e: not e["person_detected"])  # stable: oldest first within
+    if not entries:
+        return 0, 0
+    print(f"📦 Draining {len(entries)} spooled frame(s), budget {budget_seconds}s ({order} first).")
+    start = time.monotonic()
+    last_duration = 0.0
+    uploaded = 0
+    for entry in entries:
+        elapsed = time.monotonic() - start
+        if elapsed + last_duration > budget_seconds:
+            break
+        t0 = time.monotonic()
+        ok = upload(entry)
+        last_duration = time.monotonic() - t0
+        if not ok:
+            # Link is probably flaky again — keep the rest for next cycle.
+            print(f"Spooled upload of {entry['id']} failed; stopping drain.")
+            break
+        remove(entry, spool_dir)
+        uploaded += 1
+    remaining = len(entries) - uploaded
+    print(f"📦 Drained {uploaded} frame(s), {remaining} left in spool.")
+    return uploaded, remaining
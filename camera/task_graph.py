@@ -0,0 +1,62 @@
+"""Run the phases of a wake cycle as a dependency graph.
+
+Each task starts on its own thread as soon as its dependencies finish, and
+gets their results as positional arguments, in the order the deps were
+listed. An exception in a task propagates to every task that depends on it,
+and to `result()`.
+
+    graph = TaskGraph()
+    graph.add("internet", is_connected_to_internet)
+    graph.add("capture", capture)
+    graph.add("detect", detect, deps=("capture",))
+    graph.add("upload", upload, deps=("detect", "internet"))
+    url = graph.result("upload")
+
+Control flow that ends the cycle (handle_deep_sleep → sys.exit, os.execv)
+must stay on the main thread — tasks only compute and return values.
+"""
+
+import threading
+from concurrent.futures import Future
+
+from timing import span
+
+
+class TaskGraph:
+    def __init__(self):
+        self._futures = {}
+
+    def add(self, name, fn, deps=()):
+        """Schedule `fn(*dep_results)` to run as soon as all `deps` finish.
+        Deps must already be added, which keeps the graph acyclic."""
+        if name in self._futures:
+            raise ValueError(f"Task {name!r} already added")
+        dep_futures = [self._futures[d] for d in deps]
+        future = Future()
+
+        def run():
+            try:
+                args = [f.result() for f in dep_futures]
+                with span(name):
+                    value = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(value)
+
+        # Daemon threads: if the main thread shuts the Pi down (or execs a
+        # new process) nothing should be kept alive waiting on a dead link.
+        threading.Thread(target=run, name=f"task-{name}", daemon=True).start()
+        self._futures[name] = future
+        return future
+
+    def result(self, name, timeout=None):
+        """Block until `name` finishes and return its value (re-raises its
+        exception)."""
+        return self._futures[name].result(timeout)
+
+    def done(self, name):
+        return self._futures[name].done()
+
+    def __contains__(self, name):
+        return name in self._futures
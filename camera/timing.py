@@ -0,0 +1,193 @@
+"""Per-phase timing of a wake cycle, persisted to an on-disk ring buffer.
+
+Each phase of cycle.py is wrapped in `span("name")`, which records wall time
+and the CPU time of the calling thread. `flush()` appends the cycle's spans
+to a fixed-size binary ring buffer in STATE_DIR, so the history survives the
+power cut at the end of each cycle in a constant amount of disk space.
+
+Report over the last N cycles (run on the Pi):
+
+    python3 timing.py          # last 50 cycles
+    python3 timing.py 200
+"""
+
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import STATE_DIR
+
+TIMING_PATH = os.path.join(STATE_DIR, "timing.bin")
+# ~10 spans per cycle → the buffer holds the last ~400 cycles (~150 KB).
+CAPACITY = 4096
+
+# Header: magic, version, record size, capacity, total records written,
+# cycles written. `total` only ever grows; slot = total % capacity.
+_HEADER = struct.Struct("<4sHHIQI")
+# Record: cycle number, cycle start (epoch s), phase name, wall s, cpu s.
+_RECORD = struct.Struct("<Id24sff")
+_MAGIC = b"CTRB"
+_VERSION = 1
+
+# Whole-cycle pseudo-phase written by flush(): wall since this module was
+# imported (main.py imports it first) and process CPU including imports.
+CYCLE_PHASE = "cycle_total"
+
+_lock = threading.Lock()
+_spans = []
+_cycle_started_at = time.time()
+_cycle_started_mono = time.monotonic()
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block. CPU is per-thread (thread_time), so spans
+    running concurrently on worker threads don't count each other's work."""
+    wall_start = time.monotonic()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.monotonic() - wall_start
+        cpu = time.thread_time() - cpu_start
+        with _lock:
+            _spans.append((name, wall, cpu))
+        print(f"⏱ {name}: {wall:.2f}s wall, {cpu:.2f}s cpu")
+
+
+def elapsed():
+    """Wall seconds since the cycle started (this module's import)."""
+    return time.monotonic() - _cycle_started_mono
+
+
+def _open_buffer(path):
+    """Open the ring buffer for update, (re)initialising it if missing or
+    written by an incompatible layout. Returns (file, total, cycles)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        f = open(path, "r+b")
+        raw = f.read(_HEADER.size)
+        if len(raw) == _HEADER.size:
+            magic, version, rec_size, capacity, total, cycles = _HEADER.unpack(raw)
+            if (magic, version, rec_size, capacity) == (_MAGIC, _VERSION, _RECORD.size, CAPACITY):
+                return f, total, cycles
+        f.close()
+    except FileNotFoundError:
+        pass
+    f = open(path, "w+b")
+    f.write(_HEADER.pack(_MAGIC, _VERSION, _RECORD.size, CAPACITY, 0, 0))
+    f.truncate(_HEADER.size + _RECORD.size * CAPACITY)
+    return f, 0, 0
+
+
+def flush(path=TIMING_PATH):
+    """Append this cycle's spans plus a cycle_total record to the ring buffer.
+
+    Call right before the device shuts down (or re-execs). Records are written
+    before the header so a power cut mid-flush loses at most this cycle.
+    Never raises — timing must not be the reason a cycle fails.
+    """
+    with _lock:
+        spans = list(_spans)
+        _spans.clear()
+    spans.append((CYCLE_PHASE, time.monotonic() - _cycle_started_mono, time.process_time()))
+    try:
+        f, total, cycles = _open_buffer(path)
+        with f:
+            cycle_no = cycles + 1
+            for name, wall, cpu in spans:
+                slot = total % CAPACITY
+                f.seek(_HEADER.size + slot * _RECORD.size)
+                f.write(_RECORD.pack(cycle_no, _cycle_started_at,
+                                     name.encode()[:24], wall, cpu))
+                total += 1
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, _VERSION, _RECORD.size, CAPACITY, total, cycle_no))
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError as e:
+        print(f"Failed to persist cycle timing: {e}")
+
+
+def read_records(path=TIMING_PATH):
+    """Return all valid records, oldest first, as
+    (cycle_no, started_at, name, wall, cpu) tuples."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return []
+    if len(raw) < _HEADER.size:
+        return []
+    magic, version, rec_size, capacity, total, _ = _HEADER.unpack_from(raw)
+    if (magic, version, rec_size) != (_MAGIC, _VERSION, _RECORD.size):
+        return []
+    count = min(total, capacity)
+    first = total - count
+    records = []
+    for seq in range(first, total):
+        offset = _HEADER.size + (seq % capacity) * rec_size
+        cycle_no, started_at, name, wall, cpu = _RECORD.unpack_from(raw, offset)
+        records.append((cycle_no, started_at, name.rstrip(b"\0").decode(), wall, cpu))
+    return records
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+def summarize(records, last_cycles=50):
+    """Per-phase stats over the last `last_cycles` cycles.
+
+    Returns {phase: {"n", "wall": (p50, p90, max), "cpu": (p50, p90, max)}},
+    phases ordered by first appearance; "n" is the number of cycles.
+    """
+    keep = set(sorted({r[0] for r in records})[-last_cycles:])
+    # A phase may be entered more than once per cycle (e.g. telemetry);
+    # percentiles are over per-cycle totals.
+    totals = {}
+    for cycle_no, _, name, wall, cpu in records:
+        if cycle_no in keep:
+            prev_wall, prev_cpu = totals.get((name, cycle_no), (0.0, 0.0))
+            totals[(name, cycle_no)] = (prev_wall + wall, prev_cpu + cpu)
+    per_phase = {}
+    for (name, _), (wall, cpu) in totals.items():
+        walls, cpus = per_phase.setdefault(name, ([], []))
+        walls.append(wall)
+        cpus.append(cpu)
+    summary = {}
+    for name, (walls, cpus) in per_phase.items():
+        walls.sort()
+        cpus.sort()
+        summary[name] = {
+            "n": len(walls),
+            "wall": tuple(_percentile(walls, p) for p in (50, 90, 100)),
+            "cpu": tuple(_percentile(cpus, p) for p in (50, 90, 100)),
+        }
+    return summary
+
+
+def print_report(last_cycles=50, path=TIMING_PATH):
+    records = read_records(path)
+    if not records:
+        print(f"No timing data in {path}")
+        return
+    summary = summarize(records, last_cycles)
+    cycles = len({r[0] for r in records})
+    print(f"Phase timing over the last {min(cycles, last_cycles)} cycles (seconds)")
+    print(f"{'phase':<24}{'n':>5}  {'wall p50':>9}{'p90':>8}{'max':>8}  {'cpu p50':>8}{'p90':>8}{'max':>8}")
+    for name, s in summary.items():
+        w50, w90, wmax = s["wall"]
+        c50, c90, cmax = s["cpu"]
+        print(f"{name:<24}{s['n']:>5}  {w50:>9.2f}{w90:>8.2f}{wmax:>8.2f}  {c50:>8.2f}{c90:>8.2f}{cmax:>8.2f}")
+
+
+if __name__ == "__main__":
+    print_report(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,228 @@
+"""Shared HTTP transport for Blynk, Cloudinary and the sys API.
+
+- One process-wide `requests.Session`, so a cycle's calls to blynk.cloud
+  reuse a single keep-alive TLS connection.
+- A DNS cache persisted in STATE_DIR across boots. Entries keep the TTL the
+  resolver handed out (the nameserver from /etc/resolv.conf is asked
+  directly, because getaddrinfo hides TTLs) and are only served until it
+  expires. A dead cached address is dropped and the request retried once
+  with a fresh lookup.
+
+TLS sessions are not persisted across boots: Python's ssl module can't
+serialise an SSLSession.
+
+Benchmark against a local HTTPS stand-in server: `python3 bench.py transport`.
+"""
+
+import ipaddress
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+from utils import STATE_DIR, load_state, save_state
+
+DNS_CACHE_PATH = os.path.join(STATE_DIR, "dns_cache.json")
+# Used when the direct DNS query fails and we only have getaddrinfo's answer,
+# which carries no TTL.
+FALLBACK_TTL_SECONDS = 300
+# Upper bound on what we trust, in case the RTC jumps or a resolver lies.
+MAX_TTL_SECONDS = 24 * 3600
+DNS_QUERY_TIMEOUT = 2
+
+_real_getaddrinfo = socket.getaddrinfo
+
+
+# ---- DNS cache ---------------------------------------------------------------
+
+
+def _nameservers():
+    servers = []
+    try:
+        with open("/etc/resolv.conf", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    servers.append(parts[1])
+    except OSError:
+        pass
+    return servers
+
+
+def _skip_name(data, offset):
+    """Advance past a (possibly compressed) domain name in a DNS message."""
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+
+def _query_a(host, nameserver, timeout=DNS_QUERY_TIMEOUT):
+    """One DNS A query over UDP. Returns (ipv4 list, min TTL) — raises on any
+    failure so the caller can fall back to getaddrinfo."""
+    query_id = random.getrandbits(16)
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)  # RD=1, 1 question
+    qname = b"".join(bytes([len(p)]) + p.encode("idna") for p in host.rstrip(".").split("."))
+    query = header + qname + b"\0" + struct.pack(">HH", 1, 1)       # QTYPE=A, QCLASS=IN
+
+    family = socket.AF_INET6 if ":" in nameserver else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(query, (nameserver, 53))
+        data = sock.recv(4096)
+
+    resp_id, flags, qdcount, ancount, _, _ = struct.unpack_from(">HHHHHH", data)
+    if resp_id != query_id or flags & 0x000F:
+        raise ValueError(f"bad DNS response (id={resp_id}, rcode={flags & 0xF})")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+    ips, ttls = [], []
+    for _ in range(ancount):
+        offset = _skip_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack_from(">HHIH", data, offset)
+        offset += 10
+        if rtype == 1 and rdlength == 4:  # A record (CNAMEs in the chain are skipped)
+            ips.append(socket.inet_ntoa(data[offset:offset + 4]))
+            ttls.append(ttl)
+        offset += rdlength
+    if not ips:
+        raise ValueError("no A records")
+    return ips, min(ttls)
+
+
+def _resolve(host):
+    """(ipv4 list, ttl) for `host`: direct query first, getaddrinfo fallback."""
+    for nameserver in _nameservers():
+        try:
+            return _query_a(host, nameserver)
+        except Exception as e:
+            print(f"DNS query for {host} via {nameserver} failed: {e}")
+    infos = _real_getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
+    ips = list(dict.fromkeys(info[4][0] for info in infos))
+    return ips, FALLBACK_TTL_SECONDS
+
+
+class DnsCache:
+    """Hostname → IPv4 addresses with an absolute expiry, persisted as JSON."""
+
+    def __init__(self, path=DNS_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = load_state(path, {}) or {}
+
+    def lookup(self, host):
+        """Fresh addresses for `host`, or None if unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry and entry.get("expires_at", 0) > time.time() and entry.get("ips"):
+            return entry["ips"]
+        return None
+
+    def resolve(self, host):
+        ips = self.lookup(host)
+        if ips:
+            return ips
+        ips, ttl = _resolve(host)
+        ttl = max(0, min(ttl, MAX_TTL_SECONDS))
+        with self._lock:
+            self._entries[host] = {"ips": ips, "expires_at": time.time() + ttl}
+            save_state(self.path, self._entries)
+        return ips
+
+    def invalidate(self, host):
+        """Drop `host`; True if there was an entry to drop."""
+        with self._lock:
+            if self._entries.pop(host, None) is None:
+                return False
+            save_state(self.path, self._entries)
+            return True
+
+
+_dns_cache = DnsCache()
+
+
+def _is_ip_or_local(host):
+    if host in ("localhost", "") or host.endswith(".local"):
+        return True
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """socket.getaddrinfo served from the persisted DNS cache. Only IPv4
+    (the WiFi here is v4-only); anything else goes to the real resolver."""
+    if (not isinstance(host, str) or _is_ip_or_local(host)
+            or family not in (0, socket.AF_INET)):
+        return _real_getaddrinfo(host, port, family, type, proto, flags)
+    try:
+        ips = _dns_cache.resolve(host)
+    except Exception as e:
+        print(f"DNS cache miss for {host} failed to resolve: {e}")
+        return _real_getaddrinfo(host, port, family, type, proto, flags)
+    port = int(port) if port is not None else 0
+    sock_type = type or socket.SOCK_STREAM
+    sock_proto = proto or socket.IPPROTO_TCP
+    return [(socket.AF_INET, sock_type, sock_proto, "", (ip, port)) for ip in ips]
+
+
+# urllib3 resolves through socket.getaddrinfo; hostname (SNI, certificate
+# checks) is still the original one, only the address lookup is cached.
+socket.getaddrinfo = _cached_getaddrinfo
+
+
+# ---- HTTP --------------------------------------------------------------------
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+
+def _is_connect_failure(error):
+    """True if the request failed before anything was sent (TCP connect)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    # urllib3's NewConnectionError subclasses ConnectTimeoutError.
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def request(method, url, **kwargs):
+    """`requests.request` over the shared keep-alive session. If connecting
+    to a cached address fails, the entry is dropped and the request retried
+    once — nothing was sent yet, so the retry is safe for POSTs too."""
+    try:
+        return get_session().request(method, url, **kwargs)
+    except requests.ConnectionError as e:
+        host = urlsplit(url).hostname
+        if not (host and _is_connect_failure(e) and _dns_cache.invalidate(host)):
+            raise
+        print(f"Connection to cached address of {host} failed — re-resolving and retrying.")
+        return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
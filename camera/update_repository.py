@@ -2,7 +2,7 @@ import os
 import shutil
 import subprocess
 import sys
-from blynk import update_blynk_pin_value
+from blynk import flush_outbox, update_blynk_pin_value
 
 
 def _run(cmd, cwd=None):
@@ -44,7 +44,16 @@ def _wipe_pycache(root):
                 shutil.rmtree(os.path.join(dirpath, d), ignore_errors=True)
 
 
-def check_and_update_repository(config):
+def _compile_bytecode(root):
+    """Rebuild __pycache__ right away, so the next cold boot imports bytecode
+    instead of compiling every module (and writing the .pyc files to the SD
+    card) inside its short awake window."""
+    import compileall
+    if not compileall.compile_dir(os.path.join(root, "camera"), quiet=1):
+        print("Some modules failed to compile; they'll compile on import.")
+
+
+def check_and_update_repository(config, before_exec=None):
     """
     Fetch origin, and if there is a newer commit, hard-reset the working tree
     to origin/main and restart the script.
@@ -52,6 +61,9 @@ def check_and_update_repository(config):
     Uses --hard reset instead of `git pull` so local edits on the Pi (common
     source of silent failures) don't block the update. Errors are written to
     the Blynk error pin so they're visible without SSH access.
+
+    `before_exec` is called right before the restart, to finish whatever
+    the running cycle must not leave half done.
     """
     repo_path = config["repo_path"]
     blynk_camera_auth = config["blynk_camera_auth"]
@@ -94,6 +106,7 @@ def check_and_update_repository(config):
             return
 
         _wipe_pycache(repo_path)
+        _compile_bytecode(repo_path)
 
         main_script = os.path.join(repo_path, "camera/main.py")
         if not (os.path.isfile(main_script) and os.access(main_script, os.R_OK)):
@@ -101,6 +114,10 @@ def check_and_update_repository(config):
             return
 
         print("Restarting script with the new version...")
+        if before_exec is not None:
+            before_exec()
+        # The exec'd cycle must not read the run-update flag still set.
+        flush_outbox()
         os.execv(sys.executable, [sys.executable, main_script])
 
     except Exception as e:
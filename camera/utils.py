@@ -1,8 +1,9 @@
 import subprocess
 from datetime import datetime, timedelta
+import json
 import re
 import os
-import sys
+import resource
 import time
 
 current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
@@ -15,8 +16,42 @@ current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
 # safe margin, regardless of the configured interval.
 MIN_STARTUP_MARGIN_SECONDS = 60
 
-def generate_text(temperature, camera_number):
-    return f"CAM {camera_number}   {current_time}   {temperature}°C"
+# On-device state that must survive the power cut between cycles (timing ring
+# buffer, caches, queues). Lives next to the code so OTA `git reset --hard`
+# leaves it alone (it's gitignored) and nothing depends on /tmp, which is
+# wiped on every boot.
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+
+def load_state(path, default=None):
+    """Read a JSON state file; `default` if it's missing or unreadable
+    (e.g. half-written when power was cut)."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_state(path, data):
+    """Write a JSON state file atomically (temp file + fsync + rename), so a
+    power cut leaves either the old or the new version, never a torn one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"Failed to save state {path}: {e}")
+        return False
+
+def generate_text(temperature, camera_number, timestamp=None):
+    # Offline (spooled) frames have no temperature — don't stamp "None°C".
+    temperature = "--" if temperature is None else temperature
+    return f"CAM {camera_number}   {timestamp or current_time}   {temperature}°C"
 
 def get_wifi_signal_strength():
     try:
@@ -104,25 +139,31 @@ def is_connected_to_internet(timeout_seconds=150, retry_delay=5, grace_seconds=2
             print(f"No internet yet (attempt {attempt}) — waiting for WiFi...")
         time.sleep(retry_delay)
 
+def decode_time_interval(encoded_time):
+    """
+    Blynk's encoded working window → (start, end) as timedeltas since
+    midnight. Raises ValueError on malformed input.
+    """
+    clean_input = re.sub(r'[^\x20-\x7E]', '', f"{encoded_time}")
+    match = re.match(r'^(\d+)', clean_input)
+
+    if not match:
+        raise ValueError(f"Not match from {encoded_time}")
+    digits = match.group(1)
+
+    if len(digits) == 9:
+        digits = '0' + digits
+    elif len(digits) != 10:
+        raise ValueError(f"Invalid digits {digits} from input {encoded_time}")
+
+    start_seconds = int(digits[:5])
+    end_seconds = int(digits[5:10])
+    return timedelta(seconds=start_seconds), timedelta(seconds=end_seconds)
+
+
 def is_in_time_interval(encoded_time):
     try:
-        clean_input = re.sub(r'[^\x20-\x7E]', '', f"{encoded_time}")
-        match = re.match(r'^(\d+)', clean_input)
-        
-        if not match:
-            raise ValueError(f"Not match from {encoded_time}")
-        digits = match.group(1)
-        
-        if len(digits) == 9:
-            digits = '0' + digits
-        elif len(digits) != 10:
-            raise ValueError(f"Invalid digits {digits} from input {encoded_time}")
-        
-        start_seconds = int(digits[:5])
-        end_seconds = int(digits[5:10])
-        
-        start_time = timedelta(seconds=start_seconds)
-        end_time = timedelta(seconds=end_seconds)
+        start_time, end_time = decode_time_interval(encoded_time)
         
         start_time_str = str(datetime.min + start_time).split()[1][:5]
         end_time_str = str(datetime.min + end_time).split()[1][:5]
@@ -139,6 +180,11 @@ def is_in_time_interval(encoded_time):
         return False, None, f"Error {e}"
 
 
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (Linux: KB units)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
 def delete_photo(path):
     if os.path.exists(path):
         try:
@@ -166,18 +212,39 @@ def get_next_start_time(deep_sleep_interval):
     return startup_time.strftime("%d %H:%M:%S")
 
 
-def shutdown_device(retries=3, delay=10):
+# Held until the power goes: closing the GPIO request would release the line.
+_shutdown_line = None
+
+
+def _pull_shutdown_line(native=False):
+    """GPIO-4 low with the WiringPi `gpio` CLI, or with `native` through the
+    GPIO character device (wittypi.py), the CLI being the fallback."""
+    global _shutdown_line
+    if _shutdown_line is not None:
+        return
+    if native:
+        try:
+            from wittypi import GpioLine, SHUTDOWN_GPIO
+            _shutdown_line = GpioLine(SHUTDOWN_GPIO, 0)
+            return
+        except OSError as e:
+            print(f"GPIO character device unavailable ({e}), using the gpio CLI.")
+    # Set GPIO pin 4 as output
+    subprocess.run(["gpio", "-g", "mode", "4", "out"], check=True)
+    # Write a value of 0 to GPIO pin 4, which should trigger device shutdown
+    subprocess.run(["gpio", "-g", "write", "4", "0"], check=True)
+
+
+def shutdown_device(retries=3, delay=10, native_gpio=False):
     """
     Attempts to shut down the device by setting the GPIO pin.
     If the device does not shut down within 10 seconds, it assumes the shutdown failed and tries again.
+    `native_gpio` drives the pin through the GPIO character device instead of the gpio CLI.
     """
     for attempt in range(1, retries + 1):
         print(f"🔻 Attempting to shut down the device via GPIO, attempt {attempt}...")
         try:
-            # Set GPIO pin 4 as output
-            subprocess.run(["gpio", "-g", "mode", "4", "out"], check=True)
-            # Write a value of 0 to GPIO pin 4, which should trigger device shutdown
-            subprocess.run(["gpio", "-g", "write", "4", "0"], check=True)
+            _pull_shutdown_line(native_gpio)
         except Exception as e:
             print(f"⚠️ Error on attempt {attempt} during GPIO setup: {e}")
             time.sleep(delay)
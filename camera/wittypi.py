@@ -0,0 +1,206 @@
+"""Native WittyPi 4 Mini driver: RTC time, startup alarm and the shutdown GPIO.
+
+Talks to the board's two I2C devices and its GPIO line directly:
+
+- the PCF85063 RTC at RTC_ADDRESS: time in BCD, registers 0x04-0x0A;
+- the board MCU at MCU_ADDRESS: the startup alarm (ALARM1) is four BCD
+  config registers, the same ones wittyPi.sh's set_startup_time writes,
+  and the measured input voltage is two plain registers;
+- BCM GPIO 4, held low to make the MCU cut the power.
+
+Witty Pi 4 keeps the RTC and the alarms in UTC (its scripts convert with
+local_to_utc/utc_to_local); this module takes and returns the camera's
+local "dd HH:MM:SS" strings like the menu does.
+
+The bus is anything with read(address, register, length) and
+write(address, register, data): I2CBus for the real /dev/i2c-N, FakeBus (an
+in-memory register file) for development and `python3 bench.py wittypi`.
+"""
+
+import ctypes
+import fcntl
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+
+I2C_BUS = 1
+MCU_ADDRESS = 0x08
+RTC_ADDRESS = 0x51
+RTC_SECONDS = 0x04          # seconds, minutes, hours, days, weekdays, months, years
+MCU_ALARM1_SECOND = 27      # second, minute, hour, day (I2C_CONF_*_ALARM1)
+MCU_VOLTAGE_IN = 1          # integer volts, then hundredths (I2C_VOLTAGE_IN_I/_D)
+SHUTDOWN_GPIO = 4
+GPIO_CHIP = "/dev/gpiochip0"
+
+_I2C_RDWR = 0x0707
+_I2C_M_RD = 0x0001
+# _IOWR(0xB4, 0x03, struct gpiohandle_request), the v1 line-handle API.
+_GPIO_GET_LINEHANDLE_IOCTL = 0xC16CB403
+_GPIOHANDLE_REQUEST_OUTPUT = 1 << 1
+
+
+def _bcd(value):
+    return (value // 10) << 4 | value % 10
+
+
+def _from_bcd(value):
+    return (value >> 4) * 10 + (value & 0x0F)
+
+
+class _I2CMsg(ctypes.Structure):
+    _fields_ = [("addr", ctypes.c_uint16), ("flags", ctypes.c_uint16),
+                ("len", ctypes.c_uint16), ("buf", ctypes.POINTER(ctypes.c_uint8))]
+
+
+class _I2CRdwrData(ctypes.Structure):
+    _fields_ = [("msgs", ctypes.POINTER(_I2CMsg)), ("nmsgs", ctypes.c_uint32)]
+
+
+class I2CBus:
+    """/dev/i2c-N through the I2C_RDWR ioctl: a register read is one
+    combined write-pointer + repeated-start read, like i2cget does."""
+
+    def __init__(self, bus=I2C_BUS):
+        self.fd = os.open(f"/dev/i2c-{bus}", os.O_RDWR)
+
+    def _transfer(self, *messages):
+        msgs = (_I2CMsg * len(messages))(*messages)
+        fcntl.ioctl(self.fd, _I2C_RDWR, _I2CRdwrData(msgs, len(messages)))
+
+    def read(self, address, register, length):
+        pointer = (ctypes.c_uint8 * 1)(register)
+        data = (ctypes.c_uint8 * length)()
+        self._transfer(_I2CMsg(address, 0, 1, pointer), _I2CMsg(address, _I2C_M_RD, length, data))
+        return bytes(data)
+
+    def write(self, address, register, data):
+        buf = (ctypes.c_uint8 * (len(data) + 1))(register, *data)
+        self._transfer(_I2CMsg(address, 0, len(buf), buf))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FakeBus:
+    """In-memory stand-in: a 256-byte register file per address. The RTC
+    doesn't tick on its own; `writes` counts transactions."""
+
+    def __init__(self):
+        self.registers = {}
+        self.writes = 0
+
+    def _device(self, address):
+        return self.registers.setdefault(address, bytearray(256))
+
+    def read(self, address, register, length):
+        return bytes(self._device(address)[register:register + length])
+
+    def write(self, address, register, data):
+        self._device(address)[register:register + len(data)] = bytes(data)
+        self.writes += 1
+
+    def close(self):
+        pass
+
+
+def _next_occurrence(day, hour, minute, second, now):
+    """The first datetime after `now` (same tzinfo) on day-of-month `day`
+    at hour:minute:second — what a "dd HH:MM:SS" alarm will match next."""
+    year, month = now.year, now.month
+    for _ in range(13):
+        try:
+            candidate = now.replace(year=year, month=month, day=day, hour=hour, minute=minute,
+                                    second=second, microsecond=0)
+        except ValueError:
+            candidate = None  # no such day this month
+        if candidate is not None and candidate > now - timedelta(seconds=1):
+            return candidate
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    raise ValueError(f"day {day} never occurs")
+
+
+class WittyPi:
+    def __init__(self, bus=None):
+        self.bus = bus if bus is not None else I2CBus()
+
+    def read_rtc(self):
+        """RTC time as an aware UTC datetime."""
+        raw = self.bus.read(RTC_ADDRESS, RTC_SECONDS, 7)
+        return datetime(
+            2000 + _from_bcd(raw[6]), _from_bcd(raw[5] & 0x1F), _from_bcd(raw[3] & 0x3F),
+            _from_bcd(raw[2] & 0x3F), _from_bcd(raw[1] & 0x7F), _from_bcd(raw[0] & 0x7F),
+            tzinfo=timezone.utc,
+        )
+
+    def write_rtc(self, when):
+        """Set the RTC (also clears the oscillator-stop flag in bit 7 of
+        the seconds register). `when` must be timezone-aware."""
+        utc = when.astimezone(timezone.utc)
+        self.bus.write(RTC_ADDRESS, RTC_SECONDS, bytes([
+            _bcd(utc.second), _bcd(utc.minute), _bcd(utc.hour), _bcd(utc.day),
+            utc.isoweekday() % 7, _bcd(utc.month), _bcd(utc.year - 2000),
+        ]))
+
+    def read_startup(self, now=None):
+        """The scheduled startup as local "dd HH:MM:SS", None if unset."""
+        second, minute, hour, day = (_from_bcd(b) for b in self.bus.read(MCU_ADDRESS, MCU_ALARM1_SECOND, 4))
+        if day == 0:
+            return None
+        now = now or datetime.now(timezone.utc)
+        startup = _next_occurrence(day, hour, minute, second, now.astimezone(timezone.utc)).astimezone()
+        return startup.strftime("%d %H:%M:%S")
+
+    def set_startup(self, startup_time_str, now=None):
+        """Schedule the next startup at local "dd HH:MM:SS"."""
+        day, clock = startup_time_str.split(" ")
+        hour, minute, second = (int(v) for v in clock.split(":"))
+        # Naive local time, so the conversion uses the UTC offset of the
+        # startup's own day — the night may cross a DST change.
+        now = (now or datetime.now(timezone.utc)).astimezone().replace(tzinfo=None)
+        utc = _next_occurrence(int(day), hour, minute, second, now).astimezone(timezone.utc)
+        self.bus.write(MCU_ADDRESS, MCU_ALARM1_SECOND,
+                       bytes([_bcd(utc.second), _bcd(utc.minute), _bcd(utc.hour), _bcd(utc.day)]))
+
+    def read_input_voltage(self):
+        """Supply voltage at the WittyPi input, in volts."""
+        whole, hundredths = self.bus.read(MCU_ADDRESS, MCU_VOLTAGE_IN, 2)
+        return whole + hundredths / 100
+
+    def close(self):
+        self.bus.close()
+
+
+class GpioLine:
+    """One output line requested through the GPIO character device. The
+    line keeps its value only while the request (self.fd) is open."""
+
+    def __init__(self, offset, value, chip=GPIO_CHIP, consumer="camera"):
+        # struct gpiohandle_request: lineoffsets[64], flags, default_values[64],
+        # consumer_label[32], lines, fd.
+        request = bytearray(struct.pack(
+            "64II64B32sIi", *([offset] + [0] * 63), _GPIOHANDLE_REQUEST_OUTPUT,
+            *([value] + [0] * 63), consumer.encode(), 1, -1,
+        ))
+        chip_fd = os.open(chip, os.O_RDWR)
+        try:
+            fcntl.ioctl(chip_fd, _GPIO_GET_LINEHANDLE_IOCTL, request)
+        finally:
+            os.close(chip_fd)
+        self.fd = struct.unpack_from("i", request, len(request) - 4)[0]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FakeGpioLine:
+    def __init__(self, offset, value, chip=GPIO_CHIP, consumer="camera"):
+        self.offset, self.value = offset, value
+
+    def close(self):
+        pass
+
+
+def system_clock_synchronized():
+    """True once NTP has set the system clock this boot (systemd-timesyncd
+    touches this file) — only then is it worth copying into the RTC."""
+    return os.path.exists("/run/systemd/timesync/synchronized")
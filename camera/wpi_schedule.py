@@ -0,0 +1,153 @@
+"""Daily WittyPi schedule script (.wpi) built from the working window.
+
+Once a day the Blynk working window and interval are turned into a script
+with one wake per slot,
+
+    start, start + interval, ... up to the window's end,
+
+installed as <witty_pi_path>/schedule.wpi. WittyPi's runScript.sh arms the
+next ON state's startup from it at every boot, so an ordinary cycle leaves
+the alarm alone. Each ON state lasts the slot minus OFF_SECONDS and WAITs
+for the Pi to shut itself down, like on_10_min_every_hour.wpi. The last OFF
+state runs until tomorrow's window start, so the script repeats every 24 h.
+Reinstalling daily re-anchors it (daylight-saving changes, new settings).
+
+A cycle that wants something else — burst mode's immediate re-wake, an
+energy-scheduler interval, a cycle that overran its slot — still programs
+its own startup, which holds until the next boot re-arms the schedule.
+Turning the option off again leaves schedule.wpi behind; remove it (or pick
+another script in wittyPi.sh) so boots stop re-arming it.
+"""
+
+import os
+import subprocess
+from datetime import datetime, timedelta
+
+from utils import MIN_STARTUP_MARGIN_SECONDS, STATE_DIR, load_state, save_state
+from witty_sheduler import PROCESS_TIMEOUT, read_scheduled_startup
+
+STATE_PATH = os.path.join(STATE_DIR, "wpi_schedule.json")
+SCHEDULE_FILE = "schedule.wpi"
+# What wittyPi.sh's "choose schedule script" runs after copying a script.
+RUN_SCRIPT = ["bash", "runScript.sh", "0", "revise"]
+OFF_SECONDS = 60
+END = "2035-12-31 23:59:59"
+STARTUP_FORMAT = "%d %H:%M:%S"
+
+
+def _duration(seconds):
+    """Seconds → .wpi duration tokens, e.g. 330 → "M5 S30"."""
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (("D", 86400), ("H", 3600), ("M", 60), ("S", 1)):
+        if seconds >= size:
+            parts.append(f"{unit}{seconds // size}")
+            seconds %= size
+    return " ".join(parts) or "S0"
+
+
+def slots(window, interval):
+    """Wake times of one day, as timedeltas since midnight."""
+    if interval <= 0:
+        raise ValueError(f"interval must be positive, got {interval}")
+    start, end = window
+    step = timedelta(seconds=interval)
+    times = []
+    t = start
+    while t <= end:
+        times.append(t)
+        t += step
+    return times
+
+
+def generate(window, interval, day):
+    """The .wpi text for `window` (start, end timedeltas since midnight) and
+    `interval` seconds, starting on `day`."""
+    wakes = slots(window, interval)
+    off = min(OFF_SECONDS, interval // 2)
+    begin = datetime.combine(day, datetime.min.time()) + wakes[0]
+    lines = [
+        f"# Generated by wpi_schedule.py: {len(wakes)} wakes a day, every {interval}s "
+        f"from {begin:%H:%M:%S}.",
+        f"BEGIN\t{begin:%Y-%m-%d %H:%M:%S}",
+        f"END\t{END}",
+    ]
+    for i, wake in enumerate(wakes):
+        following = wakes[i + 1] if i + 1 < len(wakes) else wakes[0] + timedelta(days=1)
+        slot = (following - wake).total_seconds()
+        on = interval - off if i + 1 < len(wakes) else min(interval - off, slot - off)
+        lines.append(f"ON\t{_duration(on)}\tWAIT")
+        lines.append(f"OFF\t{_duration(slot - on)}")
+    return "\n".join(lines) + "\n"
+
+
+def next_slot(when, window, interval):
+    """The first wake strictly after `when` (naive local datetime)."""
+    midnight = when.replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in (midnight, midnight + timedelta(days=1)):
+        for wake in slots(window, interval):
+            if day + wake > when:
+                return day + wake
+    raise ValueError("empty working window")
+
+
+class DailySchedule:
+    def __init__(self, window, interval):
+        self.window = window
+        # Like get_next_start_time: a shorter interval would arm startups
+        # WittyPi misses (and 0 or less would never end the day's slots).
+        self.interval = max(int(interval), MIN_STARTUP_MARGIN_SECONDS)
+        self.key = f"{int(window[0].total_seconds())}-{int(window[1].total_seconds())}-{self.interval}"
+        self.installed = None
+
+    def ensure_installed(self, wittypi_path, driver, now=None):
+        """Install today's script unless that's already been tried. Returns
+        True when the schedule is in place and armed what it should; after
+        a failed attempt, cycles schedule themselves until tomorrow."""
+        if self.installed is not None:
+            return self.installed
+        now = now or datetime.now()
+        state = load_state(STATE_PATH, {}) or {}
+        if state.get("date") == now.date().isoformat() and state.get("key") == self.key:
+            self.installed = state.get("ok", False)
+            return self.installed
+        self.installed = False
+        if not slots(self.window, self.interval):
+            return False
+        save_state(STATE_PATH, {"date": now.date().isoformat(), "key": self.key, "ok": False})
+
+        path = os.path.join(wittypi_path, SCHEDULE_FILE)
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                f.write(generate(self.window, self.interval, now.date()))
+            os.replace(f"{path}.tmp", path)
+            subprocess.run(RUN_SCRIPT, cwd=wittypi_path, capture_output=True, text=True,
+                           timeout=PROCESS_TIMEOUT, check=True)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Installing the daily WittyPi schedule failed: {e}")
+            return False
+
+        expected = next_slot(now, self.window, self.interval).strftime(STARTUP_FORMAT)
+        armed = read_scheduled_startup(wittypi_path, driver)
+        if armed != expected:
+            print(f"Daily WittyPi schedule armed {armed}, expected {expected} — scheduling per cycle.")
+            return False
+        save_state(STATE_PATH, {"date": now.date().isoformat(), "key": self.key, "ok": True})
+        print(f"📅 Daily WittyPi schedule installed ({len(slots(self.window, self.interval))} wakes).")
+        self.installed = True
+        return True
+
+    def covers(self, interval, startup_time_str, wittypi_path, driver, now=None):
+        """Whether the startup WittyPi has armed is the one this cycle wants:
+        a plain in-hours interval, or the window start that out-of-hours
+        wakes sleep until (`startup_time_str`). Read back rather than
+        assumed: a cycle that overran its slot, or woke from an override,
+        has something else armed (or a time too close to make)."""
+        now = now or datetime.now()
+        expected = next_slot(now + timedelta(seconds=MIN_STARTUP_MARGIN_SECONDS), self.window, self.interval)
+        expected = expected.strftime(STARTUP_FORMAT)
+        if startup_time_str is not None and startup_time_str != expected:
+            return False
+        if startup_time_str is None and int(interval) != self.interval:
+            return False
+        return read_scheduled_startup(wittypi_path, driver) == expected
@@ -0,0 +1,201 @@
+"""Darknet → ONNX export (and INT8 quantization) of the YOLOv4-tiny model.
+
+Only the repo's cfg + the Darknet weights ship to the camera, so the ONNX
+Runtime backends build their models on the Pi itself, once (inference.py
+calls this during calibration and keeps the results in STATE_DIR):
+
+- export_onnx() turns the cfg + weights into an ONNX graph. Batch norm is
+  folded into the convolutions. The graph stops at the two [yolo] heads and
+  outputs their raw (N, anchors × (5 + classes), H, W) maps; decoding them
+  into region rows is inference.decode_heads().
+- quantize_int8() makes a statically quantized copy (QDQ, per-channel int8
+  weights, uint8 activations), calibrated on real frames.
+
+Needs the `onnx` package (export) and `onnxruntime` (quantization). Neither
+is required at runtime by the OpenCV backend.
+"""
+
+import numpy as np
+
+LEAKY_SLOPE = 0.1
+BATCH_NORM_EPS = 1e-5
+
+
+def parse_cfg(cfg_path):
+    """Darknet cfg → list of (section, {key: value}) in file order."""
+    sections = []
+    with open(cfg_path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith("["):
+                sections.append((line[1:-1].strip(), {}))
+            else:
+                key, value = line.split("=", 1)
+                sections[-1][1][key.strip()] = value.strip()
+    return sections
+
+
+def yolo_layers(cfg_path):
+    """The [yolo] heads, in output order: dicts with `anchors` ((w, h) in
+    network-input px, this head's mask only), `classes` and `scale_x_y`."""
+    heads = []
+    for name, options in parse_cfg(cfg_path):
+        if name != "yolo":
+            continue
+        values = [float(v) for v in options["anchors"].split(",")]
+        pairs = list(zip(values[0::2], values[1::2]))
+        mask = [int(v) for v in options["mask"].split(",")]
+        heads.append({
+            "anchors": [pairs[i] for i in mask],
+            "classes": int(options["classes"]),
+            "scale_x_y": float(options.get("scale_x_y", 1.0)),
+        })
+    return heads
+
+
+def input_size(cfg_path):
+    net = parse_cfg(cfg_path)[0][1]
+    return int(net["width"]), int(net["height"])
+
+
+def _read_weights(weights_path):
+    """The float32 weight stream after the Darknet header."""
+    with open(weights_path, "rb") as f:
+        major, minor, _ = np.frombuffer(f.read(12), dtype=np.int32)
+        f.read(8 if major * 10 + minor >= 2 else 4)  # images seen
+        return np.frombuffer(f.read(), dtype=np.float32)
+
+
+def export_onnx(cfg_path, weights_path, onnx_path):
+    """Write the ONNX graph of a Darknet model. Supports the layer types
+    YOLOv4-tiny uses: convolutional, maxpool, route (incl. groups),
+    upsample and yolo. Input "input" is (N, 3, H, W) RGB in 0..1, the same
+    blob OpenCV's blobFromImages makes."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    sections = parse_cfg(cfg_path)
+    width, height = input_size(cfg_path)
+    weights = _read_weights(weights_path)
+    offset = 0
+
+    def take(count):
+        nonlocal offset
+        chunk = weights[offset:offset + count]
+        if len(chunk) != count:
+            raise ValueError(f"{weights_path} is too short for {cfg_path}")
+        offset += count
+        return chunk
+
+    nodes, initializers, outputs = [], [], []
+    layer_outputs, layer_channels = [], []
+    current, channels = "input", 3
+
+    def const(name, array):
+        initializers.append(numpy_helper.from_array(np.ascontiguousarray(array), name))
+        return name
+
+    for index, (name, options) in enumerate(sections[1:]):
+        out = f"layer{index}"
+        if name == "convolutional":
+            filters, size = int(options["filters"]), int(options["size"])
+            stride = int(options.get("stride", 1))
+            pad = size // 2 if int(options.get("pad", 0)) else int(options.get("padding", 0))
+            if int(options.get("batch_normalize", 0)):
+                bias, scale, mean, var = (take(filters) for _ in range(4))
+                kernel = take(filters * channels * size * size).reshape(filters, channels, size, size)
+                factor = scale / np.sqrt(var + BATCH_NORM_EPS)
+                kernel = kernel * factor[:, None, None, None]
+                bias = bias - mean * factor
+            else:
+                bias = take(filters)
+                kernel = take(filters * channels * size * size).reshape(filters, channels, size, size)
+            activation = options.get("activation", "linear")
+            conv_out = f"{out}_conv" if activation != "linear" else out
+            nodes.append(helper.make_node(
+                "Conv", [current, const(f"{out}_w", kernel.astype(np.float32)),
+                         const(f"{out}_b", bias.astype(np.float32))], [conv_out],
+                kernel_shape=[size, size], strides=[stride, stride], pads=[pad] * 4))
+            if activation == "leaky":
+                nodes.append(helper.make_node("LeakyRelu", [conv_out], [out], alpha=LEAKY_SLOPE))
+            elif activation != "linear":
+                raise ValueError(f"unsupported activation {activation!r} in layer {index}")
+            channels = filters
+        elif name == "maxpool":
+            size, stride = int(options["size"]), int(options.get("stride", 1))
+            nodes.append(helper.make_node(
+                "MaxPool", [current], [out], kernel_shape=[size, size], strides=[stride, stride]))
+        elif name == "route":
+            sources = [int(v) for v in options["layers"].split(",")]
+            sources = [s if s >= 0 else index + s for s in sources]
+            groups = int(options.get("groups", 1))
+            if groups > 1:
+                source_channels = layer_channels[sources[0]]
+                channels = source_channels // groups
+                start = int(options.get("group_id", 0)) * channels
+                nodes.append(helper.make_node(
+                    "Slice", [layer_outputs[sources[0]],
+                              const(f"{out}_starts", np.array([start], np.int64)),
+                              const(f"{out}_ends", np.array([start + channels], np.int64)),
+                              const(f"{out}_axes", np.array([1], np.int64))], [out]))
+            elif len(sources) == 1:
+                nodes.append(helper.make_node("Identity", [layer_outputs[sources[0]]], [out]))
+                channels = layer_channels[sources[0]]
+            else:
+                nodes.append(helper.make_node("Concat", [layer_outputs[s] for s in sources], [out], axis=1))
+                channels = sum(layer_channels[s] for s in sources)
+        elif name == "upsample":
+            stride = float(options.get("stride", 2))
+            nodes.append(helper.make_node(
+                "Resize", [current, "", const(f"{out}_scales", np.array([1, 1, stride, stride], np.float32))],
+                [out], mode="nearest"))
+        elif name == "yolo":
+            outputs.append((current, channels))
+            out = current
+        else:
+            raise ValueError(f"unsupported layer [{name}] ({index})")
+        layer_outputs.append(out)
+        layer_channels.append(channels)
+        current = out
+
+    if offset != len(weights):
+        raise ValueError(f"{weights_path} has {len(weights) - offset} floats more than {cfg_path} uses")
+
+    graph = helper.make_graph(
+        nodes, "yolo",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 3, height, width])],
+        [helper.make_tensor_value_info(name, TensorProto.FLOAT, ["N", head_channels, None, None])
+         for name, head_channels in outputs],
+        initializers,
+    )
+    # IR 8 loads on any onnxruntime >= 1.10, not just the newest.
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+    onnx.checker.check_model(model)
+    onnx.save(model, onnx_path)
+    return onnx_path
+
+
+def quantize_int8(onnx_path, int8_path, blobs):
+    """Static INT8 copy of an exported model, calibrated on `blobs` — input
+    blobs (N, 3, H, W) of real frames, so the activation ranges match what
+    the camera actually sees."""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._blobs = iter(blobs)
+
+        def get_next(self):
+            blob = next(self._blobs, None)
+            return None if blob is None else {"input": blob}
+
+    quantize_static(
+        onnx_path, int8_path, Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    return int8_path
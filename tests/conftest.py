@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The camera modules are scripts run from camera/, importing each other flat.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "camera"))
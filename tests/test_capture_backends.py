@@ -0,0 +1,24 @@
+import camera
+
+
+def test_fake_backend_copies_its_source(tmp_path):
+    source = tmp_path / "source.jpg"
+    source.write_bytes(b"\xff\xd8jpeg")
+    backend = camera.FakeBackend(source=str(source))
+    for i in range(2):
+        assert backend.capture(str(tmp_path / f"{i}.jpg")) == (True, None)
+        assert (tmp_path / f"{i}.jpg").read_bytes() == b"\xff\xd8jpeg"
+    assert backend.frames == 2
+
+
+def test_fake_backend_reports_a_failed_capture(tmp_path):
+    backend = camera.FakeBackend(source=str(tmp_path / "missing.jpg"))
+    ok, error = backend.capture(str(tmp_path / "photo.jpg"))
+    assert not ok
+    assert "capturing the photo" in error
+    assert backend.frames == 0
+
+
+def test_unknown_backend_falls_back_to_oneshot():
+    assert isinstance(camera.get_capture_backend("nope", False), camera.OneShotBackend)
+    assert isinstance(camera.get_capture_backend("fake", False), camera.FakeBackend)
@@ -0,0 +1,139 @@
+import pytest
+import requests
+
+import cloudinary
+import transport
+
+URL = "https://api.example/upload"
+MIN_CHUNK = 5 * 1024 * 1024
+
+
+class _Response:
+    def __init__(self, status_code, result):
+        self.status_code = status_code
+        self.result = result
+        self.text = str(result)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self.result
+
+
+class StubServer:
+    """Cloudinary's upload endpoint: assembles chunks per upload id, refuses
+    a non-final chunk under 5 MB and drops every request while `down`."""
+
+    def __init__(self):
+        self.requests = []
+        self.uploads = {}
+        self.down = False
+        self.reject_chunks = False
+
+    def post(self, url, files, data, headers=None, timeout=None):
+        filename, piece, content_type = files["file"]
+        headers = headers or {}
+        self.requests.append((headers, len(piece), content_type))
+        if self.down:
+            raise requests.ConnectionError("link dropped")
+        if "Content-Range" not in headers:
+            return _Response(200, {"secure_url": "https://res.example/single.jpg"})
+        if self.reject_chunks:
+            return _Response(400, {"error": "chunked uploads not allowed"})
+        first_last, total = headers["Content-Range"].split()[1].split("/")
+        first, last = (int(v) for v in first_last.split("-"))
+        if last + 1 < int(total) and last + 1 - first < MIN_CHUNK:
+            return _Response(400, {"error": "chunk too small"})
+        received = self.uploads.setdefault(headers["X-Unique-Upload-Id"], bytearray())
+        assert first == len(received)
+        received += piece
+        if len(received) == int(total):
+            return _Response(200, {"secure_url": "https://res.example/chunked.jpg"})
+        return _Response(200, {"done": False})
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = StubServer()
+    monkeypatch.setattr(transport, "post", server.post)
+    monkeypatch.setattr(cloudinary, "STATE_PATH", str(tmp_path / "cloudinary_uploads.json"))
+    monkeypatch.setattr(cloudinary, "RETRY_DELAY_SECONDS", 0)
+    return server
+
+
+def _upload(content, **kwargs):
+    return cloudinary.upload_to_cloudinary(content, URL, "preset", 1, **kwargs)
+
+
+def test_failed_upload_resumes_from_last_chunk(server, monkeypatch):
+    content = bytes(range(256)) * (48 * 1024)
+    calls = []
+
+    def drop_after_first_chunk(url, **kwargs):
+        calls.append(kwargs)
+        if len(calls) > 1:
+            server.down = True
+        return server.post(url, **kwargs)
+
+    monkeypatch.setattr(transport, "post", drop_after_first_chunk)
+    assert _upload(content, resume_key="entry") is None
+    assert cloudinary.has_progress("entry")
+    upload_id = calls[0]["headers"]["X-Unique-Upload-Id"]
+
+    server.down = False
+    server.requests.clear()
+    monkeypatch.setattr(transport, "post", server.post)
+    assert _upload(content, resume_key="entry") == "https://res.example/chunked.jpg"
+    headers = server.requests[0][0]
+    assert headers["X-Unique-Upload-Id"] == upload_id
+    assert headers["Content-Range"].startswith(f"bytes {MIN_CHUNK}-")
+    assert bytes(server.uploads[upload_id]) == content
+    assert not cloudinary.has_progress("entry")
+
+
+def test_other_bytes_under_the_key_start_over(server):
+    server.down = True
+    _upload(b"a" * 3000, resume_key="entry")
+    server.down = False
+    server.requests.clear()
+    assert _upload(b"b" * 3000, resume_key="entry") == "https://res.example/chunked.jpg"
+    headers = server.requests[0][0]
+    assert headers["Content-Range"] == "bytes 0-2999/3000"
+    assert [bytes(received) for received in server.uploads.values()] == [b"b" * 3000]
+
+
+def test_non_final_chunks_are_never_under_the_minimum(server):
+    content = b"x" * (3 * MIN_CHUNK)
+    assert _upload(content) == "https://res.example/chunked.jpg"
+    assert len(server.requests) > 1
+    assert all(size >= MIN_CHUNK for _, size, _ in server.requests[:-1])
+
+
+def test_chunks_stay_at_the_minimum_after_a_drop(server, monkeypatch):
+    content = b"x" * (3 * MIN_CHUNK)
+    calls = []
+
+    def drop_second_request(url, **kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise requests.ConnectionError("link dropped")
+        return server.post(url, **kwargs)
+
+    monkeypatch.setattr(transport, "post", drop_second_request)
+    assert _upload(content) == "https://res.example/chunked.jpg"
+    assert all(size >= MIN_CHUNK for _, size, _ in server.requests[:-1])
+
+
+def test_refused_chunking_falls_back_to_one_request(server):
+    server.reject_chunks = True
+    assert _upload(b"x" * 3000) == "https://res.example/single.jpg"
+    assert "Content-Range" not in server.requests[-1][0]
+
+
+def test_content_type_follows_the_bytes(server):
+    webp = b"RIFF\x00\x00\x00\x00WEBPVP8 " + b"x" * 100
+    _upload(webp, filename="photo.webp")
+    _upload(b"\xff\xd8\xff" + b"x" * 100)
+    assert [content_type for _, _, content_type in server.requests] == ["image/webp", "image/jpeg"]
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime
+
+import spool
+
+
+def _enqueue(spool_dir, second, person_detected=False, size=10, **bounds):
+    # Explicit ids: entries spooled within one second have no defined order.
+    entry_id = spool.new_entry_id(datetime(2026, 10, 18, 12, 0, second))
+    return spool.enqueue(b"x" * size, tags=["t"], person_detected=person_detected,
+                         spool_dir=spool_dir, entry_id=entry_id, **bounds)
+
+
+def test_enqueue_and_pending(tmp_path):
+    entry_id = _enqueue(str(tmp_path), 0, person_detected=True)
+    (entry,) = spool.pending(str(tmp_path))
+    assert entry["id"] == entry_id
+    assert entry["size"] == 10
+    assert entry["person_detected"] is True
+    assert entry["tags"] == ["t"]
+    assert entry["resume"] is None
+
+
+def test_enqueue_moves_a_file_in(tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"jpeg")
+    spool_dir = tmp_path / "spool"
+    spool.enqueue(str(photo), spool_dir=str(spool_dir))
+    assert not photo.exists()
+    (entry,) = spool.pending(str(spool_dir))
+    assert open(entry["photo_path"], "rb").read() == b"jpeg"
+
+
+def test_photo_without_sidecar_is_still_pending(tmp_path):
+    entry_id = _enqueue(str(tmp_path), 0)
+    (tmp_path / f"{entry_id}.json").unlink()
+    (entry,) = spool.pending(str(tmp_path))
+    assert entry["id"] == entry_id
+    assert entry["tags"] == []
+
+
+def test_eviction_keeps_detections(tmp_path):
+    spool_dir = str(tmp_path)
+    detection = _enqueue(spool_dir, 0, person_detected=True, max_entries=2)
+    plain = [_enqueue(spool_dir, s, max_entries=2) for s in (1, 2)]
+    assert [e["id"] for e in spool.pending(spool_dir)] == [detection, plain[1]]
+
+
+def test_eviction_by_bytes(tmp_path):
+    spool_dir = str(tmp_path)
+    ids = [_enqueue(spool_dir, s, size=40, max_bytes=100) for s in range(4)]
+    assert [e["id"] for e in spool.pending(spool_dir)] == ids[2:]
+
+
+def test_eviction_takes_detections_last(tmp_path):
+    spool_dir = str(tmp_path)
+    ids = [_enqueue(spool_dir, s, person_detected=True, max_entries=2) for s in range(3)]
+    assert [e["id"] for e in spool.pending(spool_dir)] == ids[1:]
+
+
+def test_drain_detections_first(tmp_path):
+    spool_dir = str(tmp_path)
+    plain = _enqueue(spool_dir, 0)
+    detection = _enqueue(spool_dir, 1, person_detected=True)
+    newer_plain = _enqueue(spool_dir, 2)
+    sent = []
+    assert spool.drain(lambda e: sent.append(e["id"]) or True, 60, spool_dir=spool_dir) == (3, 0)
+    assert sent == [detection, plain, newer_plain]
+    assert spool.pending(spool_dir) == []
+
+
+def test_drain_oldest_first(tmp_path):
+    spool_dir = str(tmp_path)
+    ids = [_enqueue(spool_dir, s, person_detected=s == 1) for s in range(3)]
+    sent = []
+    spool.drain(lambda e: sent.append(e["id"]) or True, 60, order=spool.ORDER_OLDEST, spool_dir=spool_dir)
+    assert sent == ids
+
+
+def test_drain_stops_at_first_failure(tmp_path):
+    spool_dir = str(tmp_path)
+    ids = [_enqueue(spool_dir, s) for s in range(3)]
+    sent = []
+
+    def upload(entry):
+        sent.append(entry["id"])
+        return entry["id"] != ids[1]
+
+    assert spool.drain(upload, 60, spool_dir=spool_dir) == (1, 2)
+    assert sent == ids[:2]
+    assert [e["id"] for e in spool.pending(spool_dir)] == ids[1:]
+
+
+def test_drain_stops_before_an_upload_that_would_overrun(tmp_path):
+    spool_dir = str(tmp_path)
+    for s in range(3):
+        _enqueue(spool_dir, s)
+
+    def slow_upload(entry):
+        time.sleep(0.2)
+        return True
+
+    assert spool.drain(slow_upload, 0.3, spool_dir=spool_dir) == (1, 2)
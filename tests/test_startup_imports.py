@@ -0,0 +1,32 @@
+import os
+import statistics
+import subprocess
+import sys
+
+import cycle
+
+CAMERA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "camera")
+RUNS = 5
+
+
+def _import_main():
+    """(seconds, heavy modules loaded) for `import main` in a fresh
+    interpreter: this one has whatever other tests imported."""
+    statement = ("import sys, time; start = time.perf_counter(); import main, cycle; "
+                 "print(time.perf_counter() - start); "
+                 "print(','.join(m for m in cycle.HEAVY_MODULES if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", statement], cwd=CAMERA_DIR,
+                            capture_output=True, text=True, timeout=60, check=True)
+    seconds, heavy = (result.stdout.splitlines() + [""])[:2]
+    return float(seconds), heavy
+
+
+def test_entry_point_imports_no_heavy_modules():
+    _, heavy = _import_main()
+    assert heavy == ""
+
+
+def test_entry_point_import_within_budget():
+    _import_main()  # compile into __pycache__, as on every boot but the first
+    median = statistics.median(_import_main()[0] for _ in range(RUNS))
+    assert median * 1000 <= cycle.STARTUP_IMPORT_BUDGET_MS
@@ -0,0 +1,71 @@
+import shutil
+import threading
+import time
+
+import pytest
+
+import witty_sheduler
+import wittypi
+
+
+@pytest.fixture
+def wittypi_path():
+    path = witty_sheduler.fake_wittypi_dir()
+    yield path
+    witty_sheduler.close_session()
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def test_session_reads_the_banner(wittypi_path):
+    session = witty_sheduler.WittyPiSession(wittypi_path)
+    try:
+        sys_time, rtc_time = session.read_times()
+        assert sys_time is not None and rtc_time is not None
+        assert session.scheduled_startup() is None
+    finally:
+        session.close()
+    assert not session.alive()
+
+
+def test_session_schedules_and_verifies(wittypi_path):
+    session = witty_sheduler.WittyPiSession(wittypi_path)
+    try:
+        assert session.schedule_startup("19 06:30:00") == "19 06:30:00"
+        session.sync()
+        assert session.scheduled_startup() == "19 06:30:00"
+    finally:
+        session.close()
+
+
+def test_schedule_deep_sleep_through_one_session(wittypi_path):
+    ok, error = witty_sheduler.schedule_deep_sleep("19 06:30:00", wittypi_path, max_attempts=1,
+                                                   driver=witty_sheduler.DRIVER_SCRIPT)
+    assert ok, error
+    assert witty_sheduler.read_scheduled_startup(wittypi_path) == "19 06:30:00"
+
+
+def test_session_error_when_the_script_exits(tmp_path):
+    (tmp_path / "wittyPi.sh").write_text("exit 0\n")
+    with pytest.raises(witty_sheduler.WittyPiSessionError):
+        witty_sheduler.WittyPiSession(str(tmp_path))
+
+
+def test_native_driver_is_opened_once_across_threads(monkeypatch):
+    opened = []
+    driver_cls = wittypi.WittyPi
+
+    def slow_open():
+        time.sleep(0.05)
+        opened.append(1)
+        return driver_cls(wittypi.FakeBus())
+
+    monkeypatch.setattr(witty_sheduler.wittypi, "WittyPi", slow_open)
+    monkeypatch.setattr(witty_sheduler, "_native_driver", None)
+    drivers = []
+    threads = [threading.Thread(target=lambda: drivers.append(witty_sheduler._native())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 1
+    assert all(driver is drivers[0] for driver in drivers)
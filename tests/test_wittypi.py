@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timezone
+
+import wittypi
+
+
+def test_rtc_round_trip():
+    bus = wittypi.FakeBus()
+    driver = wittypi.WittyPi(bus)
+    when = datetime(2026, 10, 18, 21, 7, 45, tzinfo=timezone.utc)
+    driver.write_rtc(when)
+    assert driver.read_rtc() == when
+    assert bus.writes == 1
+
+
+def test_rtc_takes_local_time_and_keeps_utc():
+    driver = wittypi.WittyPi(wittypi.FakeBus())
+    when = datetime(2026, 10, 18, 21, 7, 45).astimezone()
+    driver.write_rtc(when)
+    assert driver.read_rtc() == when
+    assert driver.read_rtc().tzinfo == timezone.utc
+
+
+def test_startup_round_trip():
+    driver = wittypi.WittyPi(wittypi.FakeBus())
+    now = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+    assert driver.read_startup(now) is None
+    driver.set_startup("19 06:30:00", now)
+    assert driver.read_startup(now) == "19 06:30:00"
+
+
+def test_startup_past_day_rolls_to_next_month():
+    driver = wittypi.WittyPi(wittypi.FakeBus())
+    now = datetime(2026, 10, 18, 12, 0).astimezone()
+    driver.set_startup("05 06:30:00", now)
+    assert driver.read_startup(now) == "05 06:30:00"
+
+
+def test_input_voltage():
+    bus = wittypi.FakeBus()
+    bus.write(wittypi.MCU_ADDRESS, wittypi.MCU_VOLTAGE_IN, bytes([5, 12]))
+    assert wittypi.WittyPi(bus).read_input_voltage() == 5.12
+
+
+def test_startup_across_dst_change(monkeypatch):
+    monkeypatch.setenv("TZ", "Europe/Prague")
+    time.tzset()
+    try:
+        driver = wittypi.WittyPi(wittypi.FakeBus())
+        # The night of 24-25 October 2026 falls back from CEST to CET.
+        now = datetime(2026, 10, 24, 18, 0, tzinfo=timezone.utc)
+        driver.set_startup("25 06:30:00", now)
+        assert driver.read_startup(now) == "25 06:30:00"
+        second, minute, hour, day = driver.bus.read(wittypi.MCU_ADDRESS, wittypi.MCU_ALARM1_SECOND, 4)
+        assert (day, hour, minute) == (0x25, 0x05, 0x30)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
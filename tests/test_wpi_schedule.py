@@ -0,0 +1,67 @@
+import re
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import wpi_schedule
+from utils import MIN_STARTUP_MARGIN_SECONDS
+
+WINDOW = (timedelta(hours=6), timedelta(hours=20))
+
+
+def _seconds(duration):
+    sizes = {"D": 86400, "H": 3600, "M": 60, "S": 1}
+    return sum(sizes[token[0]] * int(token[1:]) for token in duration.split())
+
+
+def test_duration():
+    assert wpi_schedule._duration(330) == "M5 S30"
+    assert wpi_schedule._duration(90061) == "D1 H1 M1 S1"
+    assert wpi_schedule._duration(0) == "S0"
+
+
+def test_slots():
+    wakes = wpi_schedule.slots(WINDOW, 3600)
+    assert wakes[0] == timedelta(hours=6)
+    assert wakes[-1] == timedelta(hours=20)
+    assert len(wakes) == 15
+
+
+def test_slots_rejects_non_positive_interval():
+    with pytest.raises(ValueError):
+        wpi_schedule.slots(WINDOW, 0)
+
+
+def test_generate_repeats_every_day():
+    text = wpi_schedule.generate(WINDOW, 3600, date(2026, 10, 18))
+    lines = text.splitlines()
+    assert lines[1] == "BEGIN\t2026-10-18 06:00:00"
+    assert lines[2] == f"END\t{wpi_schedule.END}"
+    states = [line.split("\t") for line in lines[3:]]
+    assert [s[0] for s in states] == ["ON", "OFF"] * 15
+    assert all(s[2] == "WAIT" for s in states if s[0] == "ON")
+    assert sum(_seconds(s[1]) for s in states) == 86400
+    # Each slot is ON until OFF_SECONDS before the next wake...
+    assert states[0][1] == wpi_schedule._duration(3600 - wpi_schedule.OFF_SECONDS)
+    # The last one sleeps through the night, until tomorrow's first wake.
+    assert _seconds(states[-1][1]) == 10 * 3600 - (3600 - wpi_schedule.OFF_SECONDS)
+
+
+def test_generate_short_interval_keeps_half_on():
+    text = wpi_schedule.generate(WINDOW, 60, date(2026, 10, 18))
+    on = re.findall(r"^ON\t(.*)\tWAIT$", text, re.MULTILINE)
+    assert on[0] == "S30"
+
+
+def test_next_slot():
+    when = datetime(2026, 10, 18, 6, 30)
+    assert wpi_schedule.next_slot(when, WINDOW, 3600) == datetime(2026, 10, 18, 7, 0)
+    assert wpi_schedule.next_slot(datetime(2026, 10, 18, 7, 0), WINDOW, 3600) == datetime(2026, 10, 18, 8, 0)
+    late = datetime(2026, 10, 18, 21, 0)
+    assert wpi_schedule.next_slot(late, WINDOW, 3600) == datetime(2026, 10, 19, 6, 0)
+
+
+def test_daily_schedule_clamps_interval():
+    schedule = wpi_schedule.DailySchedule(WINDOW, 0)
+    assert schedule.interval == MIN_STARTUP_MARGIN_SECONDS
+    assert wpi_schedule.slots(schedule.window, schedule.interval)